@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+    runs the modules of this role against a simulated occ (fake_occ.py)
+    and reports wall time, occ calls, php processes and peak RSS.
+
+    every scenario runs in its own process with a fresh Nextcloud tree and
+    executes the module twice: 'first' converges the instance, 'repeat'
+    is the idempotent run which follows in every later playbook run.
+
+    requirements: ansible-core and the bodsch.core collection
+    (ansible-galaxy collection install -r collections.yml)
+"""
+
+import os
+import sys
+import io
+import grp
+import pwd
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import importlib.util
+import subprocess
+import contextlib
+
+BASE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+ROLE_DIRECTORY = os.path.dirname(BASE_DIRECTORY)
+FAKE_OCC = os.path.join(BASE_DIRECTORY, "fake_occ.py")
+
+MODULES = ["users", "groups", "apps", "update_apps", "config"]
+SIZES = [10, 1000, 10000]
+
+CONFIG_PHP = """<?php
+$CONFIG = array (
+  'instanceid' => 'ocbenchmark',
+  'passwordsalt' => 'benchmark',
+  'secret' => 'benchmark',
+  'trusted_domains' =>
+  array (
+    0 => 'localhost',
+  ),
+  'datadirectory' => '{data_directory}',
+  'dbtype' => 'sqlite3',
+  'version' => '29.0.7.1',
+  'overwrite.cli.url' => 'http://localhost',
+  'installed' => true,
+  // octal, like a hand-edited config.php
+  'logfilemode' => 0640,
+  // the simulated 'occ update:check' is used instead of apps.nextcloud.com
+  'appstoreenabled' => false,
+);
+"""
+
+# values of CONFIG_PHP, which config.php parser has to read without PHP
+CONFIG_PHP_VALUES = dict(
+    logfilemode=0o640,
+    appstoreenabled=False,
+    version="29.0.7.1",
+)
+
+VERSION_PHP = """<?php
+$OC_Version = array(29,0,7,1);
+$OC_VersionString = '29.0.7';
+$OC_Edition = '';
+$OC_Channel = 'stable';
+$vendor = 'nextcloud';
+"""
+
+SUDO_SHIM = """#!/bin/sh
+# sudo --preserve-env --user <owner> php <script> <args>
+while [ $# -gt 0 ] && [ "$1" != "php" ]; do shift; done
+shift
+exec "{python}" "{fake_occ}" "$@"
+"""
+
+
+def parse_arguments():
+    """
+    """
+    parser = argparse.ArgumentParser(description="benchmark the nextcloud modules against a simulated occ")
+
+    parser.add_argument("--modules", default=",".join(MODULES), help="comma separated list of modules")
+    parser.add_argument("--sizes", default=",".join(str(x) for x in SIZES), help="comma separated list of entity counts")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per php process (bootstrap)")
+    parser.add_argument("--command-latency", type=float, default=0.005, help="seconds per occ command")
+    parser.add_argument("--download-latency", type=float, default=0.5, help="seconds per app store download")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel app updates (nextcloud_update_apps)")
+    parser.add_argument("--worker", action="store_true", help="deploy the persistent occ worker")
+    parser.add_argument("--timeout", type=int, default=600, help="seconds per scenario")
+    parser.add_argument("--output", help="write all results as json to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directories")
+    parser.add_argument("--child", nargs=2, metavar=("MODULE", "SIZE"), help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+
+# -----------------------------------------------------------------------------
+# scenarios
+
+def scenario_users(size, server_root):
+    """
+        90% of the users exist, all of them are members of 'staff'
+    """
+    existing = size - size // 10
+    names = [f"user{i:05d}" for i in range(size)]
+
+    users = {"admin": dict(display_name="admin", password="admin", settings={})}
+    users.update({
+        x: dict(display_name=f"User {x}", password="secret", settings={})
+        for x in names[:existing]
+    })
+
+    groups = dict(
+        admin=dict(display_name="admin", members=["admin"]),
+        staff=dict(display_name="staff", members=names[:existing])
+    )
+
+    params = dict(
+        users=[
+            dict(name=x, password="secret", display_name=f"User {x}", groups=["staff"])
+            for x in names
+        ]
+    )
+
+    return dict(users=users, groups=groups), params
+
+
+def scenario_groups(size, server_root):
+    """
+        90% of the groups exist
+    """
+    existing = size - size // 10
+    names = [f"group{i:05d}" for i in range(size)]
+
+    groups = dict(admin=dict(display_name="admin", members=["admin"]))
+    groups.update({x: dict(display_name=x, members=[]) for x in names[:existing]})
+
+    params = dict(
+        groups=[dict(name=x, display_name=x) for x in names]
+    )
+
+    return dict(groups=groups), params
+
+
+def scenario_apps(size, server_root):
+    """
+        90% of the apps are installed and enabled
+    """
+    existing = size - size // 10
+    names = [f"app{i:05d}" for i in range(size)]
+
+    apps = {x: dict(version="1.0.0", enabled=True, settings={}) for x in names[:existing]}
+
+    params = dict(
+        apps=[dict(name=x, state="enabled") for x in names]
+    )
+
+    return dict(apps=apps), params
+
+
+def scenario_update_apps(size, server_root, concurrency=1):
+    """
+        10% of the installed apps have an update
+    """
+    names = [f"app{i:05d}" for i in range(size)]
+
+    apps = {x: dict(version="1.0.0", enabled=True, settings={}) for x in names}
+    updates = {x: "1.1.0" for x in names[:max(1, size // 10)]}
+
+    params = dict(
+        state="update",
+        concurrency=concurrency
+    )
+
+    return dict(apps=apps, updates=updates), params
+
+
+def scenario_config(size, server_root):
+    """
+        role defaults with 'size' trusted domains
+    """
+    import yaml
+
+    base_directory = os.path.dirname(os.path.dirname(server_root))
+
+    with open(os.path.join(ROLE_DIRECTORY, "vars", "main.yml")) as f:
+        defaults = yaml.safe_load(f).get("nextcloud_defaults_defaults")
+
+    defaults = json.loads(
+        json.dumps(defaults).replace("{{ nextcloud_install_base_directory }}", base_directory)
+    )
+
+    params = dict(
+        group=grp.getgrgid(os.getgid()).gr_name,
+        diff_output=False,
+        config_parameters=defaults,
+        trusted_domains=[f"host{i:05d}.example.com" for i in range(size)],
+        database=dict(type="sqlite")
+    )
+
+    return dict(), params
+
+
+# -----------------------------------------------------------------------------
+# child: one scenario
+
+def create_installation(directory, state, worker):
+    """
+    """
+    server_root = os.path.join(directory, "nextcloud", "server")
+    data_directory = os.path.join(directory, "nextcloud", "data")
+    bin_directory = os.path.join(directory, "bin")
+
+    for d in [os.path.join(server_root, "config"), os.path.join(server_root, "apps"), data_directory, bin_directory]:
+        os.makedirs(d)
+
+    with open(os.path.join(server_root, "occ"), "w") as f:
+        f.write("<?php\n")
+
+    with open(os.path.join(server_root, "config", "config.php"), "w") as f:
+        f.write(CONFIG_PHP.format(data_directory=data_directory))
+
+    with open(os.path.join(server_root, "version.php"), "w") as f:
+        f.write(VERSION_PHP)
+
+    if worker:
+        shutil.copyfile(
+            os.path.join(ROLE_DIRECTORY, "files", "occ_worker.php"),
+            os.path.join(directory, "nextcloud", "occ_worker.php"))
+
+    sudo = os.path.join(bin_directory, "sudo")
+
+    with open(sudo, "w") as f:
+        f.write(SUDO_SHIM.format(python=sys.executable, fake_occ=FAKE_OCC))
+
+    os.chmod(sudo, 0o755)
+
+    state.setdefault("installed", True)
+    state.setdefault("users", {"admin": dict(display_name="admin", password="admin", settings={})})
+    state.setdefault("groups", {"admin": dict(display_name="admin", members=["admin"])})
+    state.setdefault("apps", {})
+    state["server_root"] = server_root
+
+    with open(os.path.join(directory, "state.json"), "w") as f:
+        json.dump(state, f)
+
+    return server_root, bin_directory
+
+
+def prepare_imports(cache_directory):
+    """
+        make the role module_utils and the installed collections importable
+        the same way ansible does it for the role.
+    """
+    import ansible.module_utils
+
+    ansible.module_utils.__path__.append(os.path.join(ROLE_DIRECTORY, "module_utils"))
+
+    collection_paths = os.environ.get("ANSIBLE_COLLECTIONS_PATH", os.environ.get("ANSIBLE_COLLECTIONS_PATHS", ""))
+    collection_paths = [x for x in collection_paths.split(os.pathsep) if x]
+    collection_paths += [
+        os.path.expanduser("~/.ansible/collections"),
+        "/usr/share/ansible/collections",
+    ]
+
+    for path in collection_paths:
+        if os.path.isdir(os.path.join(path, "ansible_collections")) and path not in sys.path:
+            sys.path.append(path)
+
+    from ansible.module_utils.nextcloud_state_cache import StateCache
+    from ansible.module_utils.nextcloud_password_store import PasswordStore
+    from ansible.module_utils.nextcloud_app_store import AppStore
+
+    StateCache.cache_directory = cache_directory
+    PasswordStore.cache_directory = cache_directory
+    AppStore.cache_directory = cache_directory
+
+
+def check_config_parser(server_root):
+    """
+        the modules read config.php without PHP, a wrong value would falsify
+        every scenario
+    """
+    from ansible.module_utils.nextcloud_php_config import NextcloudPhpConfig
+
+    config = NextcloudPhpConfig(server_root).system_config() or dict()
+    wrong = {k: config.get(k) for k, v in CONFIG_PHP_VALUES.items() if config.get(k) != v}
+
+    if wrong:
+        raise SystemExit(f"config.php parser: unexpected values {wrong}")
+
+
+def run_module(module_name, params, calls_file):
+    """
+        execute the module in this process, like ansible does with AnsiballZ
+    """
+    from ansible.module_utils import basic
+    from ansible.module_utils.common.text.converters import to_bytes
+
+    basic._ANSIBLE_ARGS = to_bytes(json.dumps(dict(ANSIBLE_MODULE_ARGS=params)))
+
+    if hasattr(basic, "_ANSIBLE_PROFILE"):
+        # ansible-core >= 2.19 refuses to parse the arguments without a serialization profile
+        basic._ANSIBLE_PROFILE = "legacy"
+
+    spec = importlib.util.spec_from_file_location(
+        module_name, os.path.join(ROLE_DIRECTORY, "library", f"{module_name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    open(calls_file, "w").close()
+    output = io.StringIO()
+    cwd = os.getcwd()
+
+    start = time.monotonic()
+
+    with contextlib.redirect_stdout(output):
+        try:
+            module.main()
+        except SystemExit:
+            pass
+
+    duration = time.monotonic() - start
+    os.chdir(cwd)
+
+    try:
+        result = json.loads(output.getvalue().strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        result = dict(failed=True, msg=output.getvalue()[-500:])
+
+    with open(calls_file) as f:
+        calls = [x.strip() for x in f]
+
+    commands = dict()
+
+    for call in calls:
+        if call != "#boot":
+            commands[call] = commands.get(call, 0) + 1
+
+    return dict(
+        time=round(duration, 3),
+        occ_calls=sum(commands.values()),
+        php_processes=calls.count("#boot"),
+        commands=commands,
+        changed=result.get("changed", False),
+        failed=bool(result.get("failed", False)),
+        msg=result.get("msg", "") if result.get("failed") else "",
+    )
+
+
+def child(args):
+    """
+    """
+    module, size = args.child
+    size = int(size)
+    module_name = f"nextcloud_{module}"
+
+    directory = tempfile.mkdtemp(prefix=f"nc-benchmark.{module}.{size}.")
+
+    try:
+        scenario = globals()[f"scenario_{module}"]
+        server_directory = os.path.join(directory, "nextcloud", "server")
+
+        if module == "update_apps":
+            state, params = scenario(size, server_directory, concurrency=args.concurrency)
+        else:
+            state, params = scenario(size, server_directory)
+        server_root, bin_directory = create_installation(directory, state, args.worker)
+
+        calls_file = os.path.join(directory, "calls.log")
+
+        os.environ["PATH"] = f"{bin_directory}{os.pathsep}{os.environ.get('PATH', '')}"
+        os.environ["FAKE_OCC_STATE"] = os.path.join(directory, "state.json")
+        os.environ["FAKE_OCC_CALLS"] = calls_file
+        os.environ["FAKE_OCC_LATENCY"] = str(args.latency)
+        os.environ["FAKE_OCC_COMMAND_LATENCY"] = str(args.command_latency)
+        os.environ["FAKE_OCC_DOWNLOAD_LATENCY"] = str(args.download_latency)
+
+        prepare_imports(os.path.join(directory, "cache"))
+        check_config_parser(server_root)
+
+        params.update(
+            working_dir=server_root,
+            owner=pwd.getpwuid(os.getuid()).pw_name,
+        )
+
+        runs = dict()
+
+        for run in ["first", "repeat"]:
+            runs[run] = run_module(module_name, params, calls_file)
+
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        print(json.dumps(dict(module=module, size=size, runs=runs, peak_rss_mb=round(peak_rss / 1024, 1))))
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+# -----------------------------------------------------------------------------
+# parent: all scenarios
+
+def run_scenario(args, module, size):
+    """
+    """
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        "--child", module, str(size),
+        "--latency", str(args.latency),
+        "--command-latency", str(args.command_latency),
+        "--download-latency", str(args.download_latency),
+        "--concurrency", str(args.concurrency),
+    ]
+
+    if args.worker:
+        command.append("--worker")
+    if args.keep:
+        command.append("--keep")
+
+    try:
+        process = subprocess.run(command, capture_output=True, universal_newlines=True, timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        return dict(module=module, size=size, error=f"timeout after {args.timeout}s")
+
+    try:
+        return json.loads(process.stdout.strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        return dict(module=module, size=size, error=(process.stderr.strip().splitlines() or ["no output"])[-1])
+
+
+def print_result(result):
+    """
+    """
+    if "error" in result:
+        print(f"{result['module']:<12} {result['size']:>6}  {'':<7} {result['error']}", flush=True)
+        return
+
+    for run, data in result.get("runs", {}).items():
+        state = "failed" if data.get("failed") else ("changed" if data.get("changed") else "ok")
+
+        print(
+            f"{result['module']:<12} {result['size']:>6}  {run:<7}"
+            f" {data['time']:>9.2f} {data['occ_calls']:>9} {data['php_processes']:>9}"
+            f" {result['peak_rss_mb']:>9.1f}  {state}",
+            flush=True
+        )
+
+
+def main():
+    """
+    """
+    args = parse_arguments()
+
+    if args.child:
+        child(args)
+        return 0
+
+    modules = [x.strip() for x in args.modules.split(",") if x.strip()]
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+
+    unknown = [x for x in modules if x not in MODULES]
+
+    if unknown:
+        print(f"unknown modules: {', '.join(unknown)}")
+        return 1
+
+    print(f"latency: {args.latency}s per php process, {args.command_latency}s per command, {args.download_latency}s per download, worker: {args.worker}")
+    print("")
+    print(f"{'module':<12} {'size':>6}  {'run':<7} {'time [s]':>9} {'occ calls':>9} {'php procs':>9} {'rss [MB]':>9}  state")
+
+    results = []
+
+    for module in modules:
+        for size in sizes:
+            result = run_scenario(args, module, size)
+            results.append(result)
+            print_result(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                dict(
+                    latency=args.latency,
+                    command_latency=args.command_latency,
+                    download_latency=args.download_latency,
+                    concurrency=args.concurrency,
+                    worker=args.worker,
+                    results=results
+                ), f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+    stand-in for 'php occ' and 'php occ_worker.php'
+
+    the state of the simulated Nextcloud lives in a json file.
+
+    environment:
+      FAKE_OCC_STATE             path of the state file
+      FAKE_OCC_CALLS             every command is appended to this file
+      FAKE_OCC_LATENCY           seconds to sleep per php process (bootstrap)
+      FAKE_OCC_COMMAND_LATENCY   seconds to sleep per command
+      FAKE_OCC_DOWNLOAD_LATENCY  seconds to sleep per app store download
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+
+STATE = os.environ.get("FAKE_OCC_STATE", "state.json")
+CALLS = os.environ.get("FAKE_OCC_CALLS")
+LATENCY = float(os.environ.get("FAKE_OCC_LATENCY", "0"))
+COMMAND_LATENCY = float(os.environ.get("FAKE_OCC_COMMAND_LATENCY", "0"))
+DOWNLOAD_LATENCY = float(os.environ.get("FAKE_OCC_DOWNLOAD_LATENCY", "0"))
+
+# options which are followed by a value
+VALUE_OPTIONS = [
+    "--output",
+    "--display-name",
+    "--group",
+    "-g",
+    "--groups",
+    "--value",
+    "--type",
+    "--limit",
+    "--offset",
+    "--default-value",
+    "--data-dir",
+    "--database",
+    "--database-host",
+    "--database-port",
+    "--database-name",
+    "--database-user",
+    "--database-pass",
+    "--admin-user",
+    "--admin-pass",
+]
+
+
+class OccError(Exception):
+    def __init__(self, rc, out="", err=""):
+        self.rc = rc
+        self.out = out
+        self.err = err
+
+
+def parse(args):
+    """
+        returns (positional arguments, options)
+        options is a dictionary with a list of values per option
+    """
+    positional = []
+    options = dict()
+    values = iter(args)
+
+    for arg in values:
+        if arg.startswith("-"):
+            name, separator, value = arg.partition("=")
+
+            if not separator and name in VALUE_OPTIONS:
+                value = next(values, "")
+
+            options.setdefault(name, []).append(value if (separator or name in VALUE_OPTIONS) else True)
+        else:
+            positional.append(arg)
+
+    return positional, options
+
+
+def option(options, *names, default=None):
+    """
+    """
+    for name in names:
+        if name in options:
+            return options[name][-1]
+
+    return default
+
+
+def dumps(data, options):
+    """
+    """
+    if option(options, "--output") == "json_pretty":
+        return json.dumps(data, indent=4) + "\n"
+
+    return json.dumps(data) + "\n"
+
+
+def paginate(data, options):
+    """
+        user:list and group:list return 500 entries by default
+    """
+    limit = int(option(options, "--limit", "-l", default=500))
+    offset = int(option(options, "--offset", "-o", default=0))
+
+    keys = sorted(data.keys())[offset:offset + limit]
+
+    return {k: data[k] for k in keys}
+
+
+def user_groups(state, uid):
+    """
+    """
+    return sorted(g for g, d in state["groups"].items() if uid in d["members"])
+
+
+def user_info(state, uid):
+    """
+    """
+    user = state["users"][uid]
+
+    return {
+        "user_id": uid,
+        "display_name": user.get("display_name", uid),
+        "email": user.get("email"),
+        "cloud_id": f"{uid}@localhost",
+        "enabled": user.get("enabled", True),
+        "groups": user_groups(state, uid),
+        "quota": "none",
+        "storage": {"free": 1073741824, "used": 0, "total": 1073741824, "relative": 0, "quota": -3},
+        "first_seen": "2024-01-01T00:00:00+00:00",
+        "last_seen": "1970-01-01T00:00:00+00:00",
+        "user_directory": f"/var/www/nc_data/{uid}",
+        "backend": "Database",
+    }
+
+
+def require_installed(state):
+    """
+    """
+    if not state.get("installed", True):
+        raise OccError(1, "", "Nextcloud is not installed - only a limited number of commands are available\n")
+
+
+def dispatch(state, args, env):
+    """
+        returns (rc, out, err, changed)
+    """
+    command = args[0] if args else "list"
+    pos, options = parse(args[1:])
+
+    if command == "check":
+        if not state.get("installed", True):
+            return 0, "", "Nextcloud is not installed - only a limited number of commands are available\n", False
+        return 0, "[]\n" if option(options, "--output") else "", "", False
+
+    if command == "status":
+        return 0, dumps({
+            "installed": state.get("installed", True),
+            "version": state.get("version", "29.0.7.1"),
+            "versionstring": state.get("versionstring", "29.0.7"),
+            "edition": "",
+            "maintenance": False,
+            "needsDbUpgrade": False,
+            "productname": "Nextcloud",
+            "extendedSupport": False
+        }, options), "", False
+
+    if command == "maintenance:install":
+        if state.get("installed", True):
+            raise OccError(1, "Command \"maintenance:install\" is not defined.\n")
+        state["installed"] = True
+        return 0, "Nextcloud was successfully installed\n", "", True
+
+    require_installed(state)
+
+    users = state["users"]
+    groups = state["groups"]
+    apps = state["apps"]
+
+    if command == "user:list":
+        if option(options, "--info", "-i"):
+            data = {uid: user_info(state, uid) for uid in paginate(users, options)}
+        else:
+            data = {uid: d.get("display_name", uid) for uid, d in paginate(users, options).items()}
+        return 0, dumps(data, options), "", False
+
+    if command == "user:info":
+        uid = pos[0]
+        if uid not in users:
+            raise OccError(1, "user not found\n")
+        return 0, dumps(user_info(state, uid), options), "", False
+
+    if command == "user:add":
+        uid = pos[0]
+        if uid in users:
+            raise OccError(1, f"The user \"{uid}\" already exists.\n")
+        users[uid] = {
+            "display_name": option(options, "--display-name", default=uid),
+            "password": env.get("OC_PASS"),
+            "enabled": True,
+            "settings": {}
+        }
+        out = f"The user \"{uid}\" was created successfully\n"
+        for gid in options.get("--group", []) + options.get("-g", []):
+            if gid not in groups:
+                groups[gid] = {"display_name": gid, "members": []}
+                out += f"Created group \"{gid}\"\n"
+            groups[gid]["members"].append(uid)
+            out += f"User \"{uid}\" added to group \"{gid}\"\n"
+        return 0, out, "", True
+
+    if command == "user:delete":
+        uid = pos[0]
+        if uid not in users:
+            raise OccError(1, "User does not exist\n")
+        del users[uid]
+        for group in groups.values():
+            if uid in group["members"]:
+                group["members"].remove(uid)
+        return 0, "User was deleted\n", "", True
+
+    if command == "user:resetpassword":
+        uid = pos[0]
+        if uid not in users:
+            raise OccError(1, "User does not exist\n")
+        users[uid]["password"] = env.get("OC_PASS")
+        return 0, f"Successfully reset password for {uid}\n", "", True
+
+    if command in ["user:enable", "user:disable"]:
+        uid = pos[0]
+        if uid not in users:
+            raise OccError(1, "User does not exist\n")
+        users[uid]["enabled"] = command == "user:enable"
+        return 0, f"The specified user is {command.split(':')[1]}d\n", "", True
+
+    if command == "user:setting":
+        uid = pos[0]
+        if uid not in users:
+            raise OccError(1, "", "The user does not exist\n")
+        settings = users[uid].setdefault("settings", {})
+        if option(options, "--delete"):
+            settings.get(pos[1], {}).pop(pos[2], None)
+            return 0, "", "", True
+        if len(pos) == 4:
+            settings.setdefault(pos[1], {})[pos[2]] = pos[3]
+            return 0, "", "", True
+        if len(pos) == 3:
+            value = settings.get(pos[1], {}).get(pos[2])
+            if value is None:
+                raise OccError(1, "", "The setting does not exist for user\n")
+            return 0, f"{value}\n", "", False
+        if len(pos) == 2:
+            return 0, dumps({pos[1]: settings.get(pos[1], {})}, options), "", False
+        return 0, dumps(settings, options), "", False
+
+    if command == "group:list":
+        if option(options, "--info", "-i"):
+            data = {
+                gid: {"displayName": d.get("display_name", gid), "backends": ["Database"], "users": d["members"]}
+                for gid, d in paginate(groups, options).items()
+            }
+        else:
+            data = {gid: d["members"] for gid, d in paginate(groups, options).items()}
+        return 0, dumps(data, options), "", False
+
+    if command == "group:add":
+        gid = pos[0]
+        if gid in groups:
+            raise OccError(1, f"Group \"{gid}\" already exists.\n")
+        groups[gid] = {"display_name": option(options, "--display-name", default=gid), "members": []}
+        return 0, f"Created group \"{gid}\"\n", "", True
+
+    if command == "group:delete":
+        gid = pos[0]
+        if gid not in groups:
+            raise OccError(1, "Group not found\n")
+        del groups[gid]
+        return 0, "", "", True
+
+    if command in ["group:adduser", "group:removeuser"]:
+        gid, uid = pos[0], pos[1]
+        if gid not in groups:
+            raise OccError(1, "group not found\n")
+        if uid not in users:
+            raise OccError(1, "user not found\n")
+        members = groups[gid]["members"]
+        if command == "group:adduser" and uid not in members:
+            members.append(uid)
+        if command == "group:removeuser" and uid in members:
+            members.remove(uid)
+        return 0, "", "", True
+
+    if command == "app:list":
+        data = {
+            "enabled": {a: d["version"] for a, d in sorted(apps.items()) if d.get("enabled")},
+            "disabled": {a: d["version"] for a, d in sorted(apps.items()) if not d.get("enabled")},
+        }
+        return 0, dumps(data, options), "", False
+
+    if command == "app:getpath":
+        app = pos[0]
+        if app not in apps:
+            return 1, "", "", False
+        return 0, f"{state.get('server_root', '/var/www/nextcloud/server')}/apps/{app}\n", "", False
+
+    if command == "app:install":
+        app = pos[0]
+        if app in apps:
+            raise OccError(1, f"{app} already installed\n")
+        apps[app] = {"version": "1.0.0", "enabled": not option(options, "--keep-disabled"), "settings": {}}
+        return 0, f"{app} 1.0.0 installed\n", "", True
+
+    if command == "app:enable":
+        out = ""
+        for app in pos:
+            if app not in apps:
+                apps[app] = {"version": "1.0.0", "enabled": False, "settings": {}}
+                out += f"{app} 1.0.0 installed\n"
+            apps[app]["enabled"] = True
+            out += f"{app} 1.0.0 enabled\n"
+        return 0, out, "", True
+
+    if command == "app:disable":
+        out = ""
+        for app in pos:
+            if apps.get(app, {}).get("enabled"):
+                apps[app]["enabled"] = False
+                out += f"{app} 1.0.0 disabled\n"
+            else:
+                out += f"No such app enabled: {app}\n"
+        return 0, out, "", True
+
+    if command == "app:remove":
+        app = pos[0]
+        if app not in apps:
+            raise OccError(1, f"{app} is not installed\n")
+        del apps[app]
+        return 0, f"{app} removed\n", "", True
+
+    if command == "app:update":
+        updates = state.setdefault("updates", {})
+        names = list(updates.keys()) if option(options, "--all") else pos
+        out = ""
+        for app in names:
+            if app in updates:
+                apps[app]["version"] = updates.pop(app)
+                out += f"{app} updated\n"
+        return 0, out, "", bool(out)
+
+    # actions of the occ worker without an occ command
+    if command == "group:displayname":
+        gid = pos[0]
+        if gid not in groups:
+            raise OccError(1, "", f"Group not found: {gid}")
+        groups[gid]["display_name"] = pos[1]
+        return 0, f"Display name of group {gid} set to {pos[1]}\n", "", True
+
+    # the two steps of an update through the occ worker
+    if command == "app:download":
+        app = pos[0]
+        version = state.setdefault("updates", {}).get(app)
+        if not version:
+            raise OccError(1, "", f"No update available for {app}")
+        state.setdefault("downloaded", {})[app] = version
+        return 0, f"{app} {version} downloaded\n", "", True
+
+    if command == "app:upgrade":
+        app = pos[0]
+        version = state.setdefault("downloaded", {}).pop(app, None)
+        if not version:
+            raise OccError(1, "", f"{app} couldn't be updated")
+        apps[app]["version"] = version
+        state.setdefault("updates", {}).pop(app, None)
+        return 0, f"{app} updated to {version}\n", "", True
+
+    if command == "update:check":
+        out = "".join(
+            f"Update for {app} to version {version} is available.\n"
+            for app, version in sorted(state.get("updates", {}).items())
+        )
+        return 0, out or "Everything up to date\n", "", False
+
+    if command == "config:list":
+        section = pos[0] if pos else "all"
+        data = dict()
+        if section in ["system", "all"]:
+            data["system"] = state.get("system", {})
+        if section != "system":
+            data["apps"] = {a: d.get("settings", {}) for a, d in apps.items() if section in ["all", a]}
+        return 0, json.dumps(data, indent=4) + "\n", "", False
+
+    if command == "config:import":
+        if pos:
+            with open(pos[0]) as f:
+                document = json.load(f)
+        else:
+            document = json.load(sys.stdin)
+        state.setdefault("system", {}).update(document.get("system", {}))
+        for app, values in document.get("apps", {}).items():
+            apps.setdefault(app, {"version": "1.0.0", "enabled": False, "settings": {}}).setdefault("settings", {}).update(values)
+        return 0, f"Config successfully imported from: {pos[0] if pos else 'stdin'}\n", "", True
+
+    if command == "config:system:get":
+        value = state.get("system", {}).get(pos[0])
+        if value is None:
+            return 1, "", "", False
+        return 0, f"{value}\n", "", False
+
+    if command == "config:system:set":
+        state.setdefault("system", {})[pos[0]] = option(options, "--value")
+        return 0, f"System config value {pos[0]} set to string {option(options, '--value')}\n", "", True
+
+    if command == "config:system:delete":
+        state.setdefault("system", {}).pop(pos[0], None)
+        return 0, f"System config value {pos[0]} deleted\n", "", True
+
+    if command == "config:app:get":
+        value = apps.get(pos[0], {}).get("settings", {}).get(pos[1])
+        if value is None:
+            return 1, "", "", False
+        return 0, f"{value}\n", "", False
+
+    if command == "config:app:set":
+        app, key = pos[0], pos[1]
+        value = option(options, "--value")
+        apps.setdefault(app, {"version": "1.0.0", "enabled": False, "settings": {}}).setdefault("settings", {})[key] = value
+        return 0, f"Config value '{key}' for app '{app}' is now set to '{value}'\n", "", True
+
+    if command == "config:app:delete":
+        apps.get(pos[0], {}).get("settings", {}).pop(pos[1], None)
+        return 0, f"Config value '{pos[1]}' of app '{pos[0]}' deleted\n", "", True
+
+    if command.startswith("background:"):
+        return 0, f"Set mode for background jobs to '{command.split(':')[1]}'\n", "", True
+
+    if command == "upgrade":
+        return 0, "Nextcloud is already latest version\n", "", False
+
+    raise OccError(1, f"Command \"{command}\" is not defined.\n")
+
+
+def downloads(args):
+    """
+        apps which an update command has to fetch from the app store
+    """
+    pos, options = parse(args[1:])
+
+    with open(STATE) as f:
+        updates = json.load(f).get("updates", {})
+
+    if option(options, "--all"):
+        return list(updates.keys())
+
+    return [x for x in pos if x in updates]
+
+
+def execute(args, env):
+    """
+    """
+    if COMMAND_LATENCY:
+        time.sleep(COMMAND_LATENCY)
+
+    if DOWNLOAD_LATENCY and args and args[0] in ["app:download", "app:update"]:
+        time.sleep(DOWNLOAD_LATENCY * len(downloads(args)))
+
+    # several workers may run in parallel
+    with open(f"{STATE}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        with open(STATE) as f:
+            state = json.load(f)
+
+        try:
+            rc, out, err, changed = dispatch(state, args, env)
+        except OccError as e:
+            rc, out, err, changed = e.rc, e.out, e.err, False
+
+        if changed:
+            with open(f"{STATE}.{os.getpid()}", "w") as f:
+                json.dump(state, f)
+            os.replace(f"{STATE}.{os.getpid()}", STATE)
+
+    if CALLS:
+        with open(CALLS, "a") as f:
+            f.write(f"{args[0] if args else 'list'}\n")
+
+    return rc, out, err
+
+
+def main():
+    """
+    """
+    if LATENCY:
+        time.sleep(LATENCY)
+
+    if CALLS:
+        with open(CALLS, "a") as f:
+            f.write("#boot\n")
+
+    # php occ_worker.php <server root>
+    if len(sys.argv) > 1 and sys.argv[1].endswith("occ_worker.php"):
+        with open(STATE) as f:
+            installed = json.load(f).get("installed", True)
+
+        print(json.dumps(dict(ready=installed, version="29.0.7")), flush=True)
+
+        if not installed:
+            return 1
+
+        for line in sys.stdin:
+            request = json.loads(line)
+            if "action" in request:
+                args = [request.get("action")] + [v for k, v in request.items() if k != "action"]
+            else:
+                args = request.get("args", [])
+            rc, out, err = execute(args, request.get("env", {}))
+            print(json.dumps(dict(rc=rc, stdout=out, stderr=err)), flush=True)
+
+        return 0
+
+    # php occ <args>
+    rc, out, err = execute(sys.argv[2:], os.environ)
+
+    sys.stdout.write(out)
+    sys.stderr.write(err)
+
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+<?php
+/**
+ * (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+ * Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+ * SPDX-License-Identifier: Apache-2.0
+ *
+ * persistent occ dispatcher used by the ansible modules of this role
+ *
+ * boots the Nextcloud console application once and then executes occ
+ * commands which are passed as JSON lines on stdin:
+ *
+ *   {"args": ["user:list", "--output", "json"], "env": {"OC_PASS": "..."}}
+ *
+ * every request is answered with exactly one JSON line on stdout:
+ *
+ *   {"rc": 0, "stdout": "...", "stderr": "..."}
+ *
+ * the app update is additionally available in two steps, so that several
+ * dispatchers can download apps in parallel while the migrations run one
+ * after another:
+ *
+ *   {"action": "app:download", "app": "calendar"}
+ *   {"action": "app:upgrade", "app": "calendar"}
+ *
+ * occ can not change the display name of a group:
+ *
+ *   {"action": "group:displayname", "group": "admin", "display_name": "Administrators"}
+ *
+ * usage:
+ *   sudo --user www-data php occ_worker.php /var/www/nextcloud/server
+ */
+
+use Symfony\Component\Console\Input\ArgvInput;
+use Symfony\Component\Console\Output\BufferedOutput;
+use Symfony\Component\Console\Output\ConsoleOutputInterface;
+use Symfony\Component\Console\Output\ConsoleSectionOutput;
+use Symfony\Component\Console\Output\OutputInterface;
+
+define('OC_CONSOLE', 1);
+
+function worker_reply(array $data): void {
+	fwrite(STDOUT, json_encode($data, JSON_INVALID_UTF8_SUBSTITUTE) . "\n");
+	fflush(STDOUT);
+}
+
+if ($argc < 2 || !is_file($argv[1] . '/lib/base.php')) {
+	worker_reply(['ready' => false, 'error' => 'missing or invalid nextcloud directory']);
+	exit(1);
+}
+
+$serverRoot = rtrim($argv[1], '/');
+chdir($serverRoot);
+
+// the stdout stream belongs to the protocol, everything else is collected
+ob_start();
+
+try {
+	require_once $serverRoot . '/lib/versioncheck.php';
+	require_once $serverRoot . '/lib/base.php';
+} catch (\Throwable $e) {
+	ob_end_clean();
+	worker_reply(['ready' => false, 'error' => $e->getMessage()]);
+	exit(1);
+}
+
+function worker_action(array $request): array {
+	$action = (string)$request['action'];
+
+	if ($action === 'group:displayname') {
+		$groupId = (string)($request['group'] ?? '');
+		$displayName = (string)($request['display_name'] ?? '');
+		$group = \OCP\Server::get(\OCP\IGroupManager::class)->get($groupId);
+
+		if ($group === null) {
+			return ['rc' => 1, 'stdout' => '', 'stderr' => "Group not found: $groupId"];
+		}
+
+		if (!$group->setDisplayName($displayName)) {
+			return ['rc' => 1, 'stdout' => '', 'stderr' => "The backend of group $groupId can not change its display name"];
+		}
+
+		return ['rc' => 0, 'stdout' => "Display name of group $groupId set to $displayName\n", 'stderr' => ''];
+	}
+
+	$appId = (string)($request['app'] ?? '');
+	$installer = \OCP\Server::get(\OC\Installer::class);
+	$appManager = \OCP\Server::get(\OCP\App\IAppManager::class);
+
+	if ($action === 'app:download') {
+		$version = $installer->isUpdateAvailable($appId);
+
+		if ($version === false) {
+			return ['rc' => 1, 'stdout' => '', 'stderr' => "No update available for $appId"];
+		}
+
+		// downloads, verifies and extracts the release into the apps directory
+		$installer->downloadApp($appId);
+
+		return ['rc' => 0, 'stdout' => "$appId $version downloaded\n", 'stderr' => ''];
+	}
+
+	if ($action === 'app:upgrade') {
+		if (method_exists($appManager, 'clearAppsCache')) {
+			$appManager->clearAppsCache();
+		}
+
+		$result = method_exists($appManager, 'upgradeApp')
+			? $appManager->upgradeApp($appId)
+			: \OC_App::updateApp($appId);
+
+		if (!$result) {
+			return ['rc' => 1, 'stdout' => '', 'stderr' => "$appId couldn't be updated"];
+		}
+
+		return ['rc' => 0, 'stdout' => $appId . ' updated to ' . $appManager->getAppVersion($appId, false) . "\n", 'stderr' => ''];
+	}
+
+	return ['rc' => 1, 'stdout' => '', 'stderr' => "unknown action $action"];
+}
+
+class WorkerOutput extends BufferedOutput implements ConsoleOutputInterface {
+	private $stderr;
+
+	public function __construct() {
+		parent::__construct(OutputInterface::VERBOSITY_NORMAL, false);
+		$this->stderr = new BufferedOutput(OutputInterface::VERBOSITY_NORMAL, false);
+	}
+
+	public function getErrorOutput(): OutputInterface {
+		return $this->stderr;
+	}
+
+	public function setErrorOutput(OutputInterface $error): void {
+		$this->stderr = $error;
+	}
+
+	public function section(): ConsoleSectionOutput {
+		throw new \RuntimeException('console sections are not supported by the occ worker');
+	}
+}
+
+try {
+	if (strpos(@ini_get('disable_functions'), 'set_time_limit') === false) {
+		@set_time_limit(0);
+	}
+
+	$config = \OC::$server->getSystemConfig();
+
+	if (!$config->getValue('installed', false)) {
+		throw new \RuntimeException('Nextcloud is not installed');
+	}
+
+	if (\OCP\Util::needUpgrade()) {
+		throw new \RuntimeException('Nextcloud or one of the apps require upgrade');
+	}
+
+	$application = \OCP\Server::get(\OC\Console\Application::class);
+	$application->setAutoExit(false);
+	$application->loadCommands(new ArgvInput(['occ']), new WorkerOutput());
+} catch (\Throwable $e) {
+	ob_end_clean();
+	worker_reply(['ready' => false, 'error' => $e->getMessage()]);
+	exit(1);
+}
+
+ob_end_clean();
+worker_reply(['ready' => true, 'version' => \OC_Util::getVersionString()]);
+
+while (($line = fgets(STDIN)) !== false) {
+	$line = trim($line);
+
+	if ($line === '') {
+		continue;
+	}
+
+	$request = json_decode($line, true);
+
+	if (is_array($request) && isset($request['action'])) {
+		ob_start();
+
+		try {
+			$reply = worker_action($request);
+		} catch (\Throwable $e) {
+			$reply = ['rc' => 1, 'stdout' => '', 'stderr' => $e->getMessage()];
+		}
+
+		$reply['stdout'] = ob_get_clean() . $reply['stdout'];
+
+		worker_reply($reply);
+		continue;
+	}
+
+	if (!is_array($request) || !isset($request['args']) || !is_array($request['args'])) {
+		worker_reply(['rc' => 1, 'stdout' => '', 'stderr' => 'invalid request']);
+		continue;
+	}
+
+	$env = isset($request['env']) && is_array($request['env']) ? $request['env'] : [];
+
+	foreach ($env as $key => $value) {
+		putenv("$key=$value");
+		$_ENV[$key] = $value;
+		$_SERVER[$key] = $value;
+	}
+
+	$output = new WorkerOutput();
+	$rc = 1;
+
+	ob_start();
+
+	try {
+		$rc = $application->run(new ArgvInput(array_merge(['occ'], $request['args'])), $output);
+	} catch (\Throwable $e) {
+		$output->getErrorOutput()->writeln($e->getMessage());
+	}
+
+	$stray = ob_get_clean();
+
+	foreach (array_keys($env) as $key) {
+		putenv($key);
+		unset($_ENV[$key], $_SERVER[$key]);
+	}
+
+	worker_reply([
+		'rc' => (int)$rc,
+		'stdout' => $stray . $output->fetch(),
+		'stderr' => $output->getErrorOutput()->fetch(),
+	]);
+}
@@ -19,6 +19,7 @@ class FilterModule(object):
             'directories': self.directories,
             'nc_directories': self.directories,
             'nc_configured_cache': self.configured_cache,
+            'nc_cache_packages': self.cache_packages,
             'nc_database_driver': self.configured_database,
             'nc_validate_passwords': self.validate_passwords,
         }
@@ -80,16 +81,70 @@ class FilterModule(object):
 
     def configured_cache(self, data, cache="redis"):
         """
+            redis: a server (TCP host or unix socket) or a cluster with seeds
+            memcache: the memcached servers
         """
         display.v(f"- data : {data}")
 
+        result = []
+
+        if isinstance(data, dict) and cache == "redis":
+            data = [data]
+
         if cache == "redis":
-            result = [x for x in data if x.get("host", None)]
+            result = [
+                x for x in data or []
+                if isinstance(x, dict) and (x.get("host", None) or x.get("seeds", None))
+            ]
         if cache == "memcache":
-            # memcaches = [x for x in data if x.get("local", None) or x.get("locking", None) or x.get("distributed", None)]
-            # if len(memcaches) > 0:
-            memcache_servers = data.get("servers", [])
-            result = [x for x in memcache_servers if x.get("host", None)]
+            memcache_servers = (data or {}).get("servers", []) or []
+            # [host, port, weight] or {host: , port: }
+            result = [
+                x for x in memcache_servers
+                if (isinstance(x, dict) and x.get("host", None)) or (isinstance(x, (list, tuple)) and len(x) > 0 and x[0])
+            ]
+
+        display.v(f"- result : {result}")
+
+        return result
+
+    def cache_packages(self, data, packages):
+        """
+            php extensions for the configured caches and the file locking
+
+            redis: a server, a cluster or a memcache class with Redis
+            memcache: memcached servers or a memcache class with Memcached
+            apcu: a memcache class with APCu
+        """
+        display.v(f"cache_packages({data}, {packages})")
+
+        data = data or {}
+        memcache = data.get("memcache", {}) or {}
+
+        classes = [
+            str(memcache.get(x) or "").lower()
+            for x in ["local", "distributed", "locking"]
+        ]
+
+        result = []
+
+        redis = (
+            len(self.configured_cache(data.get("redis", []), "redis")) > 0 or
+            len(self.configured_cache(data.get("redis_cluster", {}), "redis")) > 0 or
+            any(x.endswith("redis") for x in classes)
+        )
+        memcached = (
+            len(self.configured_cache(memcache, "memcache")) > 0 or
+            any(x.endswith("memcached") for x in classes)
+        )
+        apcu = any(x.endswith("apcu") for x in classes)
+
+        if redis:
+            result += packages.get("redis", [])
+        if memcached:
+            result += packages.get("memcache", [])
+        if apcu:
+            result += packages.get("apcu", [])
 
         display.v(f"- result : {result}")
 
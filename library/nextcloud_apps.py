@@ -8,11 +8,13 @@
 from __future__ import absolute_import, print_function
 import os
 import re
-import json
 import pwd
 import grp
+import json
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.nextcloud_occ_client import OccClient
+from ansible.module_utils.nextcloud_atomic_writer import AtomicWriter
 from ansible_collections.bodsch.core.plugins.module_utils.module_results import results
 
 __metaclass__ = type
@@ -37,22 +39,16 @@ class NextcloudApps(object):
         self.apps = module.params.get("apps")
         self.working_dir = module.params.get("working_dir")
         self.owner = module.params.get("owner")
+        self.state_cache_ttl = module.params.get("state_cache_ttl")
+        self.trace_file = module.params.get("trace_file")
 
-        self.occ_base_args = [
-            "sudo",
-            "--preserve-env",
-            "--user",
-            self.owner,
-            "php",
-            "occ"
-        ]
+        self.occ_client = OccClient(module, working_dir=self.working_dir, owner=self.owner, cache_ttl=self.state_cache_ttl, trace_file=self.trace_file)
+        self.writer = AtomicWriter(module, owner=self.owner, mode=0o600)
 
     def run(self):
         """
         """
-        self._occ = os.path.join(self.working_dir, 'occ')
-
-        if not os.path.exists(self._occ):
+        if not self.occ_client.available():
             return dict(
                 failed=True,
                 changed=False,
@@ -61,7 +57,7 @@ class NextcloudApps(object):
 
         os.chdir(self.working_dir)
 
-        rc, installed, out, err = self.occ_check(check_installed=True)
+        rc, installed, out, err = self.occ_client.check(check_installed=True)
 
         if not installed and rc == 1:
             return dict(
@@ -70,105 +66,154 @@ class NextcloudApps(object):
                 msg=out
             )
 
-        existing_apps, enabled_apps, disabled_apps = self.occ_list_apps()
+        existing_apps, enabled_apps, disabled_apps = self.occ_client.list_apps()
+
+        # one snapshot for all apps
+        enabled_apps = set(enabled_apps)
+        disabled_apps = set(disabled_apps)
+        installed_apps = enabled_apps | disabled_apps
 
         result_state = []
 
         if self.apps:
+            apps = []
+            enable_apps = dict()
+            disable_apps = []
+            remove_apps = []
+
+            # collect all transitions, occ app:enable and app:disable accept several apps
             for app in self.apps:
                 """
                 """
                 app_state = app.get("state", "present")
                 app_name = app.get("name", None)
-                app_settings = app.get("settings", {})
-                config_failed = False
-                config_changed = False
-                config_msg = ""
-                groups = []
+                groups = app.get("groups", [])
+
+                if not app_name:
+                    continue
 
-                if app_name:
-                    res = {}
+                install_app = dict()
 
+                _installed = app_name in installed_apps
+
+                if not _installed:
+                    # apps outside of the listing (e.g. a broken info.xml)
                     _, _, _installed = self.occ_path_app(app_name=app_name)
 
-                    if app_state in ["present", "enabled"]:
-                        install_app = dict()
-                        enabled_app = dict()
-                        config_app = dict()
+                if app_state in ["present", "enabled"]:
+                    if not _installed:
+                        install_app = self.occ_install_app(app_name=app_name)
+                        # self.module.log(f" - install_app: '{install_app}'")
 
-                        if not _installed:
-                            install_app = self.occ_install_app(app_name=app_name)
-                            # self.module.log(f" - install_app: '{install_app}'")
-                        else:
+                    if not install_app.get("failed", False) and app_state == "enabled" and (app_name in disabled_apps or not _installed):
+                        # one app:enable per group restriction
+                        batch = enable_apps.setdefault(tuple(sorted(groups)), [])
+                        if app_name not in batch:
+                            batch.append(app_name)
 
-                            res[app_name] = dict(
-                                changed=False,
-                                msg="The app has already been installed."
-                            )
+                elif app_state == "disabled" and _installed and app_name not in disabled_apps:
+                    if app_name not in disable_apps:
+                        disable_apps.append(app_name)
+
+                elif app_state == "absent" and app_name in installed_apps:
+                    # app:remove only accepts a single app
+                    if app_name not in remove_apps:
+                        remove_apps.append(app_name)
+
+                apps.append((app_name, app_state, app.get("settings", {}), _installed, install_app))
+
+            transitions = dict()
 
-                        # enable application
-                        if not install_app.get("failed", False) and app_state == "enabled" and (app_name in disabled_apps or not _installed):
-                            enabled_app = self.occ_enable_app(app_name=app_name, groups=groups)
-                            # self.module.log(f" - {enabled_app}")
+            for groups, app_names in enable_apps.items():
+                transitions.update(self.occ_enable_apps(app_names=app_names, groups=list(groups)))
 
-                        # configure application
-                        if isinstance(app_settings, dict) and len(app_settings) > 0:
-                            config_app = self.occ_app_settings(app_name=app_name, app_settings=app_settings)
+            if len(disable_apps) > 0:
+                transitions.update(self.occ_disable_apps(app_names=disable_apps))
 
-                        _failed = (install_app.get("failed", False) or enabled_app.get("failed", False))
-                        _changed = (install_app.get("changed", False) or enabled_app.get("changed", False))
+            for app_name in remove_apps:
+                transitions[app_name] = self.occ_remove_app(app_name=app_name)
 
-                        _msg = ""
-                        install_msg = install_app.get("msg", "")
-                        enabled_msg = enabled_app.get("msg", "")
-                        config_msg = config_app.get("msg", "")
+            # all app settings are read once and written with a single config:import
+            managed_settings = {
+                app_name: settings
+                for app_name, app_state, settings, _, install_app in apps
+                if app_state in ["present", "enabled"] and not install_app.get("failed", False) and isinstance(settings, dict) and len(settings) > 0
+            }
 
-                        if _failed:
-                            if len(install_msg) > 0:
-                                _msg = install_msg
-                            if len(enabled_msg) > 0:
-                                _msg += f"{enabled_msg}"
+            config_apps = self.occ_app_settings(app_settings=managed_settings) if len(managed_settings) > 0 else dict()
 
+            for app_name, app_state, _, _installed, install_app in apps:
+                """
+                """
+                res = {}
+
+                if app_state in ["present", "enabled"]:
+                    enabled_app = dict()
+                    config_app = dict()
+
+                    if _installed:
+                        res[app_name] = dict(
+                            changed=False,
+                            msg="The app has already been installed."
+                        )
+
+                    if app_state == "enabled":
+                        enabled_app = transitions.get(app_name, {})
+
+                    config_app = config_apps.get(app_name, {})
+
+                    _failed = (install_app.get("failed", False) or enabled_app.get("failed", False) or config_app.get("failed", False))
+                    _changed = (install_app.get("changed", False) or enabled_app.get("changed", False) or config_app.get("changed", False))
+
+                    _msg = ""
+                    install_msg = install_app.get("msg", "")
+                    enabled_msg = enabled_app.get("msg", "") if enabled_app.get("changed", False) or enabled_app.get("failed", False) else ""
+                    config_msg = config_app.get("msg", "") if config_app.get("changed", False) or config_app.get("failed", False) else ""
+
+                    if _failed:
+                        if len(install_msg) > 0:
+                            _msg = install_msg
+                        if len(enabled_msg) > 0:
+                            _msg += f"{enabled_msg}"
+                        if config_app.get("failed", False):
+                            _msg += f"{config_msg}"
+
+                        res[app_name] = dict(
+                            failed=_failed,
+                            changed=_changed,
+                            msg=_msg
+                        )
+                    else:
+                        if len(install_msg) > 0 and len(enabled_msg) > 0:
+                            _msg = "App was successfully installed and enabled."
+                        elif len(install_msg) > 0 and len(enabled_msg) == 0:
+                            _msg = install_msg
+                        elif len(install_msg) == 0 and len(enabled_msg) > 0:
+                            _msg = enabled_msg
+                        elif len(install_msg) == 0 and len(enabled_msg) == 0 and len(config_msg) > 0:
+                            _msg = config_msg
+
+                        if len(_msg) > 0:
                             res[app_name] = dict(
                                 failed=_failed,
                                 changed=_changed,
                                 msg=_msg
                             )
-                        else:
-                            if len(install_msg) > 0 and len(enabled_msg) > 0:
-                                _msg = "App was successfully installed and enabled."
-                            elif len(install_msg) > 0 and len(enabled_msg) == 0:
-                                _msg = install_msg
-                            elif len(install_msg) == 0 and len(enabled_msg) > 0:
-                                _msg = enabled_msg
-                            elif len(install_msg) == 0 and len(enabled_msg) == 0 and len(config_msg) > 0:
-                                _msg = config_msg
-
-                            if len(_msg) > 0:
-                                res[app_name] = dict(
-                                    failed=_failed,
-                                    changed=_changed,
-                                    msg=_msg
-                                )
-
-                    elif app_state in ["absent", "disabled"]:
-
-                        if app_state == "disabled" and (app_name in enabled_apps or _installed):
-                            res[app_name] = self.occ_disable_app(app_name=app_name)
-
-                        if app_state == "absent":
-                            if app_name in enabled_apps or app_name in disabled_apps:
-                                res[app_name] = self.occ_remove_app(app_name=app_name)
-                            else:
-                                res[app_name] = dict(
-                                    changed=False,
-                                    msg="The app was not installed."
-                                )
-
-                    result_state.append(res)
-
-                else:
-                    pass
+
+                elif app_state == "disabled":
+                    if app_name in transitions:
+                        res[app_name] = transitions.get(app_name)
+
+                elif app_state == "absent":
+                    if app_name in transitions:
+                        res[app_name] = transitions.get(app_name)
+                    else:
+                        res[app_name] = dict(
+                            changed=False,
+                            msg="The app was not installed."
+                        )
+
+                result_state.append(res)
 
         _state, _changed, _failed, state, changed, failed = results(self.module, result_state)
 
@@ -180,51 +225,6 @@ class NextcloudApps(object):
 
         return result
 
-    def occ_check(self, check_installed=False):
-        """
-            sudo -u www-data php occ check
-        """
-        # self.module.log(msg=f"occ_check({check_installed})")
-
-        args = []
-        args += self.occ_base_args
-
-        args.append("check")
-        args.append("--no-ansi")
-        args.append("--output")
-        args.append("json")
-
-        rc, out, err = self.__exec(args, check_rc=False)
-
-        """
-            not installed: "Nextcloud is not installed - only a limited number of commands are available"
-            installed: ''
-        """
-        if not check_installed:
-            return rc, out, err
-
-        installed = False
-
-        if rc == 0:
-            pattern = re.compile(r"Nextcloud is not installed.*", re.MULTILINE)
-            is_installed = re.search(pattern, err)
-
-            if is_installed:
-                installed = False
-            else:
-                installed = True
-
-        else:
-            err = out.strip()
-
-            pattern = re.compile(r"An unhandled exception has been thrown:\n(?P<exception>.*)\n.*", re.MULTILINE)
-            exception = re.search(pattern, err)
-
-            if exception:
-                err = exception.user("exception")
-
-        return (rc, installed, out, err)
-
     def occ_install_app(self, app_name):
         """
         """
@@ -234,14 +234,12 @@ class NextcloudApps(object):
         _msg = ""
 
         args = []
-        args += self.occ_base_args
-
         args.append("app:install")
         args.append("--no-ansi")
         args.append("--keep-disabled")
         args.append(app_name)
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         if rc == 0:
             _msg = "App was successfully installed."
@@ -267,15 +265,13 @@ class NextcloudApps(object):
         _msg = ""
 
         args = []
-        args += self.occ_base_args
-
         args.append("app:remove")
         args.append("--no-ansi")
         args.append(app_name)
 
         # self.module.log(msg=f" args: '{args}'")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         if rc == 0:
             _msg = "App was successfully removed."
@@ -300,13 +296,11 @@ class NextcloudApps(object):
         _changed = False
 
         args = []
-        args += self.occ_base_args
-
         args.append("app:getpath")
         args.append("--no-ansi")
         args.append(app_name)
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         if rc == 0:
             _installed = True
@@ -319,167 +313,167 @@ class NextcloudApps(object):
 
         return (_failed, _changed, _installed)
 
-    def occ_enable_app(self, app_name, groups=[]):
+    def occ_enable_apps(self, app_names, groups=[]):
         """
+            sudo --preserve-env --user www-data php occ app:enable --no-ansi calendar contacts --groups admin
         """
-        self.module.log(msg=f"occ_enable_app({app_name}, {groups})")
-        _failed = True
-        _changed = False
-        _msg = ""
+        self.module.log(msg=f"occ_enable_apps({app_names}, {groups})")
 
         args = []
-        args += self.occ_base_args
-
         args.append("app:enable")
         args.append("--no-ansi")
-        args.append(app_name)
+        args += app_names
 
         if len(groups):
             for g in groups:
                 args.append("--groups")
                 args.append(g)
 
-        rc, out, err = self.__exec(args, check_rc=False)
-
-        if rc == 0:
-            _msg = "App was successfully enabled."
-            _failed = False
-            _changed = True
-        else:
-            _failed = True
-            _changed = False
-            _msg = out.strip()
+        rc, out, err = self.occ_client.exec(args)
 
-        return dict(
-            failed=_failed,
-            changed=_changed,
-            msg=_msg
+        return self.__batch_result(
+            app_names, out, err,
+            changed_pattern=r"^{app} \S+ enabled",
+            unchanged_pattern=r"^{app} already enabled",
+            msg="App was successfully enabled."
         )
 
-    def occ_disable_app(self, app_name):
+    def occ_disable_apps(self, app_names):
         """
+            sudo --preserve-env --user www-data php occ app:disable --no-ansi calendar contacts
         """
-        self.module.log(msg=f"occ_disable_app({app_name})")
-        _failed = True
-        _changed = False
-        _msg = ""
+        self.module.log(msg=f"occ_disable_apps({app_names})")
 
         args = []
-        args += self.occ_base_args
-
         args.append("app:disable")
         args.append("--no-ansi")
-        args.append(app_name)
+        args += app_names
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
-        if rc == 0:
-            _msg = "App was successfully disabled."
-            _failed = False
-            _changed = True
-        else:
-            _failed = True
-            _changed = False
-            _msg = out.strip()
-
-        return dict(
-            failed=_failed,
-            changed=_changed,
-            msg=_msg
+        return self.__batch_result(
+            app_names, out, err,
+            changed_pattern=r"^{app} \S+ disabled",
+            unchanged_pattern=r"^No such app enabled: {app}$",
+            msg="App was successfully disabled."
         )
 
-    def occ_app_settings(self, app_name, app_settings):
+    def occ_app_settings(self, app_settings):
         """
-            sudo --preserve-env --user www-data php occ config:app:get richdocuments disable_certificate_verification
-            sudo --preserve-env --user www-data php occ config:app:set --output json --value yes --update-only richdocuments disable_certificate_verification
-        """
-        # self.module.log(msg=f"occ_app_settings({app_name}, {app_settings})")
+            app_settings = {app: {key: value}}
 
-        failed = False
-        changed = False
-        msg = "not to do."
-        result_state = []
-
-        for config_key, config_value in app_settings.items():
-            res = {}
-            # self.module.log(msg=f"  - {config_key}  -> {config_value})")
+            sudo --preserve-env --user www-data php occ config:list --output json --private richdocuments
+            sudo --preserve-env --user www-data php occ config:import config/.ansible-apps.xxx.json
+        """
+        # self.module.log(msg=f"occ_app_settings({app_settings})")
+        result = dict()
+        delta = dict()
 
-            if isinstance(config_value, bool):
-                config_value = 'yes' if config_value else 'no'
+        current_config = self.occ_client.app_config(app_names=list(app_settings.keys()))
 
-            if not isinstance(config_value, str):
-                self.module.log(msg=f"ignore value {config_value} for key {config_key}")
-                continue
+        for app_name, settings in app_settings.items():
+            current = current_config.get(app_name, {})
 
-            args = []
-            args += self.occ_base_args
+            for config_key, config_value in settings.items():
+                # self.module.log(msg=f"  - {config_key}  -> {config_value})")
 
-            args.append("config:app:set")
-            args.append("--no-ansi")
-            args.append("--output")
-            args.append("json")
-            args.append("--value")
-            args.append(config_value)
-            args.append(app_name)
-            args.append(config_key)
+                if isinstance(config_value, bool):
+                    config_value = 'yes' if config_value else 'no'
 
-            # self.module.log(msg=f" args: '{args}'")
+                if not isinstance(config_value, str):
+                    self.module.log(msg=f"ignore value {config_value} for key {config_key}")
+                    continue
 
-            rc, out, err = self.__exec(args, check_rc=False)
+                if config_key in current and str(current.get(config_key)) == config_value:
+                    continue
 
-            if rc == 0:
-                _msg = f"config value for {config_key} was successfully set to {config_value}."
-                _failed = False
-                _changed = True
-            else:
-                _failed = True
-                _changed = False
-                _msg = out.strip()
+                delta.setdefault(app_name, {})[config_key] = config_value
 
-            res[app_name] = dict(
-                changed=_changed,
-                msg=_msg
+            result[app_name] = dict(
+                failed=False,
+                changed=False,
+                msg="not to do."
             )
 
-        _state, _changed, _failed, state, changed, failed = results(self.module, result_state)
+        if len(delta) == 0:
+            return result
 
-        result = dict(
-            changed=_changed,
-            failed=failed,
-            msg=result_state
-        )
+        rc, out, err = self.occ_import_config(data=dict(apps=delta))
 
-        return result
+        for app_name, values in delta.items():
+            if rc == 0:
+                result[app_name] = dict(
+                    failed=False,
+                    changed=True,
+                    msg=f"config value(s) for {', '.join(values.keys())} successfully set."
+                )
+            else:
+                result[app_name] = dict(
+                    failed=True,
+                    changed=False,
+                    msg=(out + err).strip()
+                )
 
-        # return (_failed, _changed, result_state)
+        return result
 
-    def occ_list_apps(self):
+    def occ_import_config(self, data):
         """
+            the document is only readable by the owner and removed after the import
         """
-        app_names = []
-        args = []
-        args += self.occ_base_args
-
-        args.append("app:list")
-        args.append("--no-ansi")
-        args.append("--output")
-        args.append("json")
+        file_name = self.writer.temporary(
+            os.path.join(self.working_dir, "config"),
+            json.dumps(data, indent=2),
+            prefix=".ansible-apps.",
+            suffix=".json"
+        )
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        try:
+            args = []
+            args.append("config:import")
+            args.append("--no-ansi")
+            args.append(file_name)
 
-        if rc == 0:
-            out = json.loads(out)
+            rc, out, err = self.occ_client.exec(args)
+        finally:
+            os.remove(file_name)
 
-            app_names = out
+        return rc, out, err
 
-        enabled_apps = [x for x, _ in app_names.get("enabled", {}).items()]
-        disabled_apps = [x for x, _ in app_names.get("disabled", {}).items()]
+    def __batch_result(self, app_names, out, err, changed_pattern, unchanged_pattern, msg):
+        """
+            occ writes one line per app, e.g.
+              'calendar 4.6.0 enabled', 'calendar already enabled'
+              'calendar 4.6.0 disabled', 'No such app enabled: calendar'
+            and continues with the next app when one of them fails.
+        """
+        result = dict()
+        lines = [x.strip() for x in out.splitlines() if x.strip()]
+
+        for app_name in app_names:
+            app = re.escape(app_name)
+
+            if any(re.match(unchanged_pattern.format(app=app), x) for x in lines):
+                result[app_name] = dict(
+                    failed=False,
+                    changed=False,
+                    msg="nothing to do."
+                )
+            elif any(re.match(changed_pattern.format(app=app), x) for x in lines):
+                result[app_name] = dict(
+                    failed=False,
+                    changed=True,
+                    msg=msg
+                )
+            else:
+                app_lines = [x for x in lines if re.search(rf"(^|\W){app}(\W|$)", x)]
 
-        # self.module.log(f"existing_apps : {app_names}")
-        # self.module.log(f"enabled apps  : {enabled_apps}")
-        # self.module.log(f"disabled apps : {disabled_apps}")
+                result[app_name] = dict(
+                    failed=True,
+                    changed=False,
+                    msg="\n".join(app_lines) or (out + err).strip()
+                )
 
-        return (app_names, enabled_apps, disabled_apps)
+        return result
 
     def __file_state(self, file_name):
         """
@@ -507,25 +501,6 @@ class NextcloudApps(object):
 
         return current_owner, current_app, current_mode
 
-    def __exec(self, commands, check_rc=True):
-        """
-        """
-        rc, out, err = self.module.run_command(
-            commands,
-            cwd=self.working_dir,
-            check_rc=check_rc)
-
-        # self.module.log(msg=f"  rc : '{rc}'")
-        if rc != 0:
-            self.module.log(msg=f"cmd: '{commands}'")
-            self.module.log(msg=f"  rc : '{rc}'")
-            self.module.log(msg=f"  out: '{out}'")
-            self.module.log(msg=f"  err: '{err}'")
-            for line in err.splitlines():
-                self.module.log(msg=f"   {line}")
-
-        return rc, out, err
-
 
 def main():
     """
@@ -545,6 +520,15 @@ def main():
             type=str,
             default="www-data"
         ),
+        state_cache_ttl=dict(
+            required=False,
+            type=int,
+            default=0
+        ),
+        trace_file=dict(
+            required=False,
+            type=str
+        ),
     )
 
     module = AnsibleModule(
@@ -554,6 +538,7 @@ def main():
 
     kc = NextcloudApps(module)
     result = kc.run()
+    result.update(kc.occ_client.timings.result())
 
     module.log(msg=f"= result : '{result}'")
 
@@ -7,16 +7,17 @@
 
 from __future__ import absolute_import, print_function
 import os
-import re
 import pwd
 import grp
+import re
+import glob
 import json
-import shutil
+import hashlib
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible_collections.bodsch.core.plugins.module_utils.directory import create_directory
-from ansible_collections.bodsch.core.plugins.module_utils.checksum import Checksum
-from ansible_collections.bodsch.core.plugins.module_utils.diff import SideBySide
+from ansible.module_utils.nextcloud_occ_client import OccClient
+from ansible.module_utils.nextcloud_atomic_writer import AtomicWriter
+from ansible.module_utils.nextcloud_config_schema import ConfigSchema, SYSTEM_CONFIG, DATABASE_CONFIG, config_area
 from ansible_collections.bodsch.core.plugins.module_utils.validate import validate
 
 
@@ -44,136 +45,154 @@ class NextcloudClient(object):
         self.working_dir = module.params.get("working_dir")
         # self.data_dir = module.params.get("data_dir")
         self.owner = module.params.get("owner")
+        self.trace_file = module.params.get("trace_file")
         self.group = module.params.get("group")
         self.config_parameters = module.params.get("config_parameters")
         self.trusted_domains = module.params.get("trusted_domains")
         self.database = module.params.get("database")
         self.diff_output = module.params.get("diff_output")
+        self.drift_detection = module.params.get("drift_detection")
+        self.split_config = module.params.get("split_config")
+        self.app_config = module.params.get("app_config")
 
-        self.occ_base_args = [
-            "sudo",
-            "--user",
-            self.owner,
-            "php",
-            "occ"
-        ]
+        # the imported configuration has to be validated by a fresh bootstrap
+        self.occ_client = OccClient(module, working_dir=self.working_dir, owner=self.owner, use_worker=False, trace_file=self.trace_file)
+
+        self.system_schema = ConfigSchema(SYSTEM_CONFIG)
+        self.database_schema = ConfigSchema(DATABASE_CONFIG)
 
         self.nc_config_file = f"{self.working_dir}/config/config.php"
+        self.nc_config_directory = f"{self.working_dir}/config"
         self.ansible_json_file = f"{self.working_dir}/config/ansible.json"
 
-        self.cache_directory = "/var/cache/ansible/nextcloud"
-        # self.checksum_file_name = os.path.join(self.cache_directory, "daemon.checksum")
-
-        pid = os.getpid()
-        self.tmp_directory = os.path.join("/run/.ansible", f"nextcloud.{str(pid)}")
+        self.writer = AtomicWriter(module, owner=self.owner, group=self.group)
 
     def run(self):
         """
         """
-        self._occ = os.path.join(self.working_dir, 'occ')
+        _diff = dict()
 
-        # self.module.log(msg=f" console   : '{self._occ}'")
+        data, errors = self.config_opts()
 
-        if not os.path.exists(self._occ):
+        if len(errors) > 0:
             return dict(
                 failed=True,
                 changed=False,
-                msg="missing occ"
+                msg=f"Invalid configuration parameters: {', '.join(errors)}"
             )
 
-        rc, installed, out, err = self.occ_check()
+        # self.module.log(msg=f" config opts   : '{data}'")
+
+        # render and compare in memory, an unchanged configuration needs no occ call
+        rendered = self.__render_config(data)
+        applied = self.__read_file(self.ansible_json_file)
 
-        # self.module.log(msg=f" rc : '{rc}'")
-        # self.module.log(msg=f" out: '{out.strip()}'")
-        # self.module.log(msg=f" err: '{err.strip()}'")
+        new_checksum = self.__checksum(rendered)
+        old_checksum = self.__checksum(applied)
 
-        if not installed and rc == 1:
+        if self.split_config:
+            return self.run_fragments(data, rendered, applied)
+
+        # fragments of a former split_config override config.php, they have to go
+        fragment_files = sorted(glob.glob(os.path.join(self.nc_config_directory, "ansible-*.config.php")))
+
+        if self.drift_detection:
+            # compare with the effective configuration, changes made outside of ansible are detected
+            delta = self.config_drift(self.occ_client.system_config(), self.__load_json(applied), data)
+        elif new_checksum == old_checksum and len(fragment_files) == 0:
             return dict(
-                failed=False,
                 changed=False,
-                msg=out
+                failed=False,
+                msg="The configuration has not been changed.",
+                diff=_diff
             )
+        else:
+            # only the changed keys are imported, removed keys are deleted
+            delta = self.config_delta(self.__load_json(applied), data)
 
-        checksum = Checksum(self.module)
-        _diff = []
+        if self.diff_output:
+            _diff = self.create_diff(self.__load_json(applied), data)
 
-        os.chdir(self.working_dir)
+        if len(fragment_files) > 0:
+            # the system values move from the fragments into config.php
+            delta["document"]["system"] = dict(data.get("system", {}))
 
-        data = self.config_opts()
+        if not any(delta.get("keys").values()) and len(fragment_files) == 0:
+            # e.g. only the order of the keys has changed
+            if new_checksum != old_checksum and not self.module.check_mode:
+                self.writer.write(self.ansible_json_file, rendered, backup=False)
 
-        # self.module.log(msg=f" config opts   : '{data}'")
-
-        create_directory(directory=self.tmp_directory, mode="0750")
-        tmp_file = os.path.join(self.tmp_directory, "ansible.json")
+            return dict(
+                changed=False,
+                failed=False,
+                msg="The configuration has not been changed.",
+                diff=_diff,
+                keys=delta.get("keys"),
+                drift=delta.get("drift")
+            )
 
-        self.__write_config(tmp_file, data)
+        if self.module.check_mode:
+            return dict(
+                changed=True,
+                failed=False,
+                msg="The configuration would be updated.",
+                diff=_diff,
+                keys=delta.get("keys"),
+                drift=delta.get("drift")
+            )
 
-        new_checksum = checksum.checksum_from_file(tmp_file)
-        old_checksum = checksum.checksum_from_file(self.ansible_json_file)
-        changed = not (new_checksum == old_checksum)
-        new_file = False
-        msg = "The configuration has not been changed."
+        not_installed = self.__check_installed()
 
-        # self.module.log(f" tmp_file      : {tmp_file}")
-        # self.module.log(f" config_file   : {self.ansible_json_file}")
-        # self.module.log(f" changed       : {changed}")
-        # self.module.log(f" new_checksum  : {new_checksum}")
-        # self.module.log(f" old_checksum  : {old_checksum}")
+        if not_installed:
+            return not_installed
 
-        # if self.data_dir:
-        #     current_owner, current_group, current_mode = self.__file_state(self.data_dir)
-        #     self.module.log(f" {self.data_dir} : {current_owner}:{current_mode} : {current_mode}")
+        changed = True
+        new_file = (old_checksum is None)
 
-        if changed:
-            new_file = (old_checksum is None)
-            _config_backup = os.path.join(self.working_dir, 'config', f"config.{os.getpid()}.bck")
+        # Nextcloud rewrites config.php in place, the backup has to be a copy
+        self.writer.backup(self.nc_config_file)
 
-            if self.diff_output:
-                difference = self.create_diff(self.ansible_json_file, data)
-                _diff = difference
+        """
+            import new config
+        """
+        rc, err = self.apply_delta(delta)
 
-            # create backup of existing config
-            if os.path.exists(self.ansible_json_file):
-                shutil.copyfile(self.nc_config_file, _config_backup)
+        if rc == 0:
+            for file_name in fragment_files:
+                self.writer.remove(file_name)
 
-            shutil.copyfile(tmp_file, self.ansible_json_file)
+        """
+            test new config, Nextcloud has to boot with it
+        """
+        if rc == 0:
+            rc, err = self.occ_validate()
 
+        if rc != 0:
             """
-                import new config
+                restore last running configuration
             """
-            rc, out, err = self.occ_import(self.ansible_json_file)
+            for file_name in [self.nc_config_file] + fragment_files:
+                self.writer.rollback(file_name)
 
-            """
-                test new config
-            """
-            rc, err = self.occ_status()
+            self.occ_client.invalidate()
 
-            if rc != 0:
-                """
-                    restore last running configuration
-                """
-                if os.path.exists(_config_backup):
-                    os.remove(self.nc_config_file)
-                    shutil.copyfile(_config_backup, self.nc_config_file)
-
-                    if os.path.exists(_config_backup):
-                        os.remove(_config_backup)
-
-                msg = "The configuration holds an fatal error."
-                msg += f" {err}"
-
-                return dict(
-                    failed=True,
-                    msg=msg,
-                    diff=_diff
-                )
+            msg = "The configuration holds an fatal error."
+            msg += f" {err}"
+            msg += self.rollback_apps(delta)
 
-            else:
-                msg = "The configuration has been successfully updated."
+            return dict(
+                failed=True,
+                msg=msg,
+                diff=_diff,
+                keys=delta.get("keys"),
+                drift=delta.get("drift")
+            )
+
+        else:
+            msg = "The configuration has been successfully updated."
 
-                if os.path.exists(_config_backup):
-                    # self.module.log(f" remove config backup {_config_backup}")
-                    os.remove(_config_backup)
+            # the applied configuration is the base of the next delta
+            self.writer.write(self.ansible_json_file, rendered, backup=False)
 
         if new_file:
             msg = "The configuration was successfully created."
@@ -184,642 +203,710 @@ class NextcloudClient(object):
 
         self.__fix_ownership(self.nc_config_file, self.owner, self.group, "0666")
 
-        shutil.rmtree(self.tmp_directory)
-
         return dict(
             changed=changed,
             failed=False,
             msg=msg,
-            diff=_diff
-        )
-
-    def config_opts(self):
-
-        data = dict(
-            system=dict()
+            diff=_diff,
+            keys=delta.get("keys"),
+            drift=delta.get("drift")
         )
 
-        if validate(self.trusted_domains):
-            data["system"]['trusted_domains'] = self.trusted_domains
-
-        if self.config_parameters:
-            parameters = self.config_parameters
-
-            # self.module.log(f" parameters       : {parameters}")
-
-            language = parameters.get("language")
-
-            if language:
-                if language.get("default", None):
-                    data["system"]['default_language'] = language.get("default", None)
-
-                if language.get("force", None):
-                    data["system"]['force_language'] = language.get("force", None)
-
-            locale = parameters.get("locale")
-
-            if locale:
-                if locale.get("default", None):
-                    data["system"]['default_locale'] = locale.get("default", None)
-
-                if locale.get("force", None):
-                    data["system"]['force_locale'] = locale.get("force", None)
-
-            if parameters.get("phone_region", None):
-                data["system"]['default_phone_region'] = parameters.get("phone_region", None)
-
-            if parameters.get("defaultapps", None):
-                data["system"]['defaultapp'] = ",".join(parameters.get("defaultapps", []))
-
-            if parameters.get("knowledgebase_enabled", None):
-                data["system"]['knowledgebaseenabled'] = parameters.get("knowledgebase_enabled", None)
-
-            if parameters.get("allow_user_to_change_display_name", None):
-                data["system"]['allow_user_to_change_display_name'] = parameters.get("allow_user_to_change_display_name", None)
-
-            if parameters.get("remember_login_cookie_lifetime", None):
-                data["system"]['remember_login_cookie_lifetime'] = parameters.get("remember_login_cookie_lifetime", None)
-
-            if parameters.get("theme", None):
-                data["system"]["theme"] = parameters.get("theme")
-            if parameters.get("enforce_theme", None):
-                data["system"]["enforce_theme"] = parameters.get("enforce_theme")
-
-            session = parameters.get("session")
-
-            if session:
-                if session.get("lifetime", None):
-                    data["system"]['session_lifetime'] = session.get("lifetime", None)
-
-                if session.get("relaxed_expiry", None):
-                    data["system"]['session_relaxed_expiry'] = session.get("relaxed_expiry", None)
+    def run_fragments(self, data, rendered, applied):
+        """
+            every area (database, caching, logging, ...) is written to its own
+            config/ansible-<area>.config.php, which Nextcloud merges into config.php.
 
-                if session.get("keepalive", None):
-                    data["system"]['session_keepalive'] = session.get("keepalive", None)
+            only fragments with a changed content are replaced, a fragment which
+            breaks Nextcloud is restored.
+        """
+        fragments = self.render_fragments(data)
+        current = {file_name: self.__read_file(file_name) for file_name in fragments}
 
-            maintenance = parameters.get("maintenance")
+        changed_files = sorted(f for f, content in fragments.items() if current.get(f) != content)
+        delta = self.config_delta(self.__load_json(applied), data)
+        _diff = self.create_diff(self.__load_json(applied), data) if self.diff_output else dict()
 
-            if maintenance:
-                maintenance_enabled = maintenance.get("enabled", True)
-                maintenance_window_start = maintenance.get("window_start", 1)
-                if maintenance_enabled and maintenance_window_start:
-                    data["system"]['maintenance_window_start'] = maintenance_window_start
+        # the app config is stored in the database
+        app_changes = len(delta["document"].get("apps", {})) > 0 or len(delta.get("removed_apps")) > 0
+        # removed keys, which were imported into config.php (e.g. before split_config)
+        stale_keys = self.stale_system_keys(delta.get("removed"))
 
-            if parameters.get("auto_logout", None):
-                data["system"]['auto_logout'] = parameters.get("auto_logout", None)
+        if len(changed_files) == 0 and not app_changes and len(stale_keys) == 0:
+            if applied != rendered and not self.module.check_mode:
+                self.writer.write(self.ansible_json_file, rendered, backup=False)
 
-            token = parameters.get("token")
+            return dict(
+                changed=False,
+                failed=False,
+                msg="The configuration has not been changed.",
+                diff=_diff,
+                keys=delta.get("keys"),
+                files=[]
+            )
 
-            if token:
-                if token.get("auth_enforced", None):
-                    data["system"]['token_auth_enforced'] = token.get("auth_enforced", None)
+        if self.module.check_mode:
+            return dict(
+                changed=True,
+                failed=False,
+                msg="The configuration would be updated.",
+                diff=_diff,
+                keys=delta.get("keys"),
+                files=changed_files
+            )
 
-                if token.get("auth_activity_update", None):
-                    data["system"]['token_auth_activity_update'] = token.get("auth_activity_update", None)
+        not_installed = self.__check_installed()
 
-            auth = parameters.get("auth")
+        if not_installed:
+            return not_installed
 
-            if auth:
-                if auth.get("bruteforce", {}).get("protection", {}).get("enabled", None):
-                    data["system"]['auth.bruteforce.protection.enabled'] = auth.get("bruteforce", {}).get("protection", {}).get("enabled", None)
+        for file_name in changed_files:
+            if fragments.get(file_name) is None:
+                self.writer.remove(file_name)
+            else:
+                self.writer.write(file_name, fragments.get(file_name))
 
-                if auth.get("bruteforce", {}).get("protection", {}).get("testing", None):
-                    data["system"]['auth.bruteforce.protection.testing'] = auth.get("bruteforce", {}).get("protection", {}).get("testing", None)
+        if len(stale_keys) > 0:
+            # Nextcloud rewrites config.php in place, the backup has to be a copy
+            self.writer.backup(self.nc_config_file)
 
-                if auth.get("webauthn", {}).get("enabled", None):
-                    data["system"]['auth.webauthn.enabled'] = auth.get("webauthn", {}).get("enabled", None)
+        if app_changes or len(stale_keys) > 0:
+            # the import and the deletes boot Nextcloud with the new fragments,
+            # only the removed system keys are deleted from config.php
+            rc, err = self.apply_delta(dict(delta, removed=stale_keys), system=False)
+        else:
+            # nothing else boots Nextcloud with the new fragments
+            rc, err = self.occ_validate()
 
-                if auth.get("storeCryptedPassword", None):
-                    data["system"]['auth.storeCryptedPassword'] = auth.get("storeCryptedPassword", None)
+        if rc != 0:
+            """
+                restore last running configuration
+            """
+            for file_name in changed_files + ([self.nc_config_file] if len(stale_keys) > 0 else []):
+                self.writer.rollback(file_name)
 
-            if parameters.get("hide_login_form", None):
-                data["system"]['hide_login_form'] = parameters.get("hide_login_form", None)
+            self.occ_client.invalidate()
 
-            if parameters.get("skeleton_directory", None):
-                data["system"]['skeletondirectory'] = parameters.get("skeleton_directory", None)
+            return dict(
+                failed=True,
+                msg=f"The configuration holds an fatal error. {err}{self.rollback_apps(delta)}",
+                diff=_diff,
+                keys=delta.get("keys"),
+                files=changed_files
+            )
 
-            if parameters.get("template_directory", None):
-                data["system"]['templatedirectory'] = parameters.get("template_directory", None)
+        if len(stale_keys) > 0:
+            # same mode as the fragments, config.php holds the secrets
+            self.__fix_ownership(self.nc_config_file, self.owner, self.group, "0640")
 
-            if parameters.get("temp_directory", None):
-                data["system"]['tempdirectory'] = parameters.get("temp_directory", None)
+        self.writer.write(self.ansible_json_file, rendered, backup=False)
 
-            if parameters.get("update_directory", None):
-                data["system"]['updatedirectory'] = parameters.get("update_directory", None)
+        return dict(
+            changed=True,
+            failed=False,
+            msg="The configuration has been successfully updated.",
+            diff=_diff,
+            keys=delta.get("keys"),
+            files=changed_files
+        )
 
-            if parameters.get("data_directory", None):
-                data["system"]['datadirectory'] = parameters.get("data_directory", None)
+    def apply_delta(self, delta, system=True):
+        """
+            imports the added and changed keys (system and apps) with one
+            'occ config:import' and deletes the removed keys
 
-            if parameters.get("lost_password_link", None):
-                data["system"]['lost_password_link'] = parameters.get("lost_password_link", None)
+            without 'system', the system values are written as fragments and
+            not imported.
 
-            if parameters.get("logo_url", None):
-                data["system"]['logo_url'] = parameters.get("logo_url", None)
+            returns (rc, err)
+        """
+        rc = 0
+        err = ""
+        document = dict(delta.get("document"))
 
-            mail = parameters.get("mail")
+        if not system:
+            document.pop("system", None)
 
-            if mail:
-                if mail.get("domain", None):
-                    data["system"]['mail_domain'] = mail.get("domain", None)
+        if len(document.get("system", {})) > 0 or len(document.get("apps", {})) > 0:
+            rc, out, err = self.occ_import_document(document)
 
-                if mail.get("from_address", None):
-                    data["system"]['mail_from_address'] = mail.get("from_address", None)
+        for key in delta.get("removed"):
+            if rc != 0:
+                break
 
-                if mail.get("debug", None):
-                    data["system"]['mail_smtpdebug'] = mail.get("debug", None)
+            rc, out, err = self.occ_delete_system_config(key)
 
-                if mail.get("mode", None):
-                    data["system"]['mail_smtpmode'] = mail.get("mode", None)
+        for app, key in delta.get("removed_apps"):
+            if rc != 0:
+                break
 
-                if mail.get("hostname", None):
-                    data["system"]['mail_smtphost'] = mail.get("hostname", None)
+            rc, out, err = self.occ_delete_app_config(app, key)
 
-                if mail.get("port", None):
-                    data["system"]['mail_smtpport'] = mail.get("port", None)
+        return (rc, err)
 
-                if mail.get("timeout", None):
-                    data["system"]['mail_smtptimeout'] = mail.get("timeout", None)
+    def stale_system_keys(self, removed):
+        """
+            the removed keys, which are still set in config/config.php
+        """
+        if len(removed) == 0:
+            return []
 
-                if mail.get("secure", None):
-                    data["system"]['mail_smtpsecure'] = mail.get("secure", None)
+        config = self.occ_client.php_config.system_config(include_fragments=False)
 
-                mail_auth = mail.get("auth")
+        if config is None:
+            # config.php can not be parsed, 'config:system:delete' ignores missing keys
+            return list(removed)
 
-                if mail_auth:
-                    mail_auth_enabled = mail_auth.get("enabled", False)
+        return [x for x in removed if x in config]
 
-                    if mail_auth_enabled:
-                        if mail_auth.get("enabled", False):
-                            data["system"]['mail_smtpauth'] = mail_auth_enabled
+    def rollback_apps(self, delta):
+        """
+            the app config is stored in the database and not covered by the
+            file backups, the replaced values are imported again.
 
-                        if mail_auth.get("username", None):
-                            data["system"]['mail_smtpname'] = mail_auth.get("username", None)
+            returns an additional message
+        """
+        added = [
+            (app, key) for app, values in delta["document"].get("apps", {}).items()
+            for key in values
+            if key not in delta.get("previous").get(app, {})
+        ]
 
-                        if mail_auth.get("password", None):
-                            data["system"]['mail_smtppassword'] = mail_auth.get("password", None)
+        if len(delta.get("previous")) == 0 and len(added) == 0:
+            return ""
 
-                        # if mail_auth.get("type", None):
-                        #    data["system"]['mail_smtpauthtype'] = mail_auth.get("type", None)
+        rc, out, err = (0, "", "")
 
-                if mail.get("template_class", None):
-                    template_class = mail.get("template_class", '\\OC\\Mail\\EMailTemplate')
-                    t2 = template_class.replace('\\\\', '\\')
-                    # self.module.log(f" template_class       : {template_class}")
-                    # template_class = template_class.encode().decode('unicode_escape')
-                    # self.module.log(f" template_class       : {template_class.encode().decode('unicode_escape')}")
-                    # self.module.log(f" template_class       : {t2}")
+        if len(delta.get("previous")) > 0:
+            rc, out, err = self.occ_import_document(dict(apps=delta.get("previous")))
 
-                    data["system"]['mail_template_class'] = t2
+        for app, key in added:
+            if rc != 0:
+                break
 
-                if mail.get("send_plaintext_only", None):
-                    data["system"]['mail_send_plaintext_only'] = mail.get("send_plaintext_only", None)
+            rc, out, err = self.occ_delete_app_config(app, key)
 
-                if mail.get("stream_options", None):
-                    data["system"]['mail_smtpstreamoptions'] = mail.get("stream_options", None)
+        if rc != 0:
+            return f" The app config could not be restored: {(out + err).strip()}"
 
-                if mail.get("sendmailmode", None):
-                    data["system"]['mail_sendmailmode'] = mail.get("sendmailmode", None)
+        return " The app config has been restored."
 
-            proxy = parameters.get("proxy")
+    def render_fragments(self, data):
+        """
+            returns {file name: content}, the content of obsolete fragments is None
+        """
+        areas = dict()
 
-            if proxy:
-                proxy_overwrite = proxy.get("overwrite")
+        for key, value in data.get("system", {}).items():
+            areas.setdefault(config_area(key), dict())[key] = value
 
-                if proxy_overwrite:
-                    if proxy_overwrite.get("hostname", None):
-                        data["system"]['overwritehost'] = proxy_overwrite.get("hostname", None)
+        result = {
+            file_name: None
+            for file_name in glob.glob(os.path.join(self.nc_config_directory, "ansible-*.config.php"))
+        }
 
-                    if proxy_overwrite.get("protocol", None):
-                        data["system"]['overwriteprotocol'] = proxy_overwrite.get("protocol", None)
+        for area, values in areas.items():
+            file_name = os.path.join(self.nc_config_directory, f"ansible-{area}.config.php")
+            result[file_name] = self.__render_php_config(values)
 
-                    if proxy_overwrite.get("web_root", None):
-                        data["system"]['overwritewebroot'] = proxy_overwrite.get("web_root", None)
+        return result
 
-                    if proxy_overwrite.get("cond_addr", None):
-                        data["system"]['overwritecondaddr'] = proxy_overwrite.get("cond_addr", None)
+    def config_delta(self, applied, data):
+        """
+            key level difference between the last applied and the new configuration
+
+            returns
+              document: the import document with the added and changed keys
+              removed: system keys which have to be deleted
+              removed_apps: (app, key) which have to be deleted
+              previous: {app: {key: value}} the replaced app values, to roll them back
+              keys: {added, changed, removed}, app keys as 'apps.<app>.<key>'
+        """
+        old_system = (applied or dict()).get("system", {})
+        new_system = data.get("system", {})
 
-                    if proxy_overwrite.get("cli_url", None):
-                        data["system"]['overwrite.cli.url'] = proxy_overwrite.get("cli_url", None)
+        added = [k for k in new_system if k not in old_system]
+        changed = [k for k in new_system if k in old_system and old_system.get(k) != new_system.get(k)]
+        removed = [k for k in old_system if k not in new_system]
 
-                proxy_htaccess = proxy.get("htaccess")
+        old_apps = (applied or dict()).get("apps", {})
 
-                if proxy_htaccess:
-                    if proxy_htaccess.get("rewrite_base", None):
-                        data["system"]['htaccess.RewriteBase'] = proxy_htaccess.get("rewrite_base", None)
+        return self.__delta(new_system, added, changed, removed, old_apps, old_apps, data.get("apps", {}))
 
-                    if proxy_htaccess.get("ignore_front_controller", None):
-                        data["system"]['htaccess.IgnoreFrontController'] = proxy_htaccess.get("ignore_front_controller", None)
+    def config_drift(self, effective, applied, data):
+        """
+            semantic difference between the effective and the new configuration
 
-                if proxy.get("proxy_name", None):
-                    data["system"]['proxy'] = proxy.get("proxy_name", None)
+            values are compared by meaning, not by type ('true' == True, '587' == 587),
+            keys which are no longer managed are removed when they are still set.
 
-                if proxy.get("password", None):
-                    data["system"]['proxyuserpwd'] = proxy.get("password", None)
+            returns the same structure as config_delta() and
+              drift: {missing: {key: expected}, different: {key: {expected, actual}}, obsolete: {key: actual}}
+        """
+        old_system = (applied or dict()).get("system", {})
+        new_system = data.get("system", {})
 
-                if proxy.get("exclude", None):
-                    data["system"]['proxyexclude'] = proxy.get("exclude", None)
+        added = [k for k in new_system if k not in effective]
+        changed = [
+            k for k in new_system
+            if k in effective and self.__normalize(effective.get(k)) != self.__normalize(new_system.get(k))
+        ]
+        removed = [k for k in old_system if k not in new_system and k in effective]
 
-                if proxy.get("allow_local_remote_servers", None):
-                    data["system"]['allow_local_remote_servers'] = proxy.get("allow_local_remote_servers", None)
+        old_apps = (applied or dict()).get("apps", {})
+        new_apps = data.get("apps", {})
+        app_names = sorted(set(old_apps.keys()) | set(new_apps.keys()))
 
-            trashbin = parameters.get("trashbin")
+        # one 'occ config:list' for all managed apps
+        effective_apps = self.occ_client.app_config(app_names=app_names) if len(app_names) > 0 else dict()
 
-            if trashbin:
-                if trashbin.get("retention_obligation", None):
-                    data["system"]['trashbin_retention_obligation'] = trashbin.get("retention_obligation", None)
+        result = self.__delta(new_system, added, changed, removed, effective_apps, old_apps, new_apps)
 
-            versions = parameters.get("versions")
+        actual = dict(effective)
+        expected = dict(new_system)
 
-            if versions:
-                if versions.get("retention_obligation", None):
-                    data["system"]['versions_retention_obligation'] = versions.get("retention_obligation", None)
+        for app, values in effective_apps.items():
+            actual.update({f"apps.{app}.{k}": v for k, v in values.items()})
 
-            if parameters.get("app_code_checker", None):
-                data["system"]['appcodechecker'] = parameters.get("app_code_checker", None)
+        for app, values in new_apps.items():
+            expected.update({f"apps.{app}.{k}": v for k, v in values.items()})
 
-            update = parameters.get("update")
+        keys = result.get("keys")
 
-            if update:
-                if update.get("checker", None):
-                    data["system"]['updatechecker'] = update.get("checker", None)
+        result["drift"] = dict(
+            missing={k: self.__redact(k, expected.get(k)) for k in keys.get("added")},
+            different={
+                k: dict(
+                    expected=self.__redact(k, expected.get(k)),
+                    actual=self.__redact(k, actual.get(k))
+                ) for k in keys.get("changed")
+            },
+            obsolete={k: self.__redact(k, actual.get(k)) for k in keys.get("removed")}
+        )
 
-                if update.get("server_url", None):
-                    data["system"]['updater.server.url'] = update.get("server_url", None)
+        return result
 
-                if update.get("release_channel", None):
-                    data["system"]['updater.release.channel'] = update.get("release_channel", None)
+    def __delta(self, new_system, added, changed, removed, current_apps, applied_apps, new_apps):
+        """
+            current_apps: app values to compare with
+            applied_apps: the last applied app values, their keys are removed when they are no longer managed
+        """
+        app_added = []
+        app_changed = []
+        app_removed = []
+
+        for app, values in new_apps.items():
+            for key, value in values.items():
+                if key not in current_apps.get(app, {}):
+                    app_added.append((app, key))
+                elif str(current_apps.get(app).get(key)) != value:
+                    app_changed.append((app, key))
+
+        for app, values in applied_apps.items():
+            for key in values:
+                if key not in new_apps.get(app, {}) and key in current_apps.get(app, {}):
+                    app_removed.append((app, key))
+
+        document = dict(
+            system={k: new_system.get(k) for k in added + changed}
+        )
+        previous = dict()
 
-            if parameters.get("has_internet_connection", None):
-                data["system"]['has_internet_connection'] = parameters.get("has_internet_connection", None)
+        for app, key in app_added + app_changed:
+            document.setdefault("apps", dict()).setdefault(app, dict())[key] = new_apps.get(app).get(key)
 
-            checks = parameters.get("checks")
+        for app, key in app_changed + app_removed:
+            previous.setdefault(app, dict())[key] = current_apps.get(app).get(key)
 
-            if checks:
-                if checks.get("connectivity_domains", None):
-                    data["system"]['connectivity_check_domains'] = checks.get("connectivity_domains", None)
+        return dict(
+            document=document,
+            removed=removed,
+            removed_apps=app_removed,
+            previous=previous,
+            keys=dict(
+                added=added + [f"apps.{app}.{key}" for app, key in app_added],
+                changed=changed + [f"apps.{app}.{key}" for app, key in app_changed],
+                removed=removed + [f"apps.{app}.{key}" for app, key in app_removed]
+            )
+        )
 
-                if checks.get("working_wellknown_setup", None):
-                    data["system"]['check_for_working_wellknown_setup'] = checks.get("working_wellknown_setup", None)
+    def config_opts(self):
+        """
+            renders the system config from 'trusted_domains', 'config_parameters'
+            and 'database' (see SYSTEM_CONFIG and DATABASE_CONFIG) and the
+            app config from 'app_config'
 
-                if checks.get("working_htaccess", None):
-                    data["system"]['check_for_working_htaccess'] = checks.get("working_htaccess", None)
+            returns (data, errors)
+        """
+        data = dict(
+            system=dict()
+        )
 
-                if checks.get("data_directory_permissions", None):
-                    data["system"]['check_data_directory_permissions'] = checks.get("data_directory_permissions", None)
+        if validate(self.trusted_domains):
+            data["system"]['trusted_domains'] = self.trusted_domains
 
-            if parameters.get("config_is_read_only", None):
-                data["system"]['config_is_read_only'] = parameters.get("config_is_read_only", None)
+        system, system_errors = self.system_schema.render(self.config_parameters)
+        database, database_errors = self.database_schema.render(self.database)
 
-            logging = parameters.get("logging")
+        data["system"].update(system)
+        data["system"].update(database)
 
-            if logging:
-                if logging.get("type", None):
-                    data["system"]['log_type'] = logging.get("type", None)
+        apps, app_errors = self.app_config_opts()
 
-                if logging.get("type_audit", None):
-                    data["system"]['log_type_audit'] = logging.get("type_audit", None)
+        if len(apps) > 0:
+            data["apps"] = apps
 
-                if logging.get("file", None):
-                    data["system"]['logfile'] = logging.get("file", None)
+        return (data, system_errors + database_errors + app_errors)
 
-                if logging.get("logfile_audit", None):
-                    data["system"]['logfile_audit'] = logging.get("logfile_audit", None)
+    def app_config_opts(self):
+        """
+            app config values are stored as strings, booleans as 'yes' / 'no'
 
-                if logging.get("filemode", None):
-                    data["system"]['logfilemode'] = logging.get("filemode", None)
+            returns (apps, errors)
+        """
+        apps = dict()
+        errors = []
 
-                if logging.get("level", None):
-                    data["system"]['loglevel'] = logging.get("level", None)
+        for app, values in (self.app_config or {}).items():
+            if not isinstance(values, dict):
+                errors.append(f"app_config.{app}: expected a dictionary, got '{values}'")
+                continue
 
-                if logging.get("level_frontend", None):
-                    data["system"]['loglevel_frontend'] = logging.get("level_frontend", None)
+            for key, value in values.items():
+                if value is None:
+                    continue
 
-                if logging.get("syslog_tag", None):
-                    data["system"]['syslog_tag'] = logging.get("syslog_tag", None)
+                if isinstance(value, bool):
+                    value = "yes" if value else "no"
+                elif isinstance(value, (dict, list)):
+                    value = json.dumps(value, separators=(",", ":"))
 
-                if logging.get("syslog_tag_audit", None):
-                    data["system"]['syslog_tag_audit'] = logging.get("syslog_tag_audit", None)
+                apps.setdefault(app, dict())[key] = str(value)
 
-                condition = logging.get("condition", {})
+        return (apps, errors)
 
-                if condition:
-                    dictList = {}
-                    for key, value in condition.items():
-                        dictList[key] = value
-                    data["system"]['log.condition'] = dictList
+    def create_diff(self, old_data, data):
+        """
+            structured difference in one recursive pass, secrets are redacted
 
-                if logging.get("dateformat", None):
-                    data["system"]['logdateformat'] = logging.get("dateformat", None)
+            returns
+              patch: RFC 6902 JSON Patch from the old to the new configuration
+              summary: {added, changed, removed} system keys and apps.<app>.<key>
+        """
+        patch = []
 
-                if logging.get("timezone", None):
-                    data["system"]['logtimezone'] = logging.get("timezone", None)
+        # both sections exist in both documents, a missing 'apps' section is no change
+        old_data = old_data or dict()
+        old_data = dict(system=old_data.get("system", {}), apps=old_data.get("apps", {}))
+        data = dict(system=data.get("system", {}), apps=data.get("apps", {}))
 
-                if logging.get("query", None):
-                    data["system"]['log_query'] = logging.get("query", None)
+        self.__json_patch(old_data, data, [], patch)
 
-                if logging.get("rotate_size", None):
-                    data["system"]['log_rotate_size'] = logging.get("rotate_size", None)
+        summary = dict(added=[], changed=[], removed=[])
 
-            if parameters.get("profiler", None):
-                data["system"]['profiler'] = parameters.get("profiler", None)
+        for operation in patch:
+            # /system/<key>/... or /apps/<app>/<key>
+            parts = [x.replace("~1", "/").replace("~0", "~") for x in operation.get("path").split("/")]
+            depth = 4 if parts[1] == "apps" else 3
 
-            customclient = parameters.get("customclient")
+            if len(parts) > depth or operation.get("op") == "replace":
+                state = "changed"
+            else:
+                state = "added" if operation.get("op") == "add" else "removed"
 
-            if customclient:
-                if customclient.get("desktop", None):
-                    data["system"]['customclient_desktop'] = customclient.get("desktop", None)
+            if parts[1] != "apps":
+                keys = [parts[2]]
+            elif len(parts) > 3:
+                keys = [f"apps.{parts[2]}.{parts[3]}"]
+            else:
+                # a complete app is added or removed, one entry per key
+                values = operation.get("value") if state == "added" else old_data["apps"].get(parts[2])
+                keys = [f"apps.{parts[2]}.{x}" for x in values]
 
-                if customclient.get("android", None):
-                    data["system"]['customclient_android'] = customclient.get("android", None)
+            summary[state] += [x for x in keys if x not in summary[state]]
 
-                if customclient.get("ios", None):
-                    data["system"]['customclient_ios'] = customclient.get("ios", None)
+        return dict(
+            patch=patch,
+            summary=summary
+        )
 
-                if customclient.get("ios_appid", None):
-                    data["system"]['customclient_ios_appid'] = customclient.get("ios_appid", None)
+    def __json_patch(self, old, new, path, patch):
+        """
+        """
+        if isinstance(old, dict) and isinstance(new, dict):
+            for key in old:
+                if key not in new:
+                    patch.append(dict(op="remove", path=self.__pointer(path + [key])))
+
+            for key, value in new.items():
+                if key not in old:
+                    patch.append(dict(op="add", path=self.__pointer(path + [key]), value=self.__redact_path(path + [key], value)))
+                else:
+                    self.__json_patch(old.get(key), value, path + [key], patch)
 
-            apps = parameters.get("apps")
+        elif isinstance(old, list) and isinstance(new, list):
+            for index, value in enumerate(new[:len(old)]):
+                self.__json_patch(old[index], value, path + [index], patch)
 
-            # self.module.log(f" apps       : {apps}")
+            for index, value in enumerate(new[len(old):], start=len(old)):
+                patch.append(dict(op="add", path=self.__pointer(path + [index]), value=self.__redact_path(path + [index], value)))
 
-            if apps:
-                if apps.get("store", {}).get("enabled", None):
-                    data["system"]['appstoreenabled'] = apps.get("store", {}).get("enabled", None)
+            # from the end, every removal shifts the following indexes
+            for index in range(len(old) - 1, len(new) - 1, -1):
+                patch.append(dict(op="remove", path=self.__pointer(path + [index])))
 
-                if apps.get("store", {}).get("url", None):
-                    data["system"]['appstoreurl'] = apps.get("store", {}).get("url", None)
+        elif old != new or type(old) is not type(new):
+            patch.append(dict(op="replace", path=self.__pointer(path), value=self.__redact_path(path, new)))
 
-                if apps.get("allowlist", None):
-                    data["system"]['appsallowlist'] = apps.get("allowlist", None)
+    def __pointer(self, path):
+        """
+            RFC 6901 JSON Pointer
+        """
+        return "".join(f"/{str(x).replace('~', '~0').replace('/', '~1')}" for x in path)
 
-                if apps.get("paths", None):
-                    data["system"]['apps_paths'] = apps.get("paths", None)
+    def __redact_path(self, path, value):
+        """
+        """
+        for key in path:
+            if isinstance(key, str) and self.__secret(key):
+                return self.__redact(key, value)
 
-            image_previews = parameters.get("image_previews")
+        return self.__redact(path[-1] if path else "", value)
 
-            if image_previews:
-                if image_previews.get("enabled", None):
-                    data["system"]['enable_previews'] = image_previews.get("enabled", None)
+    def occ_validate(self):
+        """
+            sudo -u www-data php occ status
 
-                if image_previews.get("concurrency", {}).get("all", None):
-                    data["system"]['preview_concurrency_all'] = image_previews.get("concurrency", {}).get("all", None)
+            boots Nextcloud with the current configuration files
+        """
+        self.occ_client.invalidate()
 
-                if image_previews.get("concurrency", {}).get("new", None):
-                    data["system"]['preview_concurrency_new'] = image_previews.get("concurrency", {}).get("new", None)
+        rc, out, err = self.occ_client.exec(["status", "--no-ansi", "--output", "json"])
 
-                if image_previews.get("max_x", None):
-                    data["system"]['preview_max_x'] = image_previews.get("max_x", None)
+        if rc != 0:
+            err = self.occ_client.exception_message(out) or err
 
-                if image_previews.get("max_y", None):
-                    data["system"]['preview_max_y'] = image_previews.get("max_y", None)
+        return rc, err
 
-                if image_previews.get("max_filesize_image", None):
-                    data["system"]['preview_max_filesize_image'] = image_previews.get("max_filesize_image", None)
+    def occ_delete_system_config(self, key):
+        """
+            sudo -u www-data php occ config:system:delete trusted_domains
+        """
+        args = []
+        args.append("config:system:delete")
+        args.append("--no-ansi")
+        args.append(key)
 
-                if image_previews.get("max_memory", None):
-                    data["system"]['preview_max_filesize_image'] = image_previews.get("max_memory", None)
+        rc, out, err = self.occ_client.exec(args)
 
-                if image_previews.get("preview_max_memory", None):
-                    data["system"]['preview_max_filesize_image'] = image_previews.get("preview_max_memory", None)
+        return rc, out, err
 
-                if image_previews.get("libreoffice_path", None):
-                    data["system"]['preview_libreoffice_path'] = image_previews.get("libreoffice_path", None)
+    def occ_delete_app_config(self, app, key):
+        """
+            sudo -u www-data php occ config:app:delete files_antivirus av_mode
+        """
+        args = []
+        args.append("config:app:delete")
+        args.append("--no-ansi")
+        args.append(app)
+        args.append(key)
 
-                if image_previews.get("office_cl_parameters", None):
-                    data["system"]['preview_office_cl_parameters'] = " ".join(image_previews.get("office_cl_parameters", None))
+        rc, out, err = self.occ_client.exec(args)
 
-                if image_previews.get("ffmpeg_path", None):
-                    data["system"]['preview_ffmpeg_path'] = image_previews.get("ffmpeg_path", None)
+        return rc, out, err
 
-                if image_previews.get("preview_imaginary_url", None):
-                    data["system"]['preview_libreoffice_path'] = image_previews.get("imaginary_url", None)
+    def occ_import_document(self, document):
+        """
+            the document is written to a temporary file in config/, which
+            is removed after the import
+        """
+        import_file = self.writer.temporary(
+            self.nc_config_directory,
+            self.__render_config(document),
+            prefix=".ansible-import.",
+            suffix=".json"
+        )
 
-            memcache = parameters.get("memcache")
+        try:
+            return self.occ_import(import_file)
+        finally:
+            os.remove(import_file)
 
-            if memcache:
-                if memcache.get("local", None):
-                    data["system"]['memcache.local'] = memcache.get("local", None)
+    def occ_import(self, config_file):
+        """
+            sudo -u www-data php occ config:import config/ansible.json
+        """
+        args = []
+        args.append("config:import")
+        args.append(config_file)
+        args.append("--no-ansi")
 
-                if memcache.get("distributed", None):
-                    data["system"]['memcache.distributed'] = memcache.get("distributed", None)
+        # self.module.log(msg=f" args: '{args}'")
 
-                if memcache.get("locking", None):
-                    data["system"]['memcache.locking'] = memcache.get("locking", None)
+        rc, out, err = self.occ_client.exec(args)
 
-                memcache_servers = memcache.get("servers", [])
+        return rc, out, err
 
-                if memcache_servers:
-                    memchache_array = [list(x.values()) for x in memcache_servers]
-                    data["system"]['memcached_servers'] = memchache_array
+    def __values_as_string(self, values):
+        """
+        """
+        result = {}
+        # self.module.log(msg=f"{json.dumps(values, indent=2, sort_keys=False)}")
 
-                if memcache.get("options", None):
-                    data["system"]['memcached_options'] = memcache.get("options", None)
+        if isinstance(values, dict):
+            for k, v in sorted(values.items()):
+                if isinstance(v, bool):
+                    v = str(v).lower()
+                result[k] = str(v)
 
-            redis = parameters.get("redis")
+        # self.module.log(msg=f"{json.dumps(result, indent=2, sort_keys=False)}")
 
-            # TODO
-            # no array .. only single entry
-            if redis:
-                redis_array = []
-                for r in redis:
-                    a = {}
-                    if r.get("host", None):
-                        a["host"] = r.get("host", None)
-                    if r.get("port", None):
-                        a["port"] = r.get("port", None)
-                    if r.get("timeout", None):
-                        a["timeout"] = r.get("timeout", None)
-                    if r.get("password", None):
-                        a["password"] = r.get("password", None)
-                    if r.get("dbindex", None):
-                        a["dbindex"] = r.get("dbindex", None)
+        return result
 
-                    redis_array.append(a)
-                data["system"]["redis"] = redis_array
+    def __normalize(self, value):
+        """
+            comparable form of a config value
+        """
+        if isinstance(value, dict):
+            # a php list with explicit keys
+            if list(value.keys()) == [str(x) for x in range(len(value))] or list(value.keys()) == list(range(len(value))):
+                return [self.__normalize(x) for x in value.values()]
 
-        if self.database:
-            parameters = self.database
+            return {str(k): self.__normalize(v) for k, v in value.items()}
 
-            if parameters.get("type", None) == "mysql":
-                if parameters.get("mysql", {}).get("utf8mb4", None):
-                    data["system"]['mysql.utf8mb4'] = parameters.get("mysql", {}).get("utf8mb4", None)
+        if isinstance(value, (list, tuple)):
+            return [self.__normalize(x) for x in value]
 
-                if parameters.get("mysql", {}).get("collation", None):
-                    data["system"]['mysql.collation'] = parameters.get("mysql", {}).get("collation", None)
+        if isinstance(value, str):
+            if value.lower() in ["true", "false"]:
+                return value.lower() == "true"
 
-                if parameters.get("username", None):
-                    data["system"]['dbuser'] = parameters.get("username", None)
+            if re.match(r"^-?(0|[1-9][0-9]*)$", value):
+                return int(value)
 
-                if parameters.get("password", None):
-                    data["system"]['dbpassword'] = parameters.get("password", None)
+            if re.match(r"^-?[0-9]+\.[0-9]+$", value):
+                return float(value)
 
-                if parameters.get("hostname", None):
-                    data["system"]['dbhost'] = parameters.get("hostname", None)
+        return value
 
-                if parameters.get("port", None):
-                    data["system"]['dbport'] = parameters.get("port", None)
+    def __redact(self, key, value):
+        """
+            hide passwords and secrets in the drift report
+        """
+        if self.__secret(key):
+            return "********" if value not in [None, ""] else value
 
-                if parameters.get("schema", None):
-                    data["system"]['dbname'] = parameters.get("schema", None)
+        if isinstance(value, dict):
+            return {k: self.__redact(k, v) for k, v in value.items()}
 
-                if parameters.get("tableprefix", None):
-                    data["system"]['dbtableprefix'] = parameters.get("tableprefix", None)
+        if isinstance(value, list):
+            return [self.__redact(key, x) for x in value]
 
-            if parameters.get("type", None) == "sqlite3":
-                if parameters.get("sqlite", {}).get("journal_mode", None):
-                    data["system"]['sqlite.journal_mode'] = parameters.get("sqlite", {}).get("journal_mode", None)
+        return value
 
+    def __secret(self, key):
         """
-
         """
+        return any(x in str(key).lower() for x in ["password", "passwd", "pwd", "secret", "salt"])
 
-        return data
-
-    def create_diff(self, config_file, data):
+    def __render_config(self, data):
         """
         """
-        old_data = dict()
-
-        if os.path.isfile(config_file):
-            with open(config_file) as json_file:
-                old_data = json.load(json_file)
-
-        side_by_side = SideBySide(self.module, old_data, data)
-        diff_side_by_side = side_by_side.diff(width=140, left_title="  Original", right_title="  Update")
+        json_data = json.dumps(data, indent=2, sort_keys=False)
 
-        return diff_side_by_side
+        return f'{json_data}\n'
 
-    def occ_check(self):
+    def __check_installed(self):
         """
-            sudo -u www-data php occ check
+            returns None or the result, when Nextcloud is not installed
         """
-        # self.module.log(msg="occ_check()")
-
-        installed = False
+        if not self.occ_client.available():
+            return dict(
+                failed=True,
+                changed=False,
+                msg="missing occ"
+            )
 
-        args = []
-        args += self.occ_base_args
+        rc, installed, out, err = self.occ_client.check(check_installed=True)
 
-        args.append("check")
-        args.append("--no-ansi")
+        if not installed and rc == 1:
+            return dict(
+                failed=False,
+                changed=False,
+                msg=out
+            )
 
-        # self.module.log(msg=f" args: '{args}'")
+        os.chdir(self.working_dir)
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        return None
 
+    def __render_php_config(self, values):
         """
-            not installed: "Nextcloud is not installed - only a limited number of commands are available"
-            installed: ''
+            same format as var_export()
         """
-        # self.module.log(msg=f" rc : '{rc}'")
-        # self.module.log(msg=f" out: '{out.strip()}'")
-        # self.module.log(msg=f" err: '{err.strip()}'")
-
-        if rc == 0:
-            pattern = re.compile(r"Nextcloud is not installed.*", re.MULTILINE)
-            # installed_out = re.search(pattern_1, out)
-            is_installed = re.search(pattern, err)
-
-            # self.module.log(msg=f" out: '{installed_out}'")
-            # self.module.log(msg=f" err: '{is_installed}' {type(is_installed)}")
-
-            if is_installed:
-                installed = False
-            else:
-                installed = True
-
-        else:
-            err = out.strip()
-
-            pattern = re.compile(r"An unhandled exception has been thrown:\n(?P<exception>.*)\n.*", re.MULTILINE)
-            exception = re.search(pattern, err)
-
-            if exception:
-                err = exception.group("exception")
-
-        # self.module.log(msg=f"{rc} '{installed}' '{out}' '{err}'")
+        lines = [
+            "<?php",
+            "// managed by ansible, local changes will be overwritten",
+            f"$CONFIG = {self.__php_value(values, 0)};",
+            ""
+        ]
 
-        return (rc, installed, out, err)
+        return "\n".join(lines)
 
-    def occ_status(self):
+    def __php_value(self, value, level):
         """
-            sudo -u www-data php occ status
         """
-        # version_string = None
+        indent = "  " * (level + 1)
 
-        args = []
-        args += self.occ_base_args
+        if isinstance(value, bool):
+            return "true" if value else "false"
 
-        args.append("status")
-        args.append("--no-ansi")
-
-        # self.module.log(msg=f" args: '{args}'")
-
-        rc, out, err = self.__exec(args, check_rc=False)
-
-        if rc != 0:
-            err = out.strip()
-
-            pattern = re.compile(r"An unhandled exception has been thrown:\n(?P<exception>.*).*", re.MULTILINE)
-            exception = re.search(pattern, err)
-
-            if exception:
-                err = exception.group("exception")
+        if value is None:
+            return "null"
 
-        return rc, err
+        if isinstance(value, (int, float)):
+            return str(value)
 
-    def occ_import(self, config_file):
-        """
-            sudo -u www-data php occ config:import config/ansible.json
-        """
-        args = []
-        args += self.occ_base_args
+        if isinstance(value, (list, tuple)):
+            value = {i: v for i, v in enumerate(value)}
 
-        args.append("config:import")
-        args.append(config_file)
-        args.append("--no-ansi")
+        if isinstance(value, dict):
+            items = [
+                f"{indent}{self.__php_value(k, level + 1) if not isinstance(k, int) else k} => {self.__php_value(v, level + 1)},"
+                for k, v in value.items()
+            ]
 
-        # self.module.log(msg=f" args: '{args}'")
+            return "\n".join(["array ("] + items + [f"{'  ' * level})"])
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        value = str(value).replace("\\", "\\\\").replace("'", "\\'")
 
-        return rc, out, err
+        return f"'{value}'"
 
-    def __values_as_string(self, values):
+    def __read_file(self, file_name):
         """
+            returns the content or None
         """
-        result = {}
-        # self.module.log(msg=f"{json.dumps(values, indent=2, sort_keys=False)}")
+        try:
+            with open(file_name) as fp:
+                return fp.read()
+        except (OSError, UnicodeDecodeError):
+            return None
 
-        if isinstance(values, dict):
-            for k, v in sorted(values.items()):
-                if isinstance(v, bool):
-                    v = str(v).lower()
-                result[k] = str(v)
-
-        # self.module.log(msg=f"{json.dumps(result, indent=2, sort_keys=False)}")
-
-        return result
-
-    def __write_config(self, file_name, data):
+    def __load_json(self, content):
         """
         """
-        with open(file_name, 'w') as fp:
-            json_data = json.dumps(data, indent=2, sort_keys=False)
-            fp.write(f'{json_data}\n')
+        try:
+            return json.loads(content) if content else None
+        except ValueError:
+            return None
 
-    def __exec(self, commands, check_rc=True):
+    def __checksum(self, content):
         """
         """
-        rc, out, err = self.module.run_command(commands, cwd=self.working_dir, check_rc=check_rc)
+        if content is None:
+            return None
 
-        # self.module.log(msg=f"  rc : '{rc}'")
-        if rc != 0:
-            self.module.log(msg=f"cmd: '{commands}'")
-            self.module.log(msg=f"  out: '{out}')")
-            self.module.log(msg=f"  err: '{err}')")
-
-        return rc, out, err
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
     def __file_state(self, file_name):
         """
@@ -946,20 +1033,39 @@ def main():
             required=False,
             type=dict
         ),
+        app_config=dict(
+            required=False,
+            type=dict
+        ),
         diff_output=dict(
             required=False,
             type='bool',
             default=False
         ),
+        drift_detection=dict(
+            required=False,
+            type='bool',
+            default=False
+        ),
+        split_config=dict(
+            required=False,
+            type='bool',
+            default=False
+        ),
+        trace_file=dict(
+            required=False,
+            type=str
+        ),
     )
 
     module = AnsibleModule(
         argument_spec=specs,
-        supports_check_mode=False,
+        supports_check_mode=True,
     )
 
     kc = NextcloudClient(module)
     result = kc.run()
+    result.update(kc.occ_client.timings.result())
 
     # module.log(msg=f"= result : '{result}'")
 
@@ -8,11 +8,11 @@
 from __future__ import absolute_import, print_function
 import os
 import re
-import json
 import pwd
 import grp
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.nextcloud_occ_client import OccClient
 from ansible_collections.bodsch.core.plugins.module_utils.module_results import results
 
 __metaclass__ = type
@@ -37,21 +37,15 @@ class NextcloudGroups(object):
         self.groups = module.params.get("groups")
         self.working_dir = module.params.get("working_dir")
         self.owner = module.params.get("owner")
+        self.state_cache_ttl = module.params.get("state_cache_ttl")
+        self.trace_file = module.params.get("trace_file")
 
-        self.occ_base_args = [
-            "sudo",
-            "--user",
-            self.owner,
-            "php",
-            "occ"
-        ]
+        self.occ_client = OccClient(module, working_dir=self.working_dir, owner=self.owner, cache_ttl=self.state_cache_ttl, trace_file=self.trace_file)
 
     def run(self):
         """
         """
-        self._occ = os.path.join(self.working_dir, 'occ')
-
-        if not os.path.exists(self._occ):
+        if not self.occ_client.available():
             return dict(
                 failed=True,
                 changed=False,
@@ -60,7 +54,7 @@ class NextcloudGroups(object):
 
         os.chdir(self.working_dir)
 
-        rc, installed, out, err = self.occ_check(check_installed=True)
+        rc, installed, out, err = self.occ_client.check(check_installed=True)
 
         if not installed and rc == 1:
             return dict(
@@ -69,106 +63,187 @@ class NextcloudGroups(object):
                 msg=out
             )
 
-        self.existing_groups = self.occ_list_groups()
+        # one snapshot of all groups (with display name and members) for the whole run
+        self.existing_groups = self.occ_client.list_groups(info=True)
+        self.existing_users = None
+        self.group_members = None
 
-        result_state = []
+        groups = dict()
 
-        if self.groups:
-            for group in self.groups:
-                group_state = group.get("state", "present")
-                group_name = group.get("name", None)
-                group_display_name = group.get("display_name", None)
-
-                if group_name:
-                    res = {}
-                    if group_state == "present":
-                        if group_name in self.existing_groups:
-                            res[group_name] = dict(
-                                changed=False,
-                                msg="The group has already been created."
-                            )
-                        else:
-                            res[group_name] = self.occ_create_group(name=group_name, display_name=group_display_name)
-                    else:
-                        if group_name in self.existing_groups:
-                            res[group_name] = self.occ_remove_group(name=group_name)
-                        else:
-                            res[group_name] = dict(
-                                changed=False,
-                                msg="The group does not exist (anymore)."
-                            )
+        for group in self.groups or []:
+            group_name = group.get("name", None)
 
-                    result_state.append(res)
+            if group_name:
+                groups[group_name] = group
 
-                else:
-                    pass
+        plan = self.plan(groups)
+
+        # self.module.log(msg=f" plan: {plan}")
+
+        result_state = self.apply(groups, plan)
 
         _state, _changed, _failed, state, changed, failed = results(self.module, result_state)
 
         result = dict(
             changed=_changed,
             failed=False,
-            state=result_state
+            state=result_state,
+            plan=plan
         )
 
         return result
 
-    def occ_check(self, check_installed=False):
+    def plan(self, groups):
         """
-            sudo -u www-data php occ check
+            compare the configured groups with the snapshot
+
+            returns a dictionary with all necessary changes:
+              create, delete: list of group names
+              display_name: group name -> new display name
+              add_members, remove_members, invalid_members: group name -> list of users
         """
-        # self.module.log(msg=f"occ_check({check_installed})")
+        plan = dict(
+            create=[],
+            delete=[],
+            display_name=dict(),
+            add_members=dict(),
+            remove_members=dict(),
+            invalid_members=dict(),
+        )
 
-        args = []
-        args += self.occ_base_args
+        existing_users = None
 
-        args.append("check")
-        args.append("--no-ansi")
-        args.append("--output")
-        args.append("json")
+        for group_name, group in groups.items():
+            group_exists = group_name in self.existing_groups
+            current = self.existing_groups.get(group_name) or dict()
+
+            if group.get("state", "present") != "present":
+                if group_exists:
+                    plan["delete"].append(group_name)
+
+                continue
+
+            display_name = group.get("display_name", None)
+
+            if not group_exists:
+                plan["create"].append(group_name)
+            elif display_name and display_name != current.get("displayName", group_name):
+                plan["display_name"][group_name] = display_name
+
+            members = group.get("members", None)
+
+            if members is None:
+                continue
+
+            members = set(members)
+            current_members = set(self.__group_members(group_name)) if group_exists else set()
+
+            if existing_users is None:
+                # only read when a group has members
+                existing_users = set(self.__existing_users())
+
+            # users that do not exist are skipped
+            members_invalid = members - existing_users
+            members_missing = (members & existing_users) - current_members
+
+            if members_invalid:
+                plan["invalid_members"][group_name] = sorted(members_invalid)
+            if members_missing:
+                plan["add_members"][group_name] = sorted(members_missing)
 
-        # self.module.log(msg=f" args: '{args}'")
+            if group.get("exclusive", False):
+                members_removing = current_members - members
 
-        rc, out, err = self.__exec(args, check_rc=False)
+                if members_removing:
+                    plan["remove_members"][group_name] = sorted(members_removing)
 
+        return plan
+
+    def apply(self, groups, plan):
         """
-            not installed: "Nextcloud is not installed - only a limited number of commands are available"
-            installed: ''
+            execute the plan, in check mode only describe it
         """
-        # self.module.log(msg=f" rc : '{rc}'")
-        # self.module.log(msg=f" out: '{out.strip()}'")
-        # self.module.log(msg=f" err: '{err.strip()}'")
+        check_mode = self.module.check_mode
+        result_state = []
 
-        if not check_installed:
-            return rc, out, err
+        create = set(plan.get("create"))
+        delete = set(plan.get("delete"))
+
+        for group_name, group in groups.items():
+            res = {}
+
+            if group.get("state", "present") != "present":
+                if group_name not in delete:
+                    res[group_name] = dict(
+                        changed=False,
+                        msg="The group does not exist (anymore)."
+                    )
+                elif check_mode:
+                    res[group_name] = dict(
+                        changed=True,
+                        msg="The group would be removed."
+                    )
+                else:
+                    res[group_name] = self.occ_remove_group(name=group_name)
 
-        installed = False
+                result_state.append(res)
+                continue
 
-        if rc == 0:
-            pattern = re.compile(r"Nextcloud is not installed.*", re.MULTILINE)
-            # installed_out = re.search(pattern_1, out)
-            is_installed = re.search(pattern, err)
+            if group_name in create:
+                if check_mode:
+                    res[group_name] = dict(
+                        changed=True,
+                        msg="The group would be created."
+                    )
+                else:
+                    res[group_name] = self.occ_create_group(name=group_name, display_name=group.get("display_name", None))
+            else:
+                res[group_name] = dict(
+                    changed=False,
+                    msg="The group has already been created."
+                )
+
+            if res[group_name].get("failed", False) or (group_name in create and not res[group_name].get("changed", False)):
+                result_state.append(res)
+                continue
+
+            display_name = plan["display_name"].get(group_name, None)
+
+            if display_name:
+                if not self.occ_client.action_available("group:displayname"):
+                    # occ has no command for it, the group itself is fine
+                    res[group_name]["msg"] += " The display name can only be changed with the occ worker (nextcloud_occ_worker), skipped."
+                elif check_mode:
+                    res[group_name]["msg"] += f" The display name would be changed to '{display_name}'."
+                    res[group_name]["changed"] = True
+                else:
+                    display_name_result = self.occ_group_display_name(name=group_name, display_name=display_name)
+                    res[group_name]["msg"] += f" {display_name_result.get('msg')}"
 
-            # self.module.log(msg=f" out: '{installed_out}'")
-            # self.module.log(msg=f" err: '{is_installed}' {type(is_installed)}")
+                    if display_name_result.get("failed", False):
+                        res[group_name]["failed"] = True
+                    else:
+                        res[group_name]["changed"] = True
 
-            if is_installed:
-                installed = False
-            else:
-                installed = True
+            members_missing = plan["add_members"].get(group_name, [])
+            members_removing = plan["remove_members"].get(group_name, [])
+            members_invalid = plan["invalid_members"].get(group_name, [])
 
-        else:
-            err = out.strip()
+            if check_mode:
+                _added = members_missing
+                _removed = members_removing
+            else:
+                _added = [x for x in members_missing if self.occ_add_member(name=group_name, username=x)]
+                _removed = [x for x in members_removing if self.occ_remove_member(name=group_name, username=x)]
 
-            pattern = re.compile(r"An unhandled exception has been thrown:\n(?P<exception>.*)\n.*", re.MULTILINE)
-            exception = re.search(pattern, err)
+            if len(_added) > 0 or len(_removed) > 0:
+                res[group_name]["changed"] = True
 
-            if exception:
-                err = exception.group("exception")
+            res[group_name]["msg"] += self.__member_message(_added, _removed, members_invalid)
 
-        # self.module.log(msg=f"{rc} '{installed}' '{out}' '{err}'")
+            result_state.append(res)
 
-        return (rc, installed, out, err)
+        return result_state
 
     def occ_create_group(self, name, display_name=None):
         """
@@ -183,8 +258,6 @@ class NextcloudGroups(object):
         _changed = False
 
         args = []
-        args += self.occ_base_args
-
         args.append("group:add")
         args.append("--no-ansi")
         # args.append("--output")
@@ -198,7 +271,7 @@ class NextcloudGroups(object):
 
         self.module.log(msg=f" args: '{args}'")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         # self.module.log(msg=f" rc : '{rc}'")
         # self.module.log(msg=f" out: {type(out)} - '{out.strip()}'")
@@ -251,15 +324,13 @@ class NextcloudGroups(object):
         _changed = False
 
         args = []
-        args += self.occ_base_args
-
         args.append("group:delete")
         args.append("--no-ansi")
         args.append(name)
 
         self.module.log(msg=f" args: '{args}'")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         # self.module.log(msg=f" rc : '{rc}'")
         # self.module.log(msg=f" out: {type(out)} - '{out.strip()}'")
@@ -300,25 +371,90 @@ class NextcloudGroups(object):
             msg=_msg
         )
 
-    def occ_list_groups(self):
+    def occ_group_display_name(self, name, display_name):
+        """
+            occ has no command to change the display name of a group, the occ worker does it
+        """
+        self.module.log(msg=f"occ_group_display_name({name}, {display_name})")
+
+        rc, out, err = self.occ_client.action("group:displayname", group=name, display_name=display_name)
+
+        if rc == 0:
+            return dict(
+                failed=False,
+                changed=True,
+                msg=f"The display name was changed to '{display_name}'."
+            )
+
+        return dict(
+            failed=True,
+            changed=False,
+            msg=(out + err).strip()
+        )
+
+    def occ_add_member(self, name, username):
         """
+            sudo -u www-data php occ group:adduser --no-ansi "foo" "bar"
         """
         args = []
-        args += self.occ_base_args
+        args.append("group:adduser")
+        args.append("--no-ansi")
+        args.append(name)
+        args.append(username)
+
+        rc, out, err = self.occ_client.exec(args)
 
-        args.append("group:list")
+        return rc == 0
+
+    def occ_remove_member(self, name, username):
+        """
+            sudo -u www-data php occ group:removeuser --no-ansi "foo" "bar"
+        """
+        args = []
+        args.append("group:removeuser")
         args.append("--no-ansi")
-        args.append("--output")
-        args.append("json")
+        args.append(name)
+        args.append(username)
 
-        self.module.log(msg=f" args: '{args}'")
+        rc, out, err = self.occ_client.exec(args)
+
+        return rc == 0
+
+    def __group_members(self, group_name):
+        """
+            older versions of 'group:list --info' have no members
+        """
+        info = self.existing_groups.get(group_name) or dict()
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        if isinstance(info, dict) and "users" in info:
+            return info.get("users") or []
 
-        out = json.loads(out)
+        if self.group_members is None:
+            self.group_members = self.occ_client.list_groups()
 
-        group_names = [x for x, _ in out.items()]
-        return group_names
+        return self.group_members.get(group_name) or []
+
+    def __existing_users(self):
+        """
+        """
+        if self.existing_users is None:
+            self.existing_users = self.occ_client.list_users()
+
+        return self.existing_users
+
+    def __member_message(self, added, removed, skipped):
+        """
+        """
+        msg = ""
+
+        if len(added) > 0:
+            msg += f" Added member(s): {', '.join(added)}."
+        if len(removed) > 0:
+            msg += f" Removed member(s): {', '.join(removed)}."
+        if len(skipped) > 0:
+            msg += f" Unknown user(s) skipped: {', '.join(skipped)}."
+
+        return msg
 
     def __file_state(self, file_name):
         """
@@ -346,22 +482,6 @@ class NextcloudGroups(object):
 
         return current_owner, current_group, current_mode
 
-    def __exec(self, commands, check_rc=True):
-        """
-        """
-        rc, out, err = self.module.run_command(commands, cwd=self.working_dir, check_rc=check_rc)
-
-        # self.module.log(msg=f"  rc : '{rc}'")
-        if rc != 0:
-            self.module.log(msg=f"cmd: '{commands}'")
-            self.module.log(msg=f"  rc : '{rc}'")
-            self.module.log(msg=f"  out: '{out}'")
-            self.module.log(msg=f"  err: '{err}'")
-            for line in err.splitlines():
-                self.module.log(msg=f"   {line}")
-
-        return rc, out, err
-
 
 def main():
     """
@@ -381,15 +501,25 @@ def main():
             type=str,
             default="www-data"
         ),
+        state_cache_ttl=dict(
+            required=False,
+            type=int,
+            default=0
+        ),
+        trace_file=dict(
+            required=False,
+            type=str
+        ),
     )
 
     module = AnsibleModule(
         argument_spec=specs,
-        supports_check_mode=False,
+        supports_check_mode=True,
     )
 
     kc = NextcloudGroups(module)
     result = kc.run()
+    result.update(kc.occ_client.timings.result())
 
     module.log(msg=f"= result : '{result}'")
 
@@ -8,12 +8,12 @@
 from __future__ import absolute_import, print_function
 import os
 import re
-import json
 import pwd
 import grp
 import shutil
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.nextcloud_occ_client import OccClient
 
 
 __metaclass__ = type
@@ -42,23 +42,17 @@ class NextcloudClient(object):
         self.working_dir = module.params.get("working_dir")
         self.data_dir = module.params.get("data_dir")
         self.owner = module.params.get("owner")
+        self.trace_file = module.params.get("trace_file")
         self.database = module.params.get("database")
         self.admin = module.params.get("admin")
 
-        self.occ_base_args = [
-            "sudo",
-            "--user",
-            self.owner,
-            "php",
-            "occ"
-        ]
+        # install and upgrade always need a fresh bootstrap
+        self.occ_client = OccClient(module, working_dir=self.working_dir, owner=self.owner, use_worker=False, trace_file=self.trace_file)
 
     def run(self):
         """
         """
-        self._occ = os.path.join(self.working_dir, 'occ')
-
-        if not os.path.exists(self._occ):
+        if not self.occ_client.available():
             return dict(
                 failed=True,
                 changed=False,
@@ -150,17 +144,15 @@ class NextcloudClient(object):
         """
         self.module.log(msg=f"occ_check(check_installed={check_installed})")
 
-        args = []
-        args += self.occ_base_args
+        if check_installed:
+            # config.php and version.php are enough to answer this question
+            state = self.occ_client.installation_state()
 
-        args.append("check")
-        args.append("--no-ansi")
-        args.append("--output")
-        args.append("json")
-
-        # self.module.log(msg=f" args: '{args}'")
+            if state and not state.get("maintenance") and not state.get("needs_upgrade"):
+                self.module.log(msg=f"= installed: {state.get('installed')} (version {state.get('version')})")
+                return (0, state.get("installed"), "", "")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.check()
 
         """
             not installed: "Nextcloud is not installed - only a limited number of commands are available"
@@ -212,13 +204,7 @@ class NextcloudClient(object):
                 installed = True
 
         else:
-            err = out.strip()
-
-            pattern = re.compile(r"An unhandled exception has been thrown:\n(?P<exception>.*)\n.*", re.MULTILINE)
-            exception = re.search(pattern, err)
-
-            if exception:
-                err = exception.group("exception")
+            err = self.occ_client.exception_message(out)
 
         self.module.log(msg=f"= rc: {rc}, installed: {installed}, out: {out.strip()}, err: {err.strip()}")
         return (rc, installed, out, err)
@@ -232,8 +218,6 @@ class NextcloudClient(object):
         self.module.log(msg="occ_upgrade()")
 
         args = []
-        args += self.occ_base_args
-
         args.append("upgrade")
         args.append("--no-ansi")
         # args.append("--output")
@@ -241,7 +225,7 @@ class NextcloudClient(object):
 
         self.module.log(msg=f" args: '{args}'")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         self.module.log(msg=f" rc : '{rc}'")
         self.module.log(msg=f" out: '{out.strip()}'")
@@ -253,13 +237,7 @@ class NextcloudClient(object):
             err = "The upgrade was successful."
 
         else:
-            err = out.strip()
-
-            pattern = re.compile(r"An unhandled exception has been thrown:\n(?P<exception>.*)\n.*", re.MULTILINE)
-            exception = re.search(pattern, err)
-
-            if exception:
-                err = exception.group("exception")
+            err = self.occ_client.exception_message(out)
 
         self.module.log(msg=f"= rc: {rc}, out: {out.strip()}, err: {err.strip()}")
         return (rc, out, err)
@@ -271,37 +249,18 @@ class NextcloudClient(object):
         # self.module.log(msg="occ_status()")
         installed = False
         version_string = None
+        db_upgrade = False
 
-        args = []
-        args += self.occ_base_args
-
-        args.append("status")
-        args.append("--no-ansi")
-        args.append("--output")
-        args.append("json")
-
-        self.module.log(msg=f" args: '{args}'")
-
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, status, err = self.occ_client.status()
 
         self.module.log(msg=f" rc : '{rc}'")
-        self.module.log(msg=f" out: '{out.strip()}'")
+        self.module.log(msg=f" status: '{status}'")
         self.module.log(msg=f" err: '{err.strip()}'")
 
         if rc == 0:
-            out = json.loads(out)
-            installed = out.get("installed", False)
-            version_full = out.get("version", None)
-            version_string = out.get("versionstring", None)
-            db_upgrade = out.get("needsDbUpgrade", False)
-        else:
-            err = out.strip()
-
-            pattern = re.compile(r"An unhandled exception has been thrown:\n(?P<exception>.*)\n.*", re.MULTILINE)
-            exception = re.search(pattern, err)
-
-            if exception:
-                err = exception.group("exception")
+            installed = status.get("installed", False)
+            version_string = status.get("versionstring", None)
+            db_upgrade = status.get("needsDbUpgrade", False)
 
         return (rc, installed, version_string, db_upgrade, err)
 
@@ -335,8 +294,6 @@ class NextcloudClient(object):
         admin_password = self.admin.get("password", None)
 
         args = []
-        args += self.occ_base_args
-
         args.append("maintenance:install")
 
         if self.data_dir:
@@ -364,7 +321,7 @@ class NextcloudClient(object):
         args.append(admin_password)
         args.append("--no-ansi")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         if rc == 0:
             _msg = "database was successfully created."
@@ -394,7 +351,7 @@ class NextcloudClient(object):
                     break
             # self.module.log("--------------------")
 
-            _, installed, version, err = self.occ_status()
+            _, installed, version, _, err = self.occ_status()
 
             if rc == 0 and not error and installed:
                 _failed = False
@@ -421,18 +378,16 @@ class NextcloudClient(object):
         """
 
         args = []
-        args += self.occ_base_args
-
         args.append("config:list")
         args.append("system")
         args.append("--no-ansi")
 
         # self.module.log(msg=f" args: '{args}'")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         if rc == 0:
-            file_name = self._occ = os.path.join(self.working_dir, 'config', 'config.json')
+            file_name = os.path.join(self.working_dir, 'config', 'config.json')
 
             with open(file_name, "w") as f:
                 f.write(out)
@@ -447,12 +402,10 @@ class NextcloudClient(object):
             https://docs.nextcloud.com/server/latest/admin_manual/configuration_server/occ_command.html#background-jobs-selector
         """
         args = []
-        args += self.occ_base_args
-
         args.append(f"background:{crontype}")
         args.append("--no-ansi")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         return dict(
             failed=not (rc == 0),
@@ -485,22 +438,6 @@ class NextcloudClient(object):
 
         return current_owner, current_group, current_mode
 
-    def __exec(self, commands, check_rc=True):
-        """
-        """
-        rc, out, err = self.module.run_command(commands, cwd=self.working_dir, check_rc=check_rc)
-
-        # self.module.log(msg=f"  rc : '{rc}'")
-        if rc != 0:
-            self.module.log(msg=f"cmd: '{commands}'")
-            self.module.log(msg=f"  rc : '{rc}'")
-            self.module.log(msg=f"  out: '{out}'")
-            self.module.log(msg=f"  err: '{err}'")
-            for line in err.splitlines():
-                self.module.log(msg=f"   {line}")
-
-        return rc, out, err
-
 
 def main():
     """
@@ -543,7 +480,11 @@ def main():
         admin=dict(
             required=False,
             type=dict
-        )
+        ),
+        trace_file=dict(
+            required=False,
+            type=str
+        ),
     )
 
     module = AnsibleModule(
@@ -553,6 +494,7 @@ def main():
 
     kc = NextcloudClient(module)
     result = kc.run()
+    result.update(kc.occ_client.timings.result())
 
     module.log(msg=f"= result : '{result}'")
 
@@ -8,11 +8,14 @@
 from __future__ import absolute_import, print_function
 import os
 import re
-import json
-import pwd
-import grp
+import time
+import queue
+import threading
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.nextcloud_occ_client import OccClient
+from ansible.module_utils.nextcloud_occ_worker import OccWorker
+from ansible.module_utils.nextcloud_app_store import AppStore
 from ansible_collections.bodsch.core.plugins.module_utils.module_results import results
 
 __metaclass__ = type
@@ -37,22 +40,18 @@ class NextcloudApps(object):
         self.state = module.params.get("state")
         self.working_dir = module.params.get("working_dir")
         self.owner = module.params.get("owner")
+        self.state_cache_ttl = module.params.get("state_cache_ttl")
+        self.trace_file = module.params.get("trace_file")
+        self.concurrency = module.params.get("concurrency")
+        self.update_check_ttl = module.params.get("update_check_ttl")
 
-        self.occ_base_args = [
-            "sudo",
-            "--preserve-env",
-            "--user",
-            self.owner,
-            "php",
-            "occ"
-        ]
+        self.occ_client = OccClient(module, working_dir=self.working_dir, owner=self.owner, cache_ttl=self.state_cache_ttl, trace_file=self.trace_file)
+        self.app_store = AppStore(module, php_config=self.occ_client.php_config, ttl=self.update_check_ttl)
 
     def run(self):
         """
         """
-        self._occ = os.path.join(self.working_dir, 'occ')
-
-        if not os.path.exists(self._occ):
+        if not self.occ_client.available():
             return dict(
                 failed=True,
                 changed=False,
@@ -61,7 +60,7 @@ class NextcloudApps(object):
 
         os.chdir(self.working_dir)
 
-        rc, installed, out, err = self.occ_check(check_installed=True)
+        rc, installed, out, err = self.occ_client.check(check_installed=True)
 
         if not installed and rc == 1:
             return dict(
@@ -70,39 +69,60 @@ class NextcloudApps(object):
                 msg=out
             )
 
-        rc, update, applications, err = self.occ_check_for_updates()
+        update, updates, source = self.check_for_updates()
+        applications = {app: values.get("version") for app, values in updates.items()}
 
         if self.state == "check":
             return dict(
                 changed=False,
                 updates=update,
-                applications=applications
+                applications=applications,
+                details=updates,
+                source=source
             )
         else:
             """
             """
             result_state = []
-            res = {}
+            updates = dict()
+
+            if self.concurrency > 1 and len(applications) > 1:
+                updates = self.update_concurrent(applications)
 
             for app, version in applications.items():
                 self.module.log(f"  - {app} : {version}")
 
-                state = self.occ_update_app(app)
+                if app not in updates:
+                    start = time.monotonic()
+                    rc, out, err = self.occ_update_app(app)
+                    updates[app] = dict(rc=rc, out=out, err=err, download=None, time=time.monotonic() - start)
 
-                if rc == 0:
-                    res[app] = dict(
+                update = updates.get(app)
+
+                if update.get("rc") == 0:
+                    res = dict(
                         failed=False,
                         changed=True,
                         msg=f"successfully updated to version {version}."
                     )
                 else:
-                    res[app] = dict(
+                    res = dict(
                         failed=True,
                         changed=False,
-                        msg=f"update to version {version} failed."
+                        msg=f"update to version {version} failed: {(update.get('out') + update.get('err')).strip()}"
                     )
 
-                result_state.append(res)
+                res.update(
+                    rc=update.get("rc"),
+                    time=round(update.get("time"), 3),
+                )
+
+                if update.get("download") is not None:
+                    res.update(download_time=round(update.get("download"), 3))
+
+                result_state.append({app: res})
+
+            self.occ_client.invalidate()
 
             _state, _changed, _failed, state, changed, failed = results(self.module, result_state)
 
@@ -114,51 +134,132 @@ class NextcloudApps(object):
 
             return result
 
-    def occ_check(self, check_installed=False):
+    def update_concurrent(self, applications):
         """
-            sudo -u www-data php occ check
-        """
-        # self.module.log(msg=f"occ_check({check_installed})")
+            up to 'concurrency' occ workers download the apps in parallel,
+            the migrations run one after another.
 
-        args = []
-        args += self.occ_base_args
+            apps which could not be downloaded by a worker are missing in the
+            result and have to be updated with 'occ app:update'. an app whose
+            download succeeded but whose upgrade did not finish is failed.
+        """
+        result = dict()
+        pending = queue.Queue()
 
-        args.append("check")
-        args.append("--no-ansi")
-        args.append("--output")
-        args.append("json")
+        for app in applications.keys():
+            pending.put(app)
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        workers = [
+            OccWorker(self.module, working_dir=self.working_dir, owner=self.owner)
+            for _ in range(min(self.concurrency, len(applications)))
+        ]
 
+        # Nextcloud can not be booted while an app waits for its migration,
+        # therefore all workers have to be ready before the first download
+        started = threading.Barrier(len(workers))
+        upgrade_lock = threading.Lock()
+        timings_lock = threading.Lock()
+
+        def action(worker, name, app):
+            start = time.monotonic()
+            rc, out, err = worker.run_action(name, app=app)
+            duration = time.monotonic() - start
+
+            with timings_lock:
+                self.occ_client.timings.record([name, app], "worker", duration, rc, out, err)
+
+            return rc, out, err, duration
+
+        def update(worker):
+            try:
+                usable = worker.usable(["app:download"])
+            except Exception:
+                # the other workers must not wait for this one
+                started.abort()
+                worker.stop()
+                raise
+
+            try:
+                started.wait(timeout=worker.timeout)
+            except threading.BrokenBarrierError:
+                # a worker could not be started, nothing has been downloaded
+                usable = False
+
+            try:
+                while usable:
+                    try:
+                        app = pending.get_nowait()
+                    except queue.Empty:
+                        break
+
+                    rc, out, err, download = action(worker, "app:download", app)
+                    duration = download
+
+                    if rc != 0 and not worker.usable(["app:download"]):
+                        # the worker died before the new code was in place, the app is left to 'occ app:update'
+                        break
+
+                    if rc == 0:
+                        with upgrade_lock:
+                            rc, out, err, upgrade = action(worker, "app:upgrade", app)
+                            duration += upgrade
+
+                        if rc != 0 and not worker.usable(["app:download"]):
+                            # the new code is in place, 'occ app:update' would find no update
+                            # and the migration would never run
+                            err = f"{err.strip()} The app was downloaded, but not upgraded. Run 'occ upgrade'."
+                            result[app] = dict(rc=rc, out=out, err=err, download=download, time=duration)
+                            break
+
+                    result[app] = dict(rc=rc, out=out, err=err, download=download, time=duration)
+            finally:
+                worker.stop()
+
+        threads = [threading.Thread(target=update, args=(worker,)) for worker in workers]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return result
+
+    def check_for_updates(self):
         """
-            not installed: "Nextcloud is not installed - only a limited number of commands are available"
-            installed: ''
+            returns (update, {app: {installed: ..., version: ...}}, source)
+
+            source is 'cache', 'app store' or 'occ'
         """
+        existing_apps, _, _ = self.occ_client.list_apps()
 
-        if not check_installed:
-            return rc, out, err
+        installed_apps = dict()
+        installed_apps.update(existing_apps.get("disabled", {}))
+        installed_apps.update(existing_apps.get("enabled", {}))
 
-        installed = False
+        updates, source = self.app_store.cached_updates(installed_apps)
 
-        if rc == 0:
-            pattern = re.compile(r"Nextcloud is not installed.*", re.MULTILINE)
-            is_installed = re.search(pattern, err)
+        if updates is not None:
+            return (len(updates) > 0, updates, "cache")
 
-            if is_installed:
-                installed = False
-            else:
-                installed = True
+        source = "app store"
+        updates = self.app_store.updates(installed_apps)
 
-        else:
-            err = out.strip()
+        if updates is None:
+            source = "occ"
+            rc, _, applications, err = self.occ_check_for_updates()
 
-            pattern = re.compile(r"An unhandled exception has been thrown:\n(?P<exception>.*)\n.*", re.MULTILINE)
-            exception = re.search(pattern, err)
+            if rc != 0:
+                return (False, dict(), source)
 
-            if exception:
-                err = exception.user("exception")
+            updates = {
+                app: dict(installed=installed_apps.get(app), version=version)
+                for app, version in applications.items()
+            }
 
-        return (rc, installed, out, err)
+        self.app_store.cache_updates(installed_apps, updates, source)
+
+        return (len(updates) > 0, updates, source)
 
     def occ_check_for_updates(self, check_installed=False):
         """
@@ -169,12 +270,10 @@ class NextcloudApps(object):
         res = dict()
         update = False
         args = []
-        args += self.occ_base_args
-
         args.append("update:check")
         args.append("--no-ansi")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         # self.module.log(msg=f"rc: {rc}, out: {out.strip()}, err: {err.strip()}")
         # self.module.log(msg=f"  {len(out)}")
@@ -203,13 +302,11 @@ class NextcloudApps(object):
         _changed = False
 
         args = []
-        args += self.occ_base_args
-
         args.append("app:getpath")
         args.append("--no-ansi")
         args.append(app_name)
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         # self.module.log(msg=f"  out: '{out.strip()}')")
         # self.module.log(msg=f"  err: '{err.strip()}')")
@@ -234,37 +331,16 @@ class NextcloudApps(object):
         _msg = ""
 
         args = []
-        args += self.occ_base_args
-
         args.append("app:update")
         args.append("--no-ansi")
         args.append(app_name)
 
         self.module.log(msg=f"args: {args}")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         return (rc, out, err)
 
-    def __exec(self, commands, check_rc=True):
-        """
-        """
-        rc, out, err = self.module.run_command(
-            commands,
-            cwd=self.working_dir,
-            check_rc=check_rc)
-
-        # self.module.log(msg=f"  rc : '{rc}'")
-        if rc != 0:
-            self.module.log(msg=f"cmd: '{commands}'")
-            self.module.log(msg=f"  rc : '{rc}'")
-            self.module.log(msg=f"  out: '{out}'")
-            self.module.log(msg=f"  err: '{err}'")
-            for line in err.splitlines():
-                self.module.log(msg=f"   {line}")
-
-        return rc, out, err
-
 
 def main():
     """
@@ -286,6 +362,25 @@ def main():
             type=str,
             default="www-data"
         ),
+        state_cache_ttl=dict(
+            required=False,
+            type=int,
+            default=0
+        ),
+        trace_file=dict(
+            required=False,
+            type=str
+        ),
+        concurrency=dict(
+            required=False,
+            type=int,
+            default=1
+        ),
+        update_check_ttl=dict(
+            required=False,
+            type=int,
+            default=3600
+        ),
     )
 
     module = AnsibleModule(
@@ -295,6 +390,7 @@ def main():
 
     kc = NextcloudApps(module)
     result = kc.run()
+    result.update(kc.occ_client.timings.result())
 
     module.log(msg=f"= result : '{result}'")
 
@@ -7,12 +7,13 @@
 
 from __future__ import absolute_import, print_function
 import os
-import re
 import json
 import pwd
 import grp
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.nextcloud_occ_client import OccClient
+from ansible.module_utils.nextcloud_password_store import PasswordStore
 from ansible_collections.bodsch.core.plugins.module_utils.module_results import results
 
 __metaclass__ = type
@@ -37,22 +38,16 @@ class NextcloudUsers(object):
         self.users = module.params.get("users")
         self.working_dir = module.params.get("working_dir")
         self.owner = module.params.get("owner")
+        self.state_cache_ttl = module.params.get("state_cache_ttl")
+        self.trace_file = module.params.get("trace_file")
 
-        self.occ_base_args = [
-            "sudo",
-            "--preserve-env",
-            "--user",
-            self.owner,
-            "php",
-            "occ"
-        ]
+        self.occ_client = OccClient(module, working_dir=self.working_dir, owner=self.owner, cache_ttl=self.state_cache_ttl, trace_file=self.trace_file)
+        self.password_store = PasswordStore(module, working_dir=self.working_dir)
 
     def run(self):
         """
         """
-        self._occ = os.path.join(self.working_dir, 'occ')
-
-        if not os.path.exists(self._occ):
+        if not self.occ_client.available():
             return dict(
                 failed=True,
                 changed=False,
@@ -61,7 +56,7 @@ class NextcloudUsers(object):
 
         os.chdir(self.working_dir)
 
-        rc, installed, out, err = self.occ_check(check_installed=True)
+        rc, installed, out, err = self.occ_client.check(check_installed=True)
 
         # self.module.log(msg=f" rc : '{rc}'")
         # self.module.log(msg=f" out: '{out.strip()}'")
@@ -74,63 +69,27 @@ class NextcloudUsers(object):
                 msg=out
             )
 
-        self.existing_groups = self.occ_list_groups()
-        self.existing_users = self.occ_list_users()
+        # one snapshot of all users and group memberships for the whole run
+        self.existing_groups = self.occ_client.list_groups()
+        self.existing_users = self.occ_client.list_users()
+        self.user_groups = self.__user_groups()
 
         # self.module.log(f"existing_groups: {self.existing_groups}")
         # self.module.log(f"existing_users : {self.existing_users}")
 
-        result_state = []
-
-        if self.users:
-            for user in self.users:
-                """
-                """
-                # self.module.log(f" - {user}")
-
-                user_state = user.get("state", "present")
-                user_name = user.get("name", None)
-                # user_password = user.get("password", None)
-                resetpassword = user.get("resetpassword", None)
-                # user_display_name = user.get("display_name", None)
-                user_groups = user.get("groups", [])
-                user_settings = user.get("settings", [])
-
-                if user_name:
-                    res = {}
-                    if user_state == "present":
-
-                        if user_name in self.existing_users:
-                            if resetpassword:
-                                res[user_name] = self.occ_reset_password(user_data=user)
-                            else:
-                                res[user_name] = dict(
-                                    changed=False,
-                                    msg="The user has already been created."
-                                )
-                        else:
-                            res[user_name] = self.occ_create_user(user_data=user)
+        users = dict()
 
-                        _group_failed, _group_changed, _group_msg = self.occ_user_groups(username=user_name, groups=user_groups)
+        for user in self.users or []:
+            user_name = user.get("name", None)
 
-                        if not _group_failed and _group_changed:
-                            res[user_name]["msg"] += _group_msg
+            if user_name:
+                users[user_name] = user
 
-                        _settings_failed, _settings_changed, _settings_msg = self.occ_user_settings(username=user_name, user_settings=user_settings)
+        plan = self.plan(users)
 
-                    else:
-                        if user_name in self.existing_users:
-                            res[user_name] = self.occ_remove_user(name=user_name)
-                        else:
-                            res[user_name] = dict(
-                                changed=False,
-                                msg="The user does not exist (anymore)."
-                            )
+        # self.module.log(msg=f" plan: {plan}")
 
-                    result_state.append(res)
-
-                else:
-                    pass
+        result_state = self.apply(users, plan)
 
         _state, _changed, _failed, state, changed, failed = results(self.module, result_state)
 
@@ -141,71 +100,224 @@ class NextcloudUsers(object):
         result = dict(
             changed=_changed,
             failed=False,
-            state=result_state
+            state=result_state,
+            plan=plan
         )
 
         # self.module.log(msg=f" = {result}")
 
         return result
 
-    def occ_check(self, check_installed=False):
-        """
-            sudo -u www-data php occ check
-        """
-        # self.module.log(msg=f"occ_check({check_installed})")
+    def plan(self, users):
+        """
+            compare the configured users with the snapshot
+
+            returns a dictionary with all necessary changes:
+              create, delete, reset_password, password_unchanged: list of user names
+              add_to_groups, remove_from_groups, invalid_groups: user name -> list of groups
+              settings: user name -> {app: {key: value}} with the differing settings only
+              settings_unchanged: user name -> list of 'app.key'
+        """
+        plan = dict(
+            create=[],
+            delete=[],
+            reset_password=[],
+            password_unchanged=[],
+            add_to_groups=dict(),
+            remove_from_groups=dict(),
+            invalid_groups=dict(),
+            settings=dict(),
+            settings_unchanged=dict(),
+        )
 
-        args = []
-        args += self.occ_base_args
+        existing_groups = set(self.existing_groups)
 
-        args.append("check")
-        args.append("--no-ansi")
-        args.append("--output")
-        args.append("json")
+        for user_name, user in users.items():
+            user_exists = user_name in self.existing_users
+
+            if user.get("state", "present") != "present":
+                if user_exists:
+                    plan["delete"].append(user_name)
+
+                continue
+
+            if not user_exists:
+                plan["create"].append(user_name)
+            elif user.get("resetpassword", None):
+                # only when it differs from the last applied password
+                if self.password_store.matches(user_name, user.get("password", None)):
+                    plan["password_unchanged"].append(user_name)
+                else:
+                    plan["reset_password"].append(user_name)
+
+            groups = set(user.get("groups") or [])
+            current_groups = set(self.user_groups.get(user_name, []))
+
+            # groups that do not exist are skipped
+            groups_invalid = groups - existing_groups
+            # user ist NOT in group
+            groups_missing = (groups & existing_groups) - current_groups
+            # user should removed from group
+            groups_removing = current_groups - groups
+
+            if groups_invalid:
+                plan["invalid_groups"][user_name] = sorted(groups_invalid)
+            if groups_missing:
+                plan["add_to_groups"][user_name] = sorted(groups_missing)
+            if groups_removing:
+                plan["remove_from_groups"][user_name] = sorted(groups_removing)
 
-        # self.module.log(msg=f" args: '{args}'")
+            settings = self.__user_settings(user.get("settings", []))
 
-        rc, out, err = self.__exec(args, check_rc=False)
+            if settings:
+                # one read of all current settings, only differing values are written
+                current_settings = self.occ_user_setting_values(user_name) if user_exists else dict()
 
+                changed_settings = dict()
+                unchanged_settings = []
+
+                for app, values in settings.items():
+                    current = current_settings.get(app, {})
+
+                    for key, value in values.items():
+                        if key in current and str(current.get(key)) == value:
+                            unchanged_settings.append(f"{app}.{key}")
+                        else:
+                            changed_settings.setdefault(app, {})[key] = value
+
+                if changed_settings:
+                    plan["settings"][user_name] = changed_settings
+                if unchanged_settings:
+                    plan["settings_unchanged"][user_name] = unchanged_settings
+
+        return plan
+
+    def apply(self, users, plan):
         """
-            not installed: "Nextcloud is not installed - only a limited number of commands are available"
-            installed: ''
+            execute the plan, in check mode only describe it
         """
-        # self.module.log(msg=f" rc : '{rc}'")
-        # self.module.log(msg=f" out: '{out.strip()}'")
-        # self.module.log(msg=f" err: '{err.strip()}'")
+        check_mode = self.module.check_mode
+        result_state = []
 
-        if not check_installed:
-            return rc, out, err
+        create = set(plan.get("create"))
+        delete = set(plan.get("delete"))
+        reset_password = set(plan.get("reset_password"))
+        password_unchanged = set(plan.get("password_unchanged"))
+
+        for user_name, user in users.items():
+            res = {}
+
+            if user.get("state", "present") != "present":
+                if user_name not in delete:
+                    res[user_name] = dict(
+                        changed=False,
+                        msg="The user does not exist (anymore)."
+                    )
+                elif check_mode:
+                    res[user_name] = dict(
+                        changed=True,
+                        msg="The user would be removed."
+                    )
+                else:
+                    res[user_name] = self.occ_remove_user(name=user_name)
 
-        installed = False
+                    if not res[user_name].get("failed", False):
+                        self.password_store.remove(user_name)
 
-        if rc == 0:
-            pattern = re.compile(r"Nextcloud is not installed.*", re.MULTILINE)
-            # installed_out = re.search(pattern_1, out)
-            is_installed = re.search(pattern, err)
+                result_state.append(res)
+                continue
+
+            groups_missing = plan["add_to_groups"].get(user_name, [])
+            groups_removing = plan["remove_from_groups"].get(user_name, [])
+            groups_invalid = plan["invalid_groups"].get(user_name, [])
+
+            _group_added = []
+            _group_removed = []
+
+            if user_name in create:
+                # new users get their groups directly with 'user:add'
+                if check_mode:
+                    res[user_name] = dict(
+                        changed=True,
+                        msg="The user would be created."
+                    )
+                else:
+                    res[user_name] = self.occ_create_user(user_data=user, groups=groups_missing)
+
+                if not res[user_name].get("failed", False):
+                    _group_added = groups_missing
+
+                    if not check_mode:
+                        self.password_store.set(user_name, user.get("password", None))
+
+            elif user_name in reset_password:
+                if check_mode:
+                    res[user_name] = dict(
+                        changed=True,
+                        msg="The password would be reset."
+                    )
+                else:
+                    res[user_name] = self.occ_reset_password(user_data=user)
 
-            # self.module.log(msg=f" out: '{installed_out}'")
-            # self.module.log(msg=f" err: '{is_installed}' {type(is_installed)}")
+                    if not res[user_name].get("failed", False):
+                        self.password_store.set(user_name, user.get("password", None))
 
-            if is_installed:
-                installed = False
+            elif user_name in password_unchanged:
+                res[user_name] = dict(
+                    changed=False,
+                    msg="The password has not been changed, the reset was skipped."
+                )
             else:
-                installed = True
+                res[user_name] = dict(
+                    changed=False,
+                    msg="The user has already been created."
+                )
+
+            if res[user_name].get("failed", False):
+                result_state.append(res)
+                continue
+
+            if user_name not in create:
+                if check_mode:
+                    _group_added = groups_missing
+                    _group_removed = groups_removing
+                else:
+                    if len(groups_missing) > 0:
+                        _group_added = self.__add_user_to_group(username=user_name, groups=groups_missing)
 
-        else:
-            err = out.strip()
+                    if len(groups_removing) > 0:
+                        _group_removed = self.__delete_user_from_group(username=user_name, groups=groups_removing)
+
+            res[user_name]["msg"] += self.__group_message(_group_added, _group_removed, groups_invalid)
 
-            pattern = re.compile(r"An unhandled exception has been thrown:\n(?P<exception>.*)\n.*", re.MULTILINE)
-            exception = re.search(pattern, err)
+            if user_name not in create and (len(_group_added) > 0 or len(_group_removed) > 0):
+                res[user_name]["changed"] = True
+
+            settings = plan["settings"].get(user_name, {})
+
+            if check_mode:
+                settings_changed = [f"{app}.{key}" for app, values in settings.items() for key in values]
+            else:
+                settings_changed = self.occ_user_settings(username=user_name, user_settings=settings)
 
-            if exception:
-                err = exception.user("exception")
+            if len(settings_changed) > 0:
+                res[user_name]["changed"] = True
+                res[user_name]["msg"] += f" Changed setting(s): {', '.join(settings_changed)}."
 
-        # self.module.log(msg=f"{rc} '{installed}' '{out}' '{err}'")
+            if settings or user_name in plan["settings_unchanged"]:
+                res[user_name]["settings"] = dict(
+                    changed=settings_changed,
+                    unchanged=plan["settings_unchanged"].get(user_name, [])
+                )
 
-        return (rc, installed, out, err)
+            result_state.append(res)
 
-    def occ_create_user(self, user_data={}):
+        if not check_mode:
+            self.password_store.save()
+
+        return result_state
+
+    def occ_create_user(self, user_data={}, groups=[]):
         """
             sudo -u www-data php occ
                 user:add
@@ -223,28 +335,35 @@ class NextcloudUsers(object):
         display_name = user_data.get("display_name", None)
         password = user_data.get("password", None)
 
-        args = []
-        args += self.occ_base_args
+        environ_update = dict()
 
+        args = []
         args.append("user:add")
 
         if password:
-            self.module.run_command_environ_update = {"OC_PASS": password}
+            environ_update["OC_PASS"] = password
             args.append("--password-from-env")
 
         if display_name:
             args.append("--display-name")
             args.append(display_name)
 
+        for group in groups:
+            args.append("--group")
+            args.append(group)
+
         args.append("--no-ansi")
         args.append(name)
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args, environ_update=environ_update)
 
         if rc == 0:
             _msg = "User was successfully created."
             _failed = False
             _changed = True
+
+            self.existing_users[name] = display_name or name
+            self.user_groups[name] = list(groups)
         else:
             _failed = True
             _changed = False
@@ -276,19 +395,19 @@ class NextcloudUsers(object):
         name = user_data.get("name", None)
         password = user_data.get("password", None)
 
-        args = []
-        args += self.occ_base_args
+        environ_update = dict()
 
+        args = []
         args.append("user:resetpassword")
         args.append("--no-ansi")
 
         if password:
-            self.module.run_command_environ_update = {"OC_PASS": password}
+            environ_update["OC_PASS"] = password
             args.append("--password-from-env")
 
         args.append(name)
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args, environ_update=environ_update)
 
         if rc == 0:
             _msg = f"{out.strip()}."
@@ -318,15 +437,13 @@ class NextcloudUsers(object):
         _msg = ""
 
         args = []
-        args += self.occ_base_args
-
         args.append("user:delete")
         args.append("--no-ansi")
         args.append(name)
 
         self.module.log(msg=f" args: '{args}'")
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         # self.module.log(msg=f" rc : '{rc}'")
         # self.module.log(msg=f" out: {type(out)} - '{out.strip()}'")
@@ -336,6 +453,9 @@ class NextcloudUsers(object):
             _msg = "User was successfully removed."
             _failed = False
             _changed = True
+
+            self.existing_users.pop(name, None)
+            self.user_groups.pop(name, None)
         else:
             _failed = True
             _changed = False
@@ -347,115 +467,6 @@ class NextcloudUsers(object):
             msg=_msg
         )
 
-    def occ_list_users(self):
-        """
-        """
-        args = []
-        args += self.occ_base_args
-
-        args.append("user:list")
-        args.append("--no-ansi")
-        args.append("--output")
-        args.append("json")
-
-        rc, out, err = self.__exec(args, check_rc=False)
-        out = json.loads(out)
-
-        user_names = [x for x, _ in out.items()]
-        return user_names
-
-    def occ_list_groups(self):
-        """
-        """
-        args = []
-        args += self.occ_base_args
-
-        args.append("group:list")
-        args.append("--no-ansi")
-        args.append("--output")
-        args.append("json")
-
-        rc, out, err = self.__exec(args, check_rc=False)
-        out = json.loads(out)
-
-        group_names = [x for x, _ in out.items()]
-        return group_names
-
-    def occ_user_groups(self, username, groups):
-        """
-            add user to group(s)
-            remove user from group(s)
-
-            sudo -u www-data php occ
-                user:delete
-                --no-ansi
-                "foo"
-        """
-        # self.module.log(msg=f"occ_user_groups({username}, {groups})")
-        _failed = True
-        _changed = False
-        _msg = ""
-
-        _state = self.occ_user_info(username)
-        user_state = _state.get("state", "absent")
-
-        if user_state == "absent":
-            return (_failed, _changed, f"The User {username} has not yet been created.")
-
-        # user is current in groups
-        user_groups = _state.get("groups", [])
-
-        # invalid groups
-        groups_invalid = list(set(groups) - set(self.existing_groups))
-
-        # valid groups for this user, remove not exists groups
-        valid_user_groups = [x for x in self.existing_groups if x in groups]
-
-        # user ist NOT in group
-        groups_missing = [x for x in valid_user_groups if x not in user_groups]
-
-        # user should removed from group
-        groups_removing = [x for x in user_groups if x not in groups]
-
-        # self.module.log(msg=f"{username} : {user_state}")
-        # self.module.log(msg=f"  - groups exists: {self.existing_groups}")
-        # self.module.log(msg=f"    - is in groups: {user_groups}")
-        # self.module.log(msg=f"    - should in groups: {groups}")
-        # self.module.log(msg=f"    - valid user groups: {valid_user_groups}")
-        # self.module.log(msg=f"    - groups missing: {groups_missing}")
-        # self.module.log(msg=f"    - remove from groups: {groups_removing}")
-        # self.module.log(msg=f"    - groups invalid: {groups_invalid}")
-        _group_added = []
-        _group_removed = []
-        _group_skipped = groups_invalid
-        m = []
-
-        if len(groups_missing) > 0:
-            _group_added = self.__add_user_to_group(username=username, groups=groups_missing)
-
-        if len(groups_removing) > 0:
-            _group_removed = self.__delete_user_from_group(username=username, groups=groups_removing)
-
-        if len(_group_removed) > 0 or len(_group_added) > 0:
-            _failed = False
-            _changed = True
-
-            if len(_group_added) > 0:
-                added = ", ".join(_group_added)
-                m.append(f" Added to group(s): {added}.")
-
-            if len(_group_removed) > 0:
-                removed = ", ".join(_group_removed)
-                m.append(f" Removed from group(s): {removed}.")
-
-        if len(_group_skipped) > 0:
-            skipped = ", ".join(_group_skipped)
-            m.append(f"Group(s) {skipped} does not exist, was skipped.")
-
-        _msg = " ".join(m)
-
-        return (_failed, _changed, _msg)
-
     def occ_user_settings(self, username, user_settings):
         """
             add settings for user
@@ -486,58 +497,46 @@ class NextcloudUsers(object):
                   --error-if-not-exists          Checks whether the setting exists before deleting it
         """
         # self.module.log(msg=f"occ_user_settings({username}, {user_settings})")
-        _failed = True
-        _changed = False
-        _msg = ""
+        result = []
 
-        result_arr = []
+        for app, settings in user_settings.items():
+            for key, value in settings.items():
+                if self.__add_user_settings(username=username, app=app, key=key, value=value):
+                    result.append(f"{app}.{key}")
 
-        for app_setting in user_settings:
-            # self.module.log(msg=f"- {app_setting}")
-            for app, settings in app_setting.items():
-                result = dict()
-                result[app] = dict()
-                # self.module.log(msg=f"  {app}:  ({settings} - {type(settings)})")
-                if isinstance(settings, dict):
-                    for key, value in settings.items():
-                        # self.module.log(msg=f"    - {key}: {value}")
-                        result[app][key] = self.__add_user_settings(username=username, app=app, key=key, value=value)
-                        result_arr.append(result)
-        # self.module.log(msg=f"    - {result_arr}")
-        return (_failed, _changed, _msg)
+        return result
 
-    def occ_user_info(self, username):
+    def occ_user_setting_values(self, username):
         """
+            all settings of an user
+
             sudo -u www-data php occ
-                user:info
+                user:setting
                 --no-ansi
                 --output json
                 bob
-        """
-        # self.module.log(msg=f"occ_user_info({username})")
 
+            returns {app: {key: value}}
+        """
         args = []
-        args += self.occ_base_args
-
-        args.append("user:info")
+        args.append("user:setting")
         args.append("--no-ansi")
         args.append("--output")
         args.append("json")
         args.append(username)
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         if rc == 0:
-            out = json.loads(out)
-            out.update({"state": "present"})
-        else:
-            out = dict(
-                user_id=username,
-                state="absent",
-                msg=out.strip()
-            )
+            try:
+                values = json.loads(out)
 
-        return out
+                if isinstance(values, dict):
+                    return values
+            except ValueError:
+                pass
+
+        return dict()
 
     def __add_user_to_group(self, username, groups):
         """
@@ -546,17 +545,16 @@ class NextcloudUsers(object):
         _group_added = []
         for group in groups:
             args = []
-            args += self.occ_base_args
-
             args.append("group:adduser")
             args.append("--no-ansi")
             args.append(group)
             args.append(username)
 
-            rc, out, err = self.__exec(args, check_rc=False)
+            rc, out, err = self.occ_client.exec(args)
 
             if rc == 0:
                 _group_added.append(group)
+                self.user_groups.setdefault(username, []).append(group)
             else:
                 pass
 
@@ -571,17 +569,16 @@ class NextcloudUsers(object):
 
         for group in groups:
             args = []
-            args += self.occ_base_args
-
             args.append("group:removeuser")
             args.append("--no-ansi")
             args.append(group)
             args.append(username)
 
-            rc, out, err = self.__exec(args, check_rc=False)
+            rc, out, err = self.occ_client.exec(args)
 
             if rc == 0:
                 _group_removed.append(group)
+                self.user_groups[username].remove(group)
             else:
                 pass
 
@@ -593,8 +590,6 @@ class NextcloudUsers(object):
         """
         # self.module.log(msg=f"__add_user_settings({username}, {app}, {key}, {value})")
         args = []
-        args += self.occ_base_args
-
         args.append("user:setting")
         args.append("--no-ansi")
         args.append("--output")
@@ -604,7 +599,7 @@ class NextcloudUsers(object):
         args.append(key)
         args.append(str(value))
 
-        rc, out, err = self.__exec(args, check_rc=False)
+        rc, out, err = self.occ_client.exec(args)
 
         if rc == 0:
             return True
@@ -616,6 +611,50 @@ class NextcloudUsers(object):
         # self.module.log(msg=f"= {_group_added}")
         return None
 
+    def __group_message(self, added, removed, skipped):
+        """
+        """
+        m = []
+
+        if len(added) > 0:
+            m.append(f" Added to group(s): {', '.join(added)}.")
+
+        if len(removed) > 0:
+            m.append(f" Removed from group(s): {', '.join(removed)}.")
+
+        if len(skipped) > 0:
+            m.append(f" Group(s) {', '.join(skipped)} does not exist, was skipped.")
+
+        return "".join(m)
+
+    def __user_settings(self, user_settings):
+        """
+            [{app: {key: value}}, ...] -> {app: {key: value}}
+        """
+        result = dict()
+
+        for app_setting in user_settings or []:
+            if not isinstance(app_setting, dict):
+                continue
+
+            for app, settings in app_setting.items():
+                if isinstance(settings, dict):
+                    result.setdefault(app, {}).update({k: str(v) for k, v in settings.items()})
+
+        return result
+
+    def __user_groups(self):
+        """
+            user id -> list of groups, built from the members of 'group:list'
+        """
+        result = dict()
+
+        for group, members in self.existing_groups.items():
+            for member in members:
+                result.setdefault(member, []).append(group)
+
+        return result
+
     def __file_state(self, file_name):
         """
         """
@@ -642,25 +681,6 @@ class NextcloudUsers(object):
 
         return current_owner, current_user, current_mode
 
-    def __exec(self, commands, check_rc=True):
-        """
-        """
-        rc, out, err = self.module.run_command(
-            commands,
-            cwd=self.working_dir,
-            check_rc=check_rc)
-
-        # self.module.log(msg=f"  rc : '{rc}'")
-        if rc != 0:
-            self.module.log(msg=f"cmd: '{commands}'")
-            self.module.log(msg=f"  rc : '{rc}'")
-            self.module.log(msg=f"  out: '{out}'")
-            self.module.log(msg=f"  err: '{err}'")
-            for line in err.splitlines():
-                self.module.log(msg=f"   {line}")
-
-        return rc, out, err
-
 
 def main():
     """
@@ -680,15 +700,25 @@ def main():
             type=str,
             default="www-data"
         ),
+        state_cache_ttl=dict(
+            required=False,
+            type=int,
+            default=0
+        ),
+        trace_file=dict(
+            required=False,
+            type=str
+        ),
     )
 
     module = AnsibleModule(
         argument_spec=specs,
-        supports_check_mode=False,
+        supports_check_mode=True,
     )
 
     kc = NextcloudUsers(module)
     result = kc.run()
+    result.update(kc.occ_client.timings.result())
 
     module.log(msg=f"= result : '{result}'")
 
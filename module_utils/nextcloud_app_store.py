@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import absolute_import, print_function
+import os
+import re
+import json
+import time
+import hashlib
+
+from ansible.module_utils.urls import fetch_url
+
+__metaclass__ = type
+
+
+class AppStore(object):
+    """
+        available app updates, computed from the app store index (apps.json)
+
+        the index is cached per platform version in 'cache_directory' and
+        revalidated with its ETag after 'ttl' seconds.
+        an index, which Nextcloud itself has fetched recently, is reused.
+    """
+    module = None
+
+    cache_directory = "/var/cache/ansible/nextcloud"
+
+    default_url = "https://apps.nextcloud.com/api/v1"
+
+    def __init__(self, module, php_config, ttl=3600):
+        """
+        """
+        self.module = module
+        self.php_config = php_config
+        self.ttl = ttl
+
+    def updates(self, installed_apps):
+        """
+            installed_apps = {app: installed version}
+
+            returns {app: {installed: ..., version: ...}} or None, when the
+            app store index is not available.
+        """
+        index = self.index()
+
+        if index is None:
+            return None
+
+        result = dict()
+
+        for app in index:
+            app_name = app.get("id")
+            current = installed_apps.get(app_name)
+
+            if not current or current == "0":
+                continue
+
+            releases = [
+                x.get("version") for x in app.get("releases", [])
+                if not x.get("isNightly", False) and x.get("version") and "-" not in x.get("version")
+            ]
+
+            if len(releases) == 0:
+                continue
+
+            newest = max(releases, key=self.__version)
+
+            if self.__version(newest) > self.__version(current):
+                result[app_name] = dict(
+                    installed=current,
+                    version=newest
+                )
+
+        return result
+
+    def cached_updates(self, installed_apps):
+        """
+            the last result for exactly these installed versions, while it is
+            younger than 'ttl'
+
+            returns (updates, source) or (None, None)
+        """
+        cached = self.__load(self.__updates_file())
+
+        if not cached or cached.get("key") != self.__updates_key(installed_apps):
+            return (None, None)
+
+        if (time.time() - cached.get("time", 0)) >= self.ttl:
+            return (None, None)
+
+        return (cached.get("updates"), cached.get("source"))
+
+    def cache_updates(self, installed_apps, updates, source):
+        """
+        """
+        self.__save(
+            self.__updates_file(),
+            dict(
+                key=self.__updates_key(installed_apps),
+                time=time.time(),
+                source=source,
+                updates=updates
+            )
+        )
+
+    def index(self):
+        """
+            returns the list of apps of the app store or None
+        """
+        system_config = self.php_config.system_config() or dict()
+        code_version = self.php_config.code_version() or dict()
+
+        if not system_config.get("appstoreenabled", True):
+            return None
+
+        platform = ".".join(str(code_version.get("version", "")).split(".")[:3])
+
+        if not platform:
+            return None
+
+        url = f"{system_config.get('appstoreurl', self.default_url).rstrip('/')}/platform/{platform}/apps.json"
+
+        cache_file = os.path.join(self.cache_directory, f"appstore.{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}.json")
+        cached = self.__load(cache_file) or self.__nextcloud_index(system_config, platform)
+
+        if cached and (time.time() - cached.get("time", 0)) < self.ttl:
+            return cached.get("data")
+
+        headers = dict()
+
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached.get("etag")
+
+        response, info = fetch_url(self.module, url, headers=headers, timeout=30)
+        status = info.get("status")
+
+        if status == 304 and cached:
+            cached["time"] = time.time()
+        elif status == 200:
+            try:
+                cached = dict(
+                    url=url,
+                    etag=info.get("etag"),
+                    time=time.time(),
+                    data=json.loads(response.read())
+                )
+            except ValueError:
+                self.module.log(msg=f"app store: invalid index from {url}")
+                return cached.get("data") if cached else None
+        else:
+            self.module.log(msg=f"app store: {url}: {info.get('msg')}")
+            # an outdated index is better than none
+            return cached.get("data") if cached else None
+
+        self.__save(cache_file, cached)
+
+        return cached.get("data")
+
+    def __nextcloud_index(self, system_config, platform):
+        """
+            the index, which Nextcloud caches in its appdata directory
+        """
+        instance_id = system_config.get("instanceid")
+        data_directory = system_config.get("datadirectory", os.path.join(self.php_config.working_dir, "data"))
+
+        if not instance_id:
+            return None
+
+        file_name = os.path.join(data_directory, f"appdata_{instance_id}", "appstore", "apps.json")
+
+        try:
+            with open(file_name) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not str(data.get("ncversion", "")).startswith(platform) or not isinstance(data.get("data"), list):
+            return None
+
+        return dict(
+            etag=data.get("ETag"),
+            time=data.get("timestamp", 0),
+            data=data.get("data")
+        )
+
+    def __updates_file(self):
+        """
+        """
+        instance = hashlib.sha1(os.path.realpath(self.php_config.working_dir).encode("utf-8")).hexdigest()[:12]
+
+        return os.path.join(self.cache_directory, f"updates.{instance}.json")
+
+    def __updates_key(self, installed_apps):
+        """
+        """
+        code_version = self.php_config.code_version() or dict()
+        data = json.dumps(dict(version=code_version.get("version"), apps=installed_apps), sort_keys=True)
+
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def __version(self, version):
+        """
+        """
+        return tuple(int(x) for x in re.findall(r"\d+", str(version)))
+
+    def __load(self, file_name):
+        """
+        """
+        try:
+            with open(file_name) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def __save(self, file_name, data):
+        """
+        """
+        try:
+            if not os.path.isdir(self.cache_directory):
+                os.makedirs(self.cache_directory, mode=0o750)
+
+            tmp_file = f"{file_name}.{os.getpid()}"
+
+            with open(tmp_file, "w") as f:
+                json.dump(data, f)
+
+            os.replace(tmp_file, file_name)
+        except OSError as e:
+            self.module.log(msg=f"app store: {e}")
@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import absolute_import, print_function
+import os
+import pwd
+import grp
+import shutil
+import tempfile
+
+__metaclass__ = type
+
+
+class AtomicWriter(object):
+    """
+        transactional writes of configuration files
+
+        a file is written to a temporary file in the same directory, synced
+        and renamed. the previous version is kept as one backup generation
+        ('<file>.bck') and restored by rename on rollback().
+    """
+    module = None
+
+    backup_suffix = ".bck"
+
+    def __init__(self, module, owner=None, group=None, mode=0o640):
+        """
+        """
+        self.module = module
+        self.mode = mode
+
+        self.uid = self.__uid(owner)
+        self.gid = self.__gid(group)
+
+        # file name -> True, when a previous version was backed up
+        self._journal = dict()
+
+    def write(self, file_name, content, backup=True):
+        """
+        """
+        tmp_file = self.temporary(os.path.dirname(file_name), content, prefix=f".{os.path.basename(file_name)}.")
+
+        try:
+            if backup:
+                self.__backup(file_name, link=True)
+
+            os.replace(tmp_file, file_name)
+            self.__sync_directory(file_name)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def remove(self, file_name, backup=True):
+        """
+        """
+        if not os.path.exists(file_name):
+            return
+
+        if backup:
+            self._journal[file_name] = True
+            os.replace(file_name, self.backup_file(file_name))
+        else:
+            os.remove(file_name)
+
+        self.__sync_directory(file_name)
+
+    def backup(self, file_name):
+        """
+            copy of a file, which is changed in place by someone else
+            (e.g. config.php by Nextcloud)
+        """
+        self.__backup(file_name, link=False)
+
+    def rollback(self, file_name):
+        """
+            restores the version before write(), remove() or backup()
+        """
+        if file_name not in self._journal:
+            return
+
+        if self._journal.pop(file_name):
+            os.replace(self.backup_file(file_name), file_name)
+        elif os.path.exists(file_name):
+            # the file is new
+            os.remove(file_name)
+
+        self.__sync_directory(file_name)
+
+    def temporary(self, directory, content, prefix=".ansible.", suffix=".tmp"):
+        """
+            returns the name of a synced temporary file, the caller removes it
+        """
+        fd, tmp_file = tempfile.mkstemp(dir=directory, prefix=prefix, suffix=suffix)
+
+        try:
+            with os.fdopen(fd, "w") as fp:
+                fp.write(content)
+                fp.flush()
+                os.fsync(fp.fileno())
+
+            self.__ownership(tmp_file)
+        except Exception:
+            os.remove(tmp_file)
+            raise
+
+        return tmp_file
+
+    def backup_file(self, file_name):
+        """
+        """
+        return f"{file_name}{self.backup_suffix}"
+
+    def __backup(self, file_name, link):
+        """
+        """
+        if file_name in self._journal:
+            # the first version of this transaction is kept
+            return
+
+        if not os.path.exists(file_name):
+            self._journal[file_name] = False
+            return
+
+        backup_file = self.backup_file(file_name)
+
+        if link:
+            # the file will be replaced by a new inode, the old one stays untouched
+            tmp_file = f"{backup_file}.{os.getpid()}"
+
+            try:
+                os.link(file_name, tmp_file)
+            except OSError:
+                # e.g. a file system without hard links
+                shutil.copy2(file_name, tmp_file)
+
+            os.replace(tmp_file, backup_file)
+        else:
+            with open(file_name) as fp:
+                content = fp.read()
+
+            tmp_file = self.temporary(os.path.dirname(file_name), content, prefix=f".{os.path.basename(file_name)}.")
+            shutil.copystat(file_name, tmp_file)
+            self.__ownership(tmp_file, os.stat(file_name))
+            os.replace(tmp_file, backup_file)
+
+        self._journal[file_name] = True
+
+    def __ownership(self, file_name, stat=None):
+        """
+        """
+        if stat is not None:
+            uid, gid, mode = stat.st_uid, stat.st_gid, stat.st_mode & 0o7777
+        else:
+            uid, gid, mode = self.uid, self.gid, self.mode
+
+        os.chmod(file_name, mode)
+
+        if uid is not None or gid is not None:
+            os.chown(file_name, -1 if uid is None else uid, -1 if gid is None else gid)
+
+    def __sync_directory(self, file_name):
+        """
+            the rename is only durable after the directory is synced
+        """
+        try:
+            fd = os.open(os.path.dirname(file_name) or ".", os.O_RDONLY)
+        except OSError:
+            return
+
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def __uid(self, owner):
+        """
+        """
+        if owner is None:
+            return None
+
+        try:
+            return pwd.getpwnam(str(owner)).pw_uid
+        except KeyError:
+            return int(owner)
+
+    def __gid(self, group):
+        """
+        """
+        if group is None:
+            return None
+
+        try:
+            return grp.getgrnam(str(group)).gr_gid
+        except KeyError:
+            return int(group)
@@ -0,0 +1,534 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import absolute_import, print_function
+import re
+
+__metaclass__ = type
+
+# role parameter -> nextcloud system config key
+#
+#   (role parameter(s), nextcloud key, type[, options])
+#
+# the first role parameter with a value is used, empty values ("", None, [], {}) are skipped.
+# options:
+#   when:    only when the value of this role parameter is true,
+#            or (role parameter, [values]) when it is one of the values
+#   default: used when the role parameter is not set, but its parent is
+#
+# https://docs.nextcloud.com/server/latest/admin_manual/configuration_server/config_sample_php_parameters.html
+
+SYSTEM_CONFIG = [
+    ("language.default", "default_language", "str"),
+    ("language.force", "force_language", "any"),
+    ("locale.default", "default_locale", "str"),
+    ("locale.force", "force_locale", "any"),
+    ("phone_region", "default_phone_region", "str"),
+    ("defaultapps", "defaultapp", "csv"),
+    ("knowledgebase_enabled", "knowledgebaseenabled", "bool"),
+    ("allow_user_to_change_display_name", "allow_user_to_change_display_name", "bool"),
+    ("remember_login_cookie_lifetime", "remember_login_cookie_lifetime", "int"),
+    ("theme", "theme", "str"),
+    ("enforce_theme", "enforce_theme", "str"),
+    ("session.lifetime", "session_lifetime", "int"),
+    ("session.relaxed_expiry", "session_relaxed_expiry", "bool"),
+    ("session.keepalive", "session_keepalive", "bool"),
+    ("maintenance.window_start", "maintenance_window_start", "int", dict(when="maintenance.enabled", default=1)),
+    ("auto_logout", "auto_logout", "bool"),
+    ("token.auth_enforced", "token_auth_enforced", "bool"),
+    ("token.auth_activity_update", "token_auth_activity_update", "int"),
+    ("auth.bruteforce.protection.enabled", "auth.bruteforce.protection.enabled", "bool"),
+    ("auth.bruteforce.protection.testing", "auth.bruteforce.protection.testing", "bool"),
+    ("auth.webauthn.enabled", "auth.webauthn.enabled", "bool"),
+    ("auth.storeCryptedPassword", "auth.storeCryptedPassword", "bool"),
+    ("ratelimit.protection.enabled", "ratelimit.protection.enabled", "bool"),
+    ("hide_login_form", "hide_login_form", "bool"),
+    ("skeleton_directory", "skeletondirectory", "str"),
+    ("template_directory", "templatedirectory", "str"),
+    ("temp_directory", "tempdirectory", "str"),
+    ("update_directory", "updatedirectory", "str"),
+    ("data_directory", "datadirectory", "str"),
+    ("lost_password_link", "lost_password_link", "str"),
+    ("logo_url", "logo_url", "str"),
+    # mail
+    ("mail.domain", "mail_domain", "str"),
+    ("mail.from_address", "mail_from_address", "str"),
+    ("mail.debug", "mail_smtpdebug", "bool"),
+    ("mail.mode", "mail_smtpmode", "str"),
+    ("mail.hostname", "mail_smtphost", "str"),
+    ("mail.port", "mail_smtpport", "int"),
+    ("mail.timeout", "mail_smtptimeout", "int"),
+    ("mail.secure", "mail_smtpsecure", "str"),
+    ("mail.auth.enabled", "mail_smtpauth", "bool", dict(when="mail.auth.enabled")),
+    ("mail.auth.username", "mail_smtpname", "str", dict(when="mail.auth.enabled")),
+    ("mail.auth.password", "mail_smtppassword", "str", dict(when="mail.auth.enabled")),
+    ("mail.template_class", "mail_template_class", "class"),
+    ("mail.send_plaintext_only", "mail_send_plaintext_only", "bool"),
+    ("mail.stream_options", "mail_smtpstreamoptions", "any"),
+    ("mail.sendmailmode", "mail_sendmailmode", "str"),
+    # proxy
+    (("proxy.overwrite.hostname", "proxy.overwrite.host"), "overwritehost", "str"),
+    ("proxy.overwrite.protocol", "overwriteprotocol", "str"),
+    ("proxy.overwrite.web_root", "overwritewebroot", "str"),
+    ("proxy.overwrite.cond_addr", "overwritecondaddr", "str"),
+    ("proxy.overwrite.cli_url", "overwrite.cli.url", "str"),
+    ("proxy.htaccess.rewrite_base", "htaccess.RewriteBase", "str"),
+    ("proxy.htaccess.ignore_front_controller", "htaccess.IgnoreFrontController", "bool"),
+    ("proxy.proxy_name", "proxy", "str"),
+    ("proxy.password", "proxyuserpwd", "str"),
+    ("proxy.exclude", "proxyexclude", "list"),
+    ("proxy.allow_local_remote_servers", "allow_local_remote_servers", "bool"),
+    ("trashbin.retention_obligation", "trashbin_retention_obligation", "str"),
+    ("versions.retention_obligation", "versions_retention_obligation", "str"),
+    ("app_code_checker", "appcodechecker", "bool"),
+    ("update.checker", "updatechecker", "bool"),
+    ("update.server_url", "updater.server.url", "str"),
+    ("update.release_channel", "updater.release.channel", "str"),
+    ("has_internet_connection", "has_internet_connection", "bool"),
+    ("checks.connectivity_domains", "connectivity_check_domains", "list"),
+    ("checks.working_wellknown_setup", "check_for_working_wellknown_setup", "bool"),
+    ("checks.working_htaccess", "check_for_working_htaccess", "bool"),
+    ("checks.data_directory_permissions", "check_data_directory_permissions", "bool"),
+    ("config_is_read_only", "config_is_read_only", "bool"),
+    # logging
+    ("logging.type", "log_type", "str"),
+    ("logging.type_audit", "log_type_audit", "str"),
+    ("logging.file", "logfile", "str"),
+    ("logging.logfile_audit", "logfile_audit", "str"),
+    ("logging.filemode", "logfilemode", "mode"),
+    ("logging.level", "loglevel", "int"),
+    ("logging.level_frontend", "loglevel_frontend", "int"),
+    ("logging.syslog_tag", "syslog_tag", "str"),
+    ("logging.syslog_tag_audit", "syslog_tag_audit", "str"),
+    ("logging.condition", "log.condition", "dict"),
+    ("logging.dateformat", "logdateformat", "str"),
+    ("logging.timezone", "logtimezone", "str"),
+    ("logging.query", "log_query", "bool"),
+    ("logging.rotate_size", "log_rotate_size", "int"),
+    ("profiler", "profiler", "bool"),
+    ("customclient.desktop", "customclient_desktop", "str"),
+    ("customclient.android", "customclient_android", "str"),
+    ("customclient.ios", "customclient_ios", "str"),
+    ("customclient.ios_appid", "customclient_ios_appid", "str"),
+    # apps
+    ("apps.store.enabled", "appstoreenabled", "bool"),
+    ("apps.store.url", "appstoreurl", "str"),
+    ("apps.allowlist", "appsallowlist", "list"),
+    ("apps.paths", "apps_paths", "list"),
+    # previews
+    ("image_previews.enabled", "enable_previews", "bool"),
+    ("image_previews.concurrency.all", "preview_concurrency_all", "int"),
+    ("image_previews.concurrency.new", "preview_concurrency_new", "int"),
+    ("image_previews.max_x", "preview_max_x", "int"),
+    ("image_previews.max_y", "preview_max_y", "int"),
+    ("image_previews.max_filesize_image", "preview_max_filesize_image", "int"),
+    (("image_previews.max_memory", "image_previews.preview_max_memory"), "preview_max_memory", "int"),
+    ("image_previews.libreoffice_path", "preview_libreoffice_path", "str"),
+    ("image_previews.office_cl_parameters", "preview_office_cl_parameters", "args"),
+    ("image_previews.ffmpeg_path", "preview_ffmpeg_path", "str"),
+    (("image_previews.imaginary_url", "image_previews.preview_imaginary_url"), "preview_imaginary_url", "str"),
+    ("image_previews.providers", "enabledPreviewProviders", "list"),
+    ("ldap.UserCleanupInterval", "ldapUserCleanupInterval", "int"),
+    ("ldap.sort_groups_by_name", "sort_groups_by_name", "bool"),
+    ("ldap.ldap_log_file", "ldap_log_file", "str"),
+    ("comments.manager_factory", "comments.managerFactory", "class"),
+    ("systemtags.manager_factory", "systemtags.managerFactory", "class"),
+    ("openssl", "openssl", "dict"),
+    # caching and locking
+    ("memcache.local", "memcache.local", "class"),
+    ("memcache.distributed", "memcache.distributed", "class"),
+    ("memcache.locking", "memcache.locking", "class"),
+    ("memcache.servers", "memcached_servers", "memcached_servers"),
+    ("memcache.options", "memcached_options", "dict"),
+    ("redis", "redis", "redis"),
+    ("redis_cluster", "redis.cluster", "redis_cluster"),
+    ("redis_log_file", "redis_log_file", "str"),
+    ("filelocking.enabled", "filelocking.enabled", "bool"),
+    ("filelocking.ttl", "filelocking.ttl", "int"),
+    ("filelocking.debug", "filelocking.debug", "bool"),
+    ("cache.path", "cache_path", "str"),
+    ("cache.chunk_gc_ttl", "cache_chunk_gc_ttl", "int"),
+    ("objectstore", "objectstore", "dict"),
+    ("sharing.manager_factory", "sharing.managerFactory", "class"),
+    ("sharing.enable_mail_link_password_expiration", "sharing.enable_mail_link_password_expiration", "bool"),
+]
+
+DATABASE_CONFIG = [
+    ("mysql.utf8mb4", "mysql.utf8mb4", "bool", dict(when=("type", ["mysql"]))),
+    ("mysql.collation", "mysql.collation", "str", dict(when=("type", ["mysql"]))),
+    ("username", "dbuser", "str", dict(when=("type", ["mysql", "pgsql"]))),
+    ("password", "dbpassword", "str", dict(when=("type", ["mysql", "pgsql"]))),
+    ("hostname", "dbhost", "str", dict(when=("type", ["mysql", "pgsql"]))),
+    ("port", "dbport", "any", dict(when=("type", ["mysql", "pgsql"]))),
+    ("schema", "dbname", "str", dict(when=("type", ["mysql", "pgsql"]))),
+    ("tableprefix", "dbtableprefix", "str", dict(when=("type", ["mysql", "pgsql"]))),
+    ("replica", "dbreplica", "list", dict(when=("type", ["mysql", "pgsql"]))),
+    ("sqlite.journal_mode", "sqlite.journal_mode", "str", dict(when=("type", ["sqlite3"]))),
+]
+
+# nextcloud key -> area of the config fragment (config/ansible-<area>.config.php)
+# the first matching pattern wins, all other keys belong to 'system'
+CONFIG_AREAS = [
+    ("database", r"^(db|mysql\.|sqlite\.)"),
+    ("caching", r"^(memcache\.|memcached_|redis|filelocking\.|cache_)"),
+    ("logging", r"^(log_|log\.|logfile|loglevel|logdate|logtimezone|syslog_)"),
+    ("previews", r"^(preview_|enable_previews$|enabledPreviewProviders$)"),
+    ("mail", r"^mail_"),
+    ("proxy", r"^(overwrite|htaccess\.|proxy|allow_local_remote_servers$|trusted_domains$)"),
+    ("apps", r"^(appstore|apps|appcodechecker$|defaultapp$)"),
+]
+
+
+def config_area(key):
+    """
+    """
+    for area, pattern in CONFIG_AREAS:
+        if re.match(pattern, key):
+            return area
+
+    return "system"
+
+
+class ConfigSchema(object):
+    """
+        compiles a mapping table (see SYSTEM_CONFIG) once and renders the
+        nextcloud system config from the role parameters in one pass.
+    """
+
+    redis_failover_modes = dict(
+        FAILOVER_NONE=0,
+        FAILOVER_ERROR=1,
+        FAILOVER_DISTRIBUTE=2,
+        FAILOVER_DISTRIBUTE_SLAVES=3,
+    )
+
+    def __init__(self, table):
+        """
+        """
+        converters = {
+            "any": lambda x: x,
+            "str": self.__str,
+            "bool": self.__bool,
+            "int": self.__int,
+            "mode": self.__mode,
+            "list": self.__list,
+            "dict": self.__dict,
+            "csv": lambda x: ",".join(str(v) for v in self.__list(x)),
+            "args": lambda x: " ".join(str(v) for v in self.__list(x)),
+            # yaml users tend to escape the backslashes twice ('\\\\OC\\\\Memcache\\\\APCu')
+            "class": lambda x: self.__str(x).replace("\\\\", "\\"),
+            "memcached_servers": self.__memcached_servers,
+            "redis": self.__redis,
+            "redis_cluster": self.__redis_cluster,
+        }
+
+        self.entries = []
+
+        for entry in table:
+            parameters, key, value_type = entry[:3]
+            options = entry[3] if len(entry) > 3 else dict()
+
+            if value_type not in converters:
+                raise ValueError(f"{key}: unknown type '{value_type}'")
+
+            if isinstance(parameters, str):
+                parameters = (parameters,)
+
+            when = options.get("when")
+
+            if isinstance(when, str):
+                when = (when, None)
+
+            self.entries.append(
+                dict(
+                    paths=[tuple(x.split(".")) for x in parameters],
+                    key=key,
+                    type=value_type,
+                    convert=converters.get(value_type),
+                    when=(tuple(when[0].split(".")), when[1]) if when else None,
+                    default=options.get("default"),
+                )
+            )
+
+    def render(self, parameters):
+        """
+            returns (config, errors)
+        """
+        result = dict()
+        errors = []
+
+        if not parameters:
+            return (result, errors)
+
+        for entry in self.entries:
+            if entry.get("when") and not self.__condition(parameters, *entry.get("when")):
+                continue
+
+            value = None
+
+            for path in entry.get("paths"):
+                value = self.__lookup(parameters, path)
+
+                if not self.__empty(value):
+                    break
+
+            if self.__empty(value) and entry.get("default") is not None:
+                # the default applies only when the parent of the parameter is set
+                parent = entry.get("paths")[0][:-1]
+
+                if len(parent) == 0 or not self.__empty(self.__lookup(parameters, parent)):
+                    value = entry.get("default")
+
+            if self.__empty(value):
+                continue
+
+            try:
+                value = entry.get("convert")(value)
+            except (TypeError, ValueError) as e:
+                errors.append(f"{'.'.join(entry.get('paths')[0])}: {e}")
+                continue
+
+            if not self.__empty(value):
+                result[entry.get("key")] = value
+
+        return (result, errors)
+
+    def __lookup(self, parameters, path):
+        """
+        """
+        value = parameters
+
+        for name in path:
+            if not isinstance(value, dict):
+                return None
+
+            value = value.get(name)
+
+        return value
+
+    def __condition(self, parameters, path, values):
+        """
+        """
+        value = self.__lookup(parameters, path)
+
+        if values is not None:
+            return value in values
+
+        if value is None:
+            # e.g. 'maintenance.enabled' defaults to true
+            return True
+
+        try:
+            return self.__bool(value) if not self.__empty(value) else False
+        except ValueError:
+            return False
+
+    def __empty(self, value):
+        """
+        """
+        return value is None or (not isinstance(value, (bool, int, float)) and len(value) == 0)
+
+    def __str(self, value):
+        """
+        """
+        if isinstance(value, (dict, list)):
+            raise ValueError(f"expected a string, got '{value}'")
+
+        return str(value)
+
+    def __bool(self, value):
+        """
+        """
+        if isinstance(value, bool):
+            return value
+
+        if isinstance(value, int) and value in [0, 1]:
+            return value == 1
+
+        if isinstance(value, str):
+            if value.lower() in ["true", "yes", "on", "1"]:
+                return True
+            if value.lower() in ["false", "no", "off", "0"]:
+                return False
+
+        raise ValueError(f"expected a boolean, got '{value}'")
+
+    def __int(self, value):
+        """
+            also a product like '60 * 60 * 24'
+        """
+        if isinstance(value, bool):
+            raise ValueError(f"expected an integer, got '{value}'")
+
+        if isinstance(value, int):
+            return value
+
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+
+        if isinstance(value, str) and re.match(r"^\s*-?[0-9]+(\s*\*\s*[0-9]+)*\s*$", value):
+            result = 1
+
+            for factor in value.split("*"):
+                result *= int(factor)
+
+            return result
+
+        raise ValueError(f"expected an integer, got '{value}'")
+
+    def __float(self, value):
+        """
+        """
+        if isinstance(value, bool):
+            raise ValueError(f"expected a number, got '{value}'")
+
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"expected a number, got '{value}'")
+
+    def __mode(self, value):
+        """
+            file mode, '0640' or 416
+        """
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+
+        if isinstance(value, str) and re.match(r"^0?[0-7]{3,4}$", value):
+            return int(value, base=8)
+
+        raise ValueError(f"expected a file mode, got '{value}'")
+
+    def __list(self, value):
+        """
+        """
+        if isinstance(value, (list, tuple)):
+            return list(value)
+
+        if isinstance(value, dict):
+            raise ValueError(f"expected a list, got '{value}'")
+
+        return [value]
+
+    def __dict(self, value):
+        """
+            a list of dictionaries is merged, empty values are removed
+        """
+        if isinstance(value, list) and all(isinstance(x, dict) for x in value):
+            merged = dict()
+
+            for x in value:
+                merged.update(x)
+
+            value = merged
+
+        if not isinstance(value, dict):
+            raise ValueError(f"expected a dictionary, got '{value}'")
+
+        return {k: v for k, v in value.items() if not self.__empty(v)}
+
+    def __memcached_servers(self, value):
+        """
+            [{host, port, weight}] -> [[host, port, weight]]
+        """
+        return [
+            list(x.values()) if isinstance(x, dict) else self.__list(x)
+            for x in self.__list(value)
+        ]
+
+    def __redis(self, value):
+        """
+            one redis server, a TCP host or a unix socket (port 0)
+
+            'tls: true' connects with 'tls://<host>', the certificates are
+            given as 'ssl_context'
+        """
+        if isinstance(value, list):
+            if len(value) > 1:
+                raise ValueError("nextcloud supports only one redis server, use 'redis_cluster' for more")
+
+            value = value[0] if len(value) > 0 else dict()
+
+        value = self.__redis_options(value)
+
+        if "sentinel" in value or "sentinels" in value:
+            raise ValueError("nextcloud has no redis sentinel support, use 'redis_cluster' or a local proxy")
+
+        host = self.__str(value.get("host", ""))
+
+        if not host:
+            raise ValueError("'host' is missing")
+
+        if value.pop("tls", False) and not host.startswith(("tls://", "/")):
+            host = f"tls://{host}"
+
+        value["host"] = host
+
+        if host.startswith("/"):
+            # unix socket
+            value["port"] = 0
+        elif "port" in value:
+            value["port"] = self.__int(value.get("port"))
+
+        if "dbindex" in value:
+            value["dbindex"] = self.__int(value.get("dbindex"))
+
+        return value
+
+    def __redis_cluster(self, value):
+        """
+            seeds: ['host:port', ...], TLS is enabled with 'ssl_context'
+        """
+        if isinstance(value, list):
+            if len(value) > 1:
+                raise ValueError("only one cluster is supported")
+
+            value = value[0] if len(value) > 0 else dict()
+
+        value = self.__redis_options(value)
+        seeds = [self.__str(x) for x in self.__list(value.get("seeds", []))]
+
+        if len(seeds) == 0:
+            raise ValueError("'seeds' is missing")
+
+        invalid = [x for x in seeds if not re.match(r"^.+:[0-9]+$", x)]
+
+        if len(invalid) > 0:
+            raise ValueError(f"a seed needs a port: {', '.join(invalid)}")
+
+        value["seeds"] = seeds
+
+        failover_mode = str(value.get("failover_mode", ""))
+
+        if failover_mode:
+            # \RedisCluster::FAILOVER_ERROR
+            name = failover_mode.split("::")[-1]
+
+            if name in self.redis_failover_modes:
+                value["failover_mode"] = self.redis_failover_modes.get(name)
+            else:
+                value["failover_mode"] = self.__int(failover_mode)
+
+        return value
+
+    def __redis_options(self, value):
+        """
+            options of a server and a cluster
+        """
+        value = self.__dict(value)
+
+        for key in ["timeout", "read_timeout"]:
+            if key in value:
+                value[key] = self.__float(value.get(key))
+
+        if "tls" in value:
+            value["tls"] = self.__bool(value.get("tls"))
+
+        if "ssl_context" in value:
+            value["ssl_context"] = self.__dict(value.get("ssl_context"))
+
+        return value
@@ -0,0 +1,438 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2020-2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import absolute_import, print_function
+import os
+import re
+import json
+import time
+
+from ansible.module_utils.nextcloud_occ_worker import OccWorker
+from ansible.module_utils.nextcloud_occ_timings import OccTimings
+from ansible.module_utils.nextcloud_php_config import NextcloudPhpConfig
+from ansible.module_utils.nextcloud_state_cache import StateCache
+
+__metaclass__ = type
+
+
+class OccClient(object):
+    """
+        shared occ client for all nextcloud modules
+
+        results of read-only commands are kept for the lifetime of the
+        module run. every other command is treated as mutating and drops
+        all cached results.
+        'check', 'status' and the lists of apps, users and groups are also
+        persisted in an on-disk cache (see StateCache) and reused by the
+        following module runs as long as the installation is unchanged.
+        whether Nextcloud is installed and up to date is read from
+        config/config.php and version.php first, occ is only asked when
+        these files do not give a clear answer or an app version differs
+        from the last one confirmed by 'occ status'.
+        every call is recorded in 'timings' (see OccTimings).
+    """
+    module = None
+
+    read_only_commands = [
+        "check",
+        "status",
+        "app:getpath",
+        "user:info",
+    ]
+
+    # read-only with <uid> and an optional <app> only
+    read_only_settings_commands = [
+        "user:setting",
+    ]
+
+    # 'user:list' and 'group:list' return only 500 entries by default
+    list_page_size = 5000
+
+    def __init__(self, module, working_dir, owner, use_worker=True, cache_ttl=0, trace_file=None):
+        """
+        """
+        self.module = module
+
+        self.working_dir = working_dir
+        self.owner = owner
+
+        self.occ_base_args = [
+            "sudo",
+            "--preserve-env",
+            "--user",
+            self.owner,
+            "php",
+            "occ"
+        ]
+
+        self.occ = os.path.join(self.working_dir, "occ")
+
+        self.worker = None
+
+        if use_worker:
+            self.worker = OccWorker(module, working_dir=self.working_dir, owner=self.owner)
+
+        self.state_cache = StateCache(module, working_dir=self.working_dir, ttl=cache_ttl)
+        self.php_config = NextcloudPhpConfig(self.working_dir)
+        self.timings = OccTimings(module, trace_file=trace_file)
+
+        self._cache = dict()
+
+    def available(self):
+        """
+        """
+        return os.path.exists(self.occ)
+
+    def exec(self, args, check_rc=False, environ_update=None):
+        """
+            execute 'occ' with the given arguments
+
+            returns (rc, out, err) like module.run_command()
+        """
+        args = [str(x) for x in args]
+        read_only = self.__read_only(args)
+        cache_key = tuple(args)
+        start = time.monotonic()
+
+        if read_only:
+            result = self._cache.get(cache_key)
+
+            if not result:
+                result = self.state_cache.get(args)
+
+            if result:
+                self._cache[cache_key] = result
+                self.timings.record(args, "cache", time.monotonic() - start, *result)
+                return result
+        else:
+            self.invalidate()
+
+        source = None
+
+        if self.worker and self.worker.usable(args):
+            source = "worker"
+            rc, out, err = self.worker.run(args, environ_update=environ_update)
+
+            if read_only and not self.worker.usable(args):
+                # the worker has died, a read can safely be repeated
+                self.module.log(msg=f"occ worker failed, '{args[0]}' is repeated with 'php occ'")
+                source = None
+
+        if source is None:
+            source = "process"
+            commands = self.occ_base_args + args
+
+            rc, out, err = self.module.run_command(
+                commands,
+                cwd=self.working_dir,
+                check_rc=False,
+                environ_update=environ_update)
+
+        self.timings.record(args, source, time.monotonic() - start, rc, out, err)
+
+        if check_rc and rc != 0:
+            self.module.fail_json(
+                cmd=self.timings.redact(args),
+                rc=rc,
+                stdout=out,
+                stderr=err,
+                msg=err.strip(),
+                **self.timings.result())
+
+        if rc != 0:
+            self.module.log(msg=f"cmd: '{self.timings.redact(args)}'")
+            self.module.log(msg=f"  rc : '{rc}'")
+            self.module.log(msg=f"  out: '{out}'")
+            self.module.log(msg=f"  err: '{err}'")
+
+        if read_only:
+            self._cache[cache_key] = (rc, out, err)
+            self.state_cache.set(args, (rc, out, err))
+
+        return rc, out, err
+
+    def action(self, action, **arguments):
+        """
+            execute an action of the occ worker which has no occ command
+
+            returns (rc, out, err) like module.run_command()
+        """
+        start = time.monotonic()
+
+        self.invalidate()
+
+        if not self.action_available(action):
+            return (1, "", f"'{action}' is only available with the occ worker (nextcloud_occ_worker).")
+
+        rc, out, err = self.worker.run_action(action, **arguments)
+
+        self.timings.record([action] + [str(x) for x in arguments.values()], "worker", time.monotonic() - start, rc, out, err)
+
+        return rc, out, err
+
+    def action_available(self, action):
+        """
+            True when the occ worker can execute 'action'
+        """
+        return self.worker is not None and self.worker.usable([action])
+
+    def invalidate(self):
+        """
+            forget all cached results
+        """
+        self._cache = dict()
+        self.state_cache.invalidate()
+
+    def installation_state(self):
+        """
+            returns the state of the installation from config.php and
+            version.php or None when the files are ambiguous
+        """
+        return self.php_config.state()
+
+    def installed_and_current(self):
+        """
+            True when Nextcloud is installed, not in maintenance mode and
+            no upgrade is pending, without starting PHP
+        """
+        state = self.installation_state()
+
+        if not state:
+            return False
+
+        if not state.get("installed") or state.get("maintenance") or state.get("needs_upgrade"):
+            return False
+
+        app_versions = self.php_config.app_versions()
+
+        if app_versions == self.state_cache.confirmed_app_versions():
+            return True
+
+        # pending app upgrades are only known to the database, 'occ status' includes them
+        return self.__confirm_app_versions(app_versions)
+
+    def check(self, check_installed=False):
+        """
+            sudo -u www-data php occ check
+
+            not installed: "Nextcloud is not installed - only a limited number of commands are available"
+            installed: ''
+        """
+        if check_installed and self.installed_and_current():
+            return (0, True, "", "")
+
+        rc, out, err = self.exec(["check", "--no-ansi", "--output", "json"])
+
+        if not check_installed:
+            return rc, out, err
+
+        installed = False
+
+        if rc == 0:
+            pattern = re.compile(r"Nextcloud is not installed.*", re.MULTILINE)
+            not_installed = re.search(pattern, err)
+
+            installed = not not_installed
+        else:
+            err = self.exception_message(out)
+
+        return (rc, installed, out, err)
+
+    def status(self):
+        """
+            sudo -u www-data php occ status --output json
+
+            returns (rc, status, err)
+        """
+        status = dict()
+
+        if self.installed_and_current():
+            state = self.installation_state()
+
+            status = dict(
+                installed=True,
+                version=state.get("version"),
+                versionstring=state.get("version_string"),
+                edition=state.get("edition"),
+                maintenance=False,
+                needsDbUpgrade=False,
+            )
+
+            return (0, status, "")
+
+        rc, out, err = self.exec(["status", "--no-ansi", "--output", "json"])
+
+        if rc == 0:
+            try:
+                status = json.loads(out)
+            except ValueError:
+                pass
+        else:
+            err = self.exception_message(out)
+
+        return (rc, status, err)
+
+    def __confirm_app_versions(self, app_versions):
+        """
+            True and the app versions are stored, when 'occ status' reports
+            no pending upgrade
+        """
+        rc, out, err = self.exec(["status", "--no-ansi", "--output", "json"])
+
+        if rc != 0:
+            return False
+
+        try:
+            status = json.loads(out)
+        except ValueError:
+            return False
+
+        if not isinstance(status, dict) or not status.get("installed") or status.get("maintenance") or status.get("needsDbUpgrade"):
+            return False
+
+        self.state_cache.confirm_app_versions(app_versions)
+
+        return True
+
+    def list_users(self):
+        """
+            returns a dictionary with user id and display name
+        """
+        return self.__list("user:list", paginate=True)
+
+    def list_groups(self, info=False):
+        """
+            returns a dictionary with group id and group members
+
+            with 'info': group id -> {displayName, backends, users}
+        """
+        if info:
+            return self.__list("group:list", paginate=True, options=["--info"])
+
+        return self.__list("group:list", paginate=True)
+
+    def list_apps(self):
+        """
+            returns (all apps, enabled apps, disabled apps)
+        """
+        app_names = self.__list("app:list")
+
+        enabled_apps = [x for x, _ in app_names.get("enabled", {}).items()]
+        disabled_apps = [x for x, _ in app_names.get("disabled", {}).items()]
+
+        return (app_names, enabled_apps, disabled_apps)
+
+    def app_config(self, app_names=[]):
+        """
+            returns the stored config values of 'app_names' (all apps, when empty)
+
+            {app: {key: value}}
+        """
+        args = ["config:list", "--no-ansi", "--output", "json", "--private"]
+
+        if len(app_names) == 1:
+            args.append(app_names[0])
+
+        data = self.__json(args).get("apps", {})
+
+        return {
+            app: (values if isinstance(values, dict) else dict())
+            for app, values in data.items()
+            if len(app_names) == 0 or app in app_names
+        }
+
+    def system_config(self):
+        """
+            returns the effective system configuration
+
+            config/config.php is parsed directly, 'occ config:list system'
+            is only asked when the files can not be read.
+        """
+        config = self.php_config.system_config()
+
+        if config is None:
+            args = ["config:list", "--no-ansi", "--output", "json", "--private", "system"]
+            config = self.__json(args).get("system", {})
+
+        return config if isinstance(config, dict) else dict()
+
+    def exception_message(self, out):
+        """
+            extract the exception from a failed occ call
+        """
+        err = out.strip()
+
+        pattern = re.compile(r"An unhandled exception has been thrown:\n(?P<exception>.*)\n.*", re.MULTILINE)
+        exception = re.search(pattern, err)
+
+        if exception:
+            err = exception.group("exception")
+
+        return err
+
+    def __list(self, command, paginate=False, options=[]):
+        """
+        """
+        args = [command, "--no-ansi", "--output", "json"] + options
+
+        if not paginate:
+            return self.__json(args)
+
+        result = dict()
+        offset = 0
+
+        while True:
+            page = self.__json(args + ["--limit", self.list_page_size, "--offset", offset])
+
+            result.update(page)
+
+            if len(page) < self.list_page_size:
+                break
+
+            offset += self.list_page_size
+
+        return result
+
+    def __json(self, args):
+        """
+        """
+        rc, out, err = self.exec(args)
+
+        if rc == 0:
+            try:
+                data = json.loads(out)
+                # php encodes an empty array as list
+                return data if isinstance(data, dict) else dict()
+            except ValueError:
+                self.module.log(msg=f"{args[0]}: invalid json output")
+
+        return dict()
+
+    def __read_only(self, args):
+        """
+        """
+        command = args[0] if len(args) > 0 else ""
+
+        if command in self.read_only_commands or command.endswith(":list"):
+            return True
+
+        if command in self.read_only_settings_commands:
+            # <uid> [<app>] lists the settings, a <key> gets, sets or deletes one
+            arguments = []
+            option_value = False
+
+            for arg in args[1:]:
+                if option_value:
+                    option_value = False
+                elif arg in ["--output", "--default-value"]:
+                    option_value = True
+                elif not arg.startswith("-"):
+                    arguments.append(arg)
+
+            return len(arguments) <= 2 and "--delete" not in args
+
+        return False
@@ -0,0 +1,163 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import absolute_import, print_function
+import os
+import re
+import json
+import time
+
+__metaclass__ = type
+
+
+class OccTimings(object):
+    """
+        records subcommand, wall time, return code and output size of
+        every occ call.
+
+        values of arguments which look like passwords or secrets are never
+        recorded. the environment (e.g. OC_PASS) is not recorded at all.
+    """
+    module = None
+
+    # --admin-pass, --database-pass, --password, --client-secret, ... (not --password-from-env)
+    secret_options = re.compile(r"^--?(?:[a-z0-9]+-)*(?:pass|password|secret|token)$", re.IGNORECASE)
+    # config keys: dbpassword, mail_smtppassword, passwordsalt, secret, wopi_secret, access_token, ...
+    secret_keys = re.compile(r"^[a-z0-9_.]*(?:password|passwd|secret|token)$|^passwordsalt$", re.IGNORECASE)
+    mask = "********"
+
+    # options with the value of a config key, which can be given before or after them
+    value_options = [
+        "--value",
+        "--default-value",
+    ]
+
+    def __init__(self, module, trace_file=None):
+        """
+        """
+        self.module = module
+        self.trace_file = trace_file
+
+        self._calls = []
+
+    def record(self, args, source, duration, rc, out, err):
+        """
+            source is one of 'process', 'worker' or 'cache'
+        """
+        entry = dict(
+            command=args[0] if len(args) > 0 else "",
+            args=self.redact(args[1:]),
+            source=source,
+            time=round(duration, 4),
+            rc=rc,
+            stdout_bytes=len(out.encode("utf-8")) if out else 0,
+            stderr_bytes=len(err.encode("utf-8")) if err else 0,
+        )
+
+        self._calls.append(entry)
+
+        if self.trace_file:
+            self.__trace(entry)
+
+    def calls(self):
+        """
+        """
+        return self._calls
+
+    def total(self):
+        """
+            summary over all recorded calls, grouped by subcommand
+        """
+        commands = dict()
+
+        for entry in self._calls:
+            command = commands.setdefault(entry.get("command"), dict(calls=0, time=0.0))
+            command["calls"] += 1
+            command["time"] += entry.get("time")
+
+        for command in commands.values():
+            command["time"] = round(command["time"], 4)
+
+        return dict(
+            calls=len(self._calls),
+            executed=len([x for x in self._calls if x.get("source") != "cache"]),
+            cached=len([x for x in self._calls if x.get("source") == "cache"]),
+            time=round(sum(x.get("time") for x in self._calls), 4),
+            commands=commands
+        )
+
+    def result(self):
+        """
+            the part of the module result
+        """
+        return dict(
+            timings=self.calls(),
+            timings_total=self.total()
+        )
+
+    def redact(self, args):
+        """
+            --admin-pass=foo              -> --admin-pass=********
+            --database-pass foo           -> --database-pass ********
+            config:system:set dbpassword --value=foo
+                                          -> dbpassword --value=********
+            config:app:set --value foo app dbpassword
+                                          -> --value ******** app dbpassword
+
+            the values of the 'value_options' are masked wherever they appear,
+            when one of the arguments is a secret config key
+        """
+        result = []
+        hide_next = False
+
+        secret_key = any(not x.startswith("-") and self.secret_keys.match(x) for x in args)
+        value_options = self.value_options if secret_key else []
+
+        for arg in args:
+            name, separator, value = arg.partition("=")
+
+            if hide_next:
+                hide_next = False
+
+                if not arg.startswith("-"):
+                    result.append(self.mask)
+                    continue
+
+            if arg.startswith("-") and separator and (name in value_options or self.secret_options.match(name)):
+                result.append(f"{name}={self.mask}")
+                continue
+
+            result.append(arg)
+
+            if separator:
+                continue
+
+            if arg in value_options or self.secret_options.match(arg):
+                hide_next = True
+            elif not arg.startswith("-") and self.secret_keys.match(arg):
+                # the value after a secret config key
+                hide_next = True
+
+        return result
+
+    def __trace(self, entry):
+        """
+            append one json line per call
+        """
+        line = dict(
+            timestamp=round(time.time(), 4),
+            pid=os.getpid(),
+            module=getattr(self.module, "_name", None),
+        )
+        line.update(entry)
+
+        try:
+            with open(self.trace_file, "a") as f:
+                f.write(f"{json.dumps(line)}\n")
+        except OSError as e:
+            self.module.log(msg=f"occ trace: {e}")
+            self.trace_file = None
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import absolute_import, print_function
+import os
+import json
+import atexit
+import select
+import subprocess
+
+__metaclass__ = type
+
+
+class OccWorker(object):
+    """
+        talks to the persistent occ dispatcher (files/occ_worker.php)
+
+        the dispatcher boots Nextcloud once and executes any number of occ
+        commands afterwards.
+        when the dispatcher is not deployed or can not be started, every
+        call to usable() returns False and the caller has to fall back to
+        a normal 'php occ' process.
+    """
+    module = None
+
+    # these commands change the code base or need a fresh bootstrap
+    bootstrap_commands = [
+        "maintenance:install",
+        "maintenance:repair",
+        "upgrade",
+        "app:update",
+    ]
+
+    def __init__(self, module, working_dir, owner, script=None, timeout=60, request_timeout=900):
+        """
+            timeout: seconds for the bootstrap of the dispatcher
+            request_timeout: seconds for one command (e.g. an app migration)
+        """
+        self.module = module
+        self.working_dir = os.path.normpath(working_dir)
+        self.owner = owner
+        self.timeout = timeout
+        self.request_timeout = request_timeout
+
+        if not script:
+            script = os.path.join(os.path.dirname(self.working_dir), "occ_worker.php")
+
+        self.script = script
+
+        self._process = None
+        self._failed = not os.path.isfile(self.script)
+
+    def usable(self, args):
+        """
+            returns True when the given occ arguments can be executed
+            through the dispatcher.
+        """
+        if self._failed or len(args) == 0:
+            return False
+
+        if args[0] in self.bootstrap_commands:
+            return False
+
+        if self._process is None:
+            self.__start()
+
+        return not self._failed
+
+    def run(self, args, environ_update=None):
+        """
+            execute one occ command
+
+            returns (rc, out, err) like module.run_command()
+        """
+        request = dict(
+            args=[str(x) for x in args],
+            env={k: str(v) for k, v in (environ_update or {}).items()}
+        )
+
+        return self.__request(request)
+
+    def run_action(self, action, **arguments):
+        """
+            execute an action of the dispatcher which has no occ command
+            ('app:download', 'app:upgrade', 'group:displayname')
+
+            returns (rc, out, err) like module.run_command()
+        """
+        request = {k: str(v) for k, v in arguments.items()}
+        request["action"] = action
+
+        return self.__request(request)
+
+    def __request(self, request):
+        """
+        """
+        if self._process is None:
+            return (1, "", "The occ worker is not running.")
+
+        error = "The occ worker was terminated unexpectedly."
+
+        try:
+            self._process.stdin.write(f"{json.dumps(request)}\n")
+            self._process.stdin.flush()
+            response = self.__read_line(timeout=self.request_timeout)
+
+            if response is None and self._process.poll() is None:
+                error = f"The occ worker did not answer within {self.request_timeout} seconds."
+        except (OSError, ValueError) as e:
+            response = None
+            self.module.log(msg=f"occ worker: {e}")
+
+        if not response:
+            # a hanging dispatcher is killed, the following commands use 'php occ'
+            self.__terminate()
+            self._failed = True
+
+            return (1, "", error)
+
+        return (response.get("rc", 1), response.get("stdout", ""), response.get("stderr", ""))
+
+    def stop(self):
+        """
+        """
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+                self._process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.__terminate()
+
+            self._process = None
+
+    def __start(self):
+        """
+        """
+        args = [
+            "sudo",
+            "--user",
+            self.owner,
+            "php",
+            self.script,
+            self.working_dir
+        ]
+
+        try:
+            self._process = subprocess.Popen(
+                args,
+                cwd=self.working_dir,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+                bufsize=1
+            )
+        except OSError as e:
+            self.module.log(msg=f"occ worker can not be started: {e}")
+            self._failed = True
+            return
+
+        atexit.register(self.stop)
+
+        ready = self.__read_line(timeout=self.timeout)
+
+        if not ready or not ready.get("ready", False):
+            error = ready.get("error") if ready else "no response"
+            self.module.log(msg=f"occ worker is not available: {error}")
+            self.__terminate()
+            self._failed = True
+            return
+
+        self.module.log(msg=f"occ worker is ready (Nextcloud {ready.get('version')})")
+
+    def __read_line(self, timeout=None):
+        """
+        """
+        if timeout is not None:
+            readable, _, _ = select.select([self._process.stdout], [], [], timeout)
+            if not readable:
+                return None
+
+        line = self._process.stdout.readline()
+
+        if not line:
+            return None
+
+        try:
+            return json.loads(line)
+        except ValueError:
+            self.module.log(msg=f"occ worker: invalid response '{line.strip()}'")
+            return None
+
+    def __terminate(self):
+        """
+        """
+        if self._process is not None:
+            try:
+                self._process.kill()
+                self._process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+
+            self._process = None
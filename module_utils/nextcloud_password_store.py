@@ -0,0 +1,136 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import absolute_import, print_function
+import os
+import hmac
+import json
+import hashlib
+
+__metaclass__ = type
+
+
+class PasswordStore(object):
+    """
+        salted, slow hashed fingerprints of the passwords which were last
+        applied to the Nextcloud users.
+
+        the file is only readable by the user running the module (root).
+        a password is only reset when its fingerprint differs.
+    """
+    module = None
+
+    cache_directory = "/var/cache/ansible/nextcloud"
+
+    scrypt_parameters = dict(n=2**14, r=8, p=1)
+    pbkdf2_iterations = 200000
+
+    def __init__(self, module, working_dir):
+        """
+        """
+        self.module = module
+        self.working_dir = os.path.realpath(working_dir)
+
+        instance = hashlib.sha1(self.working_dir.encode("utf-8")).hexdigest()[:12]
+        self.store_file = os.path.join(self.cache_directory, f"passwords.{instance}.json")
+
+        self._data = None
+        self._changed = False
+
+    def matches(self, user, password):
+        """
+            True, when 'password' was the last applied password of 'user'
+        """
+        entry = self.__load().get(user)
+
+        if not entry or not password:
+            return False
+
+        try:
+            salt = bytes.fromhex(entry.get("salt"))
+            digest = self.__hash(str(password), salt, entry.get("algorithm"), entry.get("parameters", {}))
+        except (TypeError, ValueError):
+            return False
+
+        return hmac.compare_digest(digest, entry.get("hash", ""))
+
+    def set(self, user, password):
+        """
+        """
+        if not password:
+            return
+
+        salt = os.urandom(16)
+
+        if hasattr(hashlib, "scrypt"):
+            algorithm, parameters = "scrypt", self.scrypt_parameters
+        else:
+            algorithm, parameters = "pbkdf2_sha256", dict(iterations=self.pbkdf2_iterations)
+
+        self.__load()[user] = dict(
+            algorithm=algorithm,
+            parameters=parameters,
+            salt=salt.hex(),
+            hash=self.__hash(str(password), salt, algorithm, parameters)
+        )
+
+        self._changed = True
+
+    def remove(self, user):
+        """
+        """
+        if self.__load().pop(user, None):
+            self._changed = True
+
+    def save(self):
+        """
+        """
+        if not self._changed:
+            return
+
+        try:
+            if not os.path.isdir(self.cache_directory):
+                os.makedirs(self.cache_directory, mode=0o750)
+
+            tmp_file = f"{self.store_file}.{os.getpid()}"
+
+            with open(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                json.dump(self._data, f)
+
+            os.replace(tmp_file, self.store_file)
+            self._changed = False
+        except OSError as e:
+            self.module.log(msg=f"password store: {e}")
+
+    def __hash(self, password, salt, algorithm, parameters):
+        """
+        """
+        if algorithm == "scrypt":
+            digest = hashlib.scrypt(password.encode("utf-8"), salt=salt, **parameters)
+        elif algorithm == "pbkdf2_sha256":
+            digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, parameters.get("iterations"))
+        else:
+            raise ValueError(f"unsupported algorithm {algorithm}")
+
+        return digest.hex()
+
+    def __load(self):
+        """
+        """
+        if self._data is not None:
+            return self._data
+
+        self._data = dict()
+
+        if os.path.isfile(self.store_file):
+            try:
+                with open(self.store_file) as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError) as e:
+                self.module.log(msg=f"password store: {e}")
+
+        return self._data
@@ -0,0 +1,383 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import absolute_import, print_function
+import os
+import re
+import glob
+
+__metaclass__ = type
+
+
+class PhpParseError(ValueError):
+    pass
+
+
+class PhpLiteralParser(object):
+    """
+        parser for the subset of PHP that Nextcloud writes into
+        config/config.php and version.php:
+
+            $NAME = <literal>;
+
+        literals are strings, numbers, true / false / null and (nested)
+        arrays in both notations, 'array( ... )' and '[ ... ]'.
+        everything else (constants, expressions, function calls) raises
+        a PhpParseError, the caller has to ask occ in that case.
+    """
+
+    token_spec = [
+        ("comment", r"//[^\n]*|\#[^\n]*|/\*.*?\*/"),
+        ("open_tag", r"<\?php"),
+        ("close_tag", r"\?>"),
+        ("variable", r"\$[A-Za-z_][A-Za-z0-9_]*"),
+        ("string", r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\""),
+        ("number", r"-?(?:0[xX][0-9a-fA-F_]+|0[oO][0-7_]+|0[bB][01_]+|[\d_]+\.[\d_]*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?|\d[\d_]*(?:[eE][-+]?\d+)?)"),
+        ("arrow", r"=>"),
+        ("name", r"\\?[A-Za-z_][A-Za-z0-9_\\]*(?:::[A-Za-z_][A-Za-z0-9_]*)?"),
+        ("punct", r"[=;,()\[\]]"),
+        ("space", r"\s+"),
+        ("other", r"."),
+    ]
+
+    double_quoted_escapes = {
+        "n": "\n",
+        "t": "\t",
+        "r": "\r",
+        "v": "\v",
+        "e": "\x1b",
+        "f": "\f",
+        "0": "\0",
+        "\\": "\\",
+        "$": "$",
+        '"': '"',
+    }
+
+    def __init__(self, source):
+        """
+        """
+        regex = "|".join(f"(?P<{name}>{pattern})" for name, pattern in self.token_spec)
+        self.tokens = [
+            (m.lastgroup, m.group())
+            for m in re.finditer(regex, source, re.DOTALL)
+            if m.lastgroup not in ["comment", "space", "open_tag", "close_tag"]
+        ]
+        self.position = 0
+
+    def assignments(self):
+        """
+            returns a dictionary with all top level assignments
+        """
+        result = dict()
+
+        while self.__peek() is not None:
+            kind, value = self.__next()
+
+            if kind != "variable":
+                raise PhpParseError(f"unexpected '{value}'")
+
+            self.__expect("=")
+            result[value[1:]] = self.__literal()
+            self.__expect(";")
+
+        return result
+
+    def __literal(self):
+        """
+        """
+        kind, value = self.__next()
+
+        if kind == "string":
+            return self.__string(value)
+
+        if kind == "number":
+            return self.__number(value)
+
+        if kind == "name":
+            lower = value.lower()
+
+            if lower == "true":
+                return True
+            if lower == "false":
+                return False
+            if lower == "null":
+                return None
+            if lower == "array":
+                self.__expect("(")
+                return self.__array(")")
+
+            raise PhpParseError(f"unsupported constant '{value}'")
+
+        if value == "[":
+            return self.__array("]")
+
+        raise PhpParseError(f"unexpected '{value}'")
+
+    def __array(self, closing):
+        """
+            PHP arrays with consecutive integer keys starting at 0 are
+            returned as list, all other arrays as dict.
+        """
+        result = dict()
+        next_index = 0
+
+        while True:
+            token = self.__peek()
+
+            if token is None:
+                raise PhpParseError("unterminated array")
+
+            if token[1] == closing:
+                self.__next()
+                break
+
+            value = self.__literal()
+
+            if self.__peek() is not None and self.__peek()[0] == "arrow":
+                self.__next()
+                key = value
+                value = self.__literal()
+
+                if isinstance(key, bool) or key is None or isinstance(key, float):
+                    key = int(key) if key is not None else ""
+                if isinstance(key, str) and re.match(r"^(0|-?[1-9][0-9]*)$", key):
+                    key = int(key)
+                if isinstance(key, int):
+                    next_index = max(next_index, key + 1)
+            else:
+                key = next_index
+                next_index += 1
+
+            result[key] = value
+
+            token = self.__peek()
+
+            if token is not None and token[1] == ",":
+                self.__next()
+
+        if list(result.keys()) == list(range(len(result))):
+            return list(result.values())
+
+        return result
+
+    def __string(self, value):
+        """
+        """
+        quote = value[0]
+        body = value[1:-1]
+
+        if quote == "'":
+            return re.sub(r"\\([\\'])", r"\1", body)
+
+        if re.search(r"(?<!\\)\$", body):
+            raise PhpParseError("string interpolation is not supported")
+
+        return re.sub(
+            r"\\(.)",
+            lambda m: self.double_quoted_escapes.get(m.group(1), m.group(0)),
+            body
+        )
+
+    def __number(self, value):
+        """
+            0x1F, 0o640 / 0640 (octal), 0b101, 1_000, 1.5e3
+        """
+        sign = -1 if value.startswith("-") else 1
+        digits = value.lstrip("-").replace("_", "")
+        prefix = digits[:2].lower()
+
+        try:
+            if prefix == "0x":
+                return sign * int(digits[2:], 16)
+            if prefix == "0o":
+                return sign * int(digits[2:], 8)
+            if prefix == "0b":
+                return sign * int(digits[2:], 2)
+
+            if re.search(r"[.eE]", digits):
+                return sign * float(digits)
+
+            if len(digits) > 1 and digits.startswith("0"):
+                # a leading 0 is octal in PHP
+                return sign * int(digits, 8)
+
+            return sign * int(digits)
+        except ValueError:
+            raise PhpParseError(f"invalid number '{value}'")
+
+    def __peek(self):
+        """
+        """
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+
+        return None
+
+    def __next(self):
+        """
+        """
+        token = self.__peek()
+
+        if token is None:
+            raise PhpParseError("unexpected end of file")
+
+        self.position += 1
+
+        return token
+
+    def __expect(self, value):
+        """
+        """
+        kind, token = self.__next()
+
+        if token != value:
+            raise PhpParseError(f"expected '{value}', got '{token}'")
+
+
+class NextcloudPhpConfig(object):
+    """
+        reads config/config.php (merged with config/*.config.php) and
+        version.php without starting PHP
+    """
+
+    def __init__(self, working_dir):
+        """
+        """
+        self.working_dir = working_dir
+        self.config_directory = os.path.join(working_dir, "config")
+
+    def system_config(self, include_fragments=True):
+        """
+            returns the effective system configuration or None when one of
+            the files can not be read or parsed.
+
+            without 'include_fragments' only config/config.php is read.
+        """
+        config_file = os.path.join(self.config_directory, "config.php")
+
+        files = [config_file]
+
+        if include_fragments:
+            files += sorted(
+                x for x in glob.glob(os.path.join(self.config_directory, "*.config.php"))
+            )
+
+        result = dict()
+
+        for file_name in files:
+            values = self.__read(file_name)
+
+            if values is None:
+                return None
+
+            config = values.get("CONFIG", {})
+
+            if not isinstance(config, dict):
+                return None
+
+            # same as array_merge() in lib/private/Config.php
+            result.update(config)
+
+        return result
+
+    def app_versions(self, config=None):
+        """
+            returns {app: version} from appinfo/info.xml in the apps directories
+        """
+        if config is None:
+            config = self.system_config() or dict()
+
+        apps_paths = config.get("apps_paths") or []
+
+        if isinstance(apps_paths, dict):
+            apps_paths = list(apps_paths.values())
+
+        directories = [x.get("path") for x in apps_paths if isinstance(x, dict) and x.get("path")]
+
+        if len(directories) == 0:
+            directories = [os.path.join(self.working_dir, "apps")]
+
+        result = dict()
+
+        for directory in directories:
+            for info_file in sorted(glob.glob(os.path.join(directory, "*", "appinfo", "info.xml"))):
+                app = os.path.basename(os.path.dirname(os.path.dirname(info_file)))
+
+                if app in result:
+                    # the first apps directory wins
+                    continue
+
+                try:
+                    with open(info_file, encoding="utf-8") as f:
+                        version = re.search(r"<version>\s*([^<\s]+)\s*</version>", f.read())
+                except (OSError, UnicodeDecodeError):
+                    version = None
+
+                result[app] = version.group(1) if version else None
+
+        return result
+
+    def code_version(self):
+        """
+            returns $OC_Version, $OC_VersionString and $OC_Edition from
+            version.php or None
+        """
+        values = self.__read(os.path.join(self.working_dir, "version.php"))
+
+        if not values or not isinstance(values.get("OC_Version"), list):
+            return None
+
+        return dict(
+            version=".".join(str(x) for x in values.get("OC_Version")),
+            version_string=values.get("OC_VersionString"),
+            edition=values.get("OC_Edition", "")
+        )
+
+    def state(self):
+        """
+            returns a dictionary with 'installed', 'version', 'code_version',
+            'maintenance' and 'needs_upgrade' or None when the state can
+            not be determined from the files.
+        """
+        code_version = self.code_version()
+
+        if code_version is None:
+            return None
+
+        # a fresh code base comes without config.php
+        if not os.path.exists(os.path.join(self.config_directory, "config.php")):
+            config = dict()
+        else:
+            config = self.system_config()
+
+        if config is None:
+            return None
+
+        installed = config.get("installed", False) is True
+        version = config.get("version")
+
+        return dict(
+            installed=installed,
+            version=version,
+            code_version=code_version.get("version"),
+            version_string=code_version.get("version_string"),
+            edition=code_version.get("edition"),
+            maintenance=config.get("maintenance", False) is True,
+            needs_upgrade=(installed and str(version) != code_version.get("version"))
+        )
+
+    def __read(self, file_name):
+        """
+        """
+        if not os.path.isfile(file_name):
+            return None
+
+        try:
+            with open(file_name, encoding="utf-8") as f:
+                return PhpLiteralParser(f.read()).assignments()
+        except (OSError, UnicodeDecodeError, PhpParseError):
+            return None
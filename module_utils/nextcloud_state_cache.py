@@ -0,0 +1,246 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache-2.0 (see LICENSE or https://opensource.org/license/apache-2-0)
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import absolute_import, print_function
+import os
+import json
+import glob
+import time
+import hashlib
+
+__metaclass__ = type
+
+
+class StateCache(object):
+    """
+        on-disk cache for the results of read-only occ commands
+
+        all entries are bound to a fingerprint of config/*.php, version.php
+        and the apps directories. as soon as one of them changes, the
+        complete cache is discarded.
+
+        users, groups and the app states live in the database and can be
+        changed without touching any of these files. results of these
+        commands are therefore only used while they are younger than 'ttl'
+        seconds.
+
+        the app versions, which occ reported as up to date, are kept in a
+        separate file and survive the invalidation. app upgrades are only
+        visible in the database, a new app version has to be confirmed by
+        'occ status' once.
+    """
+    module = None
+
+    cache_directory = "/var/cache/ansible/nextcloud"
+
+    fingerprinted_commands = [
+        "check",
+        "status",
+    ]
+
+    database_commands = [
+        "app:list",
+        "user:list",
+        "group:list",
+    ]
+
+    def __init__(self, module, working_dir, cache_directory=None, ttl=0):
+        """
+        """
+        self.module = module
+        self.working_dir = os.path.realpath(working_dir)
+
+        if cache_directory:
+            self.cache_directory = cache_directory
+        self.ttl = ttl
+
+        instance = hashlib.sha1(self.working_dir.encode("utf-8")).hexdigest()[:12]
+        self.cache_file = os.path.join(self.cache_directory, f"state.{instance}.json")
+        self.apps_file = os.path.join(self.cache_directory, f"apps.{instance}.json")
+
+        self._fingerprint = None
+        self._data = None
+
+    def cacheable(self, args):
+        """
+        """
+        if len(args) == 0:
+            return False
+
+        if args[0] in self.fingerprinted_commands:
+            return True
+
+        return args[0] in self.database_commands and self.ttl > 0
+
+    def get(self, args):
+        """
+            returns (rc, out, err) or None
+        """
+        if not self.cacheable(args):
+            return None
+
+        entry = self.__load().get(self.__key(args))
+
+        if not entry:
+            return None
+
+        if args[0] in self.database_commands and (time.time() - entry.get("time", 0)) > self.ttl:
+            return None
+
+        return (entry.get("rc"), entry.get("out"), entry.get("err"))
+
+    def set(self, args, result):
+        """
+        """
+        if not self.cacheable(args):
+            return
+
+        rc, out, err = result
+
+        # only successful results are worth to be reused
+        if rc != 0:
+            return
+
+        data = self.__load()
+        data[self.__key(args)] = dict(
+            rc=rc,
+            out=out,
+            err=err,
+            time=int(time.time())
+        )
+
+        self.__save(data)
+
+    def invalidate(self):
+        """
+            drop all entries, e.g. after a mutating occ command
+        """
+        self._fingerprint = None
+        self._data = dict()
+
+        if os.path.exists(self.cache_file):
+            try:
+                os.remove(self.cache_file)
+            except OSError as e:
+                self.module.log(msg=f"state cache: {e}")
+
+    def confirmed_app_versions(self):
+        """
+            returns {app: version} of the last confirmation or None
+        """
+        if not os.path.isfile(self.apps_file):
+            return None
+
+        try:
+            with open(self.apps_file) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.module.log(msg=f"state cache: {e}")
+
+        return None
+
+    def confirm_app_versions(self, versions):
+        """
+            occ reported no pending upgrade for these app versions
+        """
+        if versions == self.confirmed_app_versions():
+            return
+
+        self.__write(self.apps_file, versions)
+
+    def fingerprint(self):
+        """
+            mtime, size and checksum of the files which describe the state
+            of the installation
+        """
+        if self._fingerprint:
+            return self._fingerprint
+
+        files = sorted(glob.glob(os.path.join(self.working_dir, "config", "*.php")))
+        files.append(os.path.join(self.working_dir, "version.php"))
+
+        directories = sorted(glob.glob(os.path.join(self.working_dir, "apps*")))
+
+        result = dict()
+
+        for file_name in files:
+            try:
+                _state = os.stat(file_name)
+                with open(file_name, "rb") as f:
+                    checksum = hashlib.sha256(f.read()).hexdigest()
+
+                result[file_name] = [_state.st_mtime_ns, _state.st_size, checksum]
+            except OSError:
+                result[file_name] = None
+
+        for directory in directories:
+            try:
+                result[directory] = [os.stat(directory).st_mtime_ns, sorted(os.listdir(directory))]
+            except OSError:
+                result[directory] = None
+
+            # an app can be replaced in place
+            for info_file in glob.glob(os.path.join(directory, "*", "appinfo", "info.xml")):
+                try:
+                    result[info_file] = os.stat(info_file).st_mtime_ns
+                except OSError:
+                    result[info_file] = None
+
+        self._fingerprint = hashlib.sha256(json.dumps(result, sort_keys=True).encode("utf-8")).hexdigest()
+
+        return self._fingerprint
+
+    def __key(self, args):
+        """
+        """
+        return " ".join(args)
+
+    def __load(self):
+        """
+        """
+        if self._data is not None:
+            return self._data
+
+        self._data = dict()
+
+        if os.path.isfile(self.cache_file):
+            try:
+                with open(self.cache_file) as f:
+                    cache = json.load(f)
+
+                if cache.get("fingerprint") == self.fingerprint():
+                    self._data = cache.get("entries", {})
+            except (OSError, ValueError) as e:
+                self.module.log(msg=f"state cache: {e}")
+
+        return self._data
+
+    def __save(self, data):
+        """
+        """
+        cache = dict(
+            fingerprint=self.fingerprint(),
+            entries=data
+        )
+
+        self.__write(self.cache_file, cache)
+
+    def __write(self, file_name, data):
+        """
+        """
+        try:
+            if not os.path.isdir(self.cache_directory):
+                os.makedirs(self.cache_directory, mode=0o750)
+
+            tmp_file = f"{file_name}.{os.getpid()}"
+
+            with open(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                json.dump(data, f)
+
+            os.replace(tmp_file, file_name)
+        except OSError as e:
+            self.module.log(msg=f"state cache: {e}")